@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import asyncio
+import threading
+
+# Checkpoint file for batch generation
+#
+# Batch runs record their progress per question unit, (category, subtopic,
+# index), so a crash or Ctrl-C doesn't mean paying for every LLM call again.
+# The file holds:
+#
+#   completed - units whose question passed LLM3 and was handed to the question
+#               writer (and therefore the outbox), with the question data
+#   partial   - in-flight units: the parsed LLM1 output once it passed, plus
+#               the Vega spec once LLM2 produced a valid one
+#
+# `llm_query.py --batch --resume` skips completed units and restarts partial
+# ones from the last finished stage. The file is rewritten atomically after
+# every update (tmp file + fsync + rename), it is small enough for that. The
+# async engines use the a*() variants, which do that write on a worker thread
+# instead of blocking the event loop.
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.checkpoints', 'batch_generation.json')
+CHECKPOINT_PATH = os.getenv('BATCH_CHECKPOINT_PATH', DEFAULT_CHECKPOINT_PATH)
+
+
+def unit_key(category, subtopic, index):
+    return f"{category}|{subtopic}|{index}"
+
+
+class BatchCheckpoint:
+    def __init__(self, path=CHECKPOINT_PATH, resume=False, settings=None):
+        """
+        Open a checkpoint. With resume=False any previous progress is discarded;
+        with resume=True it is loaded, and a mismatch in settings (models etc.) is
+        reported but not fatal.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {'settings': settings or {}, 'completed': {}, 'partial': {}, 'updated': None}
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            previous = loaded.get('settings') or {}
+            if settings and previous and previous != settings:
+                print(f"⚠️ Resuming a checkpoint created with different settings: {previous}")
+            self.state['completed'] = loaded.get('completed', {})
+            self.state['partial'] = loaded.get('partial', {})
+        self._save()
+
+    def _save(self):
+        self.state['updated'] = time.time()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def is_complete(self, key):
+        return key in self.state['completed']
+
+    def completed_question(self, key):
+        return self.state['completed'].get(key)
+
+    def partial(self, key):
+        """Saved in-flight state for a unit ({'parsed': ..., 'spec': ...}) or None"""
+        return self.state['partial'].get(key)
+
+    def save_partial(self, key, parsed, spec=None):
+        with self._lock:
+            self.state['partial'][key] = {'parsed': parsed, 'spec': spec}
+            self._save()
+
+    def clear_partial(self, key):
+        with self._lock:
+            if self.state['partial'].pop(key, None) is not None:
+                self._save()
+
+    def complete(self, key, question_data):
+        with self._lock:
+            self.state['partial'].pop(key, None)
+            self.state['completed'][key] = dict(question_data)
+            self._save()
+
+    async def asave_partial(self, key, parsed, spec=None):
+        await asyncio.to_thread(self.save_partial, key, parsed, spec)
+
+    async def aclear_partial(self, key):
+        await asyncio.to_thread(self.clear_partial, key)
+
+    async def acomplete(self, key, question_data):
+        await asyncio.to_thread(self.complete, key, question_data)
+
+    @property
+    def completed_count(self):
+        return len(self.state['completed'])
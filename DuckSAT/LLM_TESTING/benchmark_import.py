@@ -0,0 +1,68 @@
+"""
+Import-time benchmark for llm_query (and anything else importable from LLM_TESTING).
+
+Imports the module in fresh interpreters with `python -X importtime`, prints
+the median wall time and the slowest imports, and fails if a dependency that
+is only needed to render diagrams, open a browser or talk to an LLM/database
+(selenium, webdriver_manager, webbrowser, openai, httpx, requests, psycopg2)
+was imported eagerly. The Flask service and the tests import llm_query
+without ever rendering, so they shouldn't pay for any of those.
+
+Usage: python benchmark_import.py [--module llm_query] [--repeat 5] [--top 10]
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ('selenium', 'webdriver_manager', 'webbrowser', 'openai', 'httpx', 'requests', 'psycopg2')
+
+parser = argparse.ArgumentParser(description='Benchmark the import time of an LLM_TESTING module')
+parser.add_argument('--module', default='llm_query', help='Module to import (default: llm_query)')
+parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters to time (default: 5)')
+parser.add_argument('--top', type=int, default=10, help='Slowest imports to list (default: 10)')
+bench_args = parser.parse_args()
+
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    f"import {bench_args.module}\n"
+    "print(time.perf_counter() - started)\n"
+    "print(','.join(sorted(sys.modules)))\n"
+)
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    seconds, modules = result.stdout.strip().splitlines()[-2:]
+    imports = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.rstrip()))
+    return float(seconds), set(modules.split(',')), imports
+
+
+timings = []
+for _ in range(bench_args.repeat):
+    seconds, modules, imports = run_once()
+    timings.append(seconds)
+
+print(f"import {bench_args.module}: median {statistics.median(timings) * 1000:.1f} ms "
+      f"(min {min(timings) * 1000:.1f} ms, {bench_args.repeat} runs)")
+print(f"\nSlowest imports (cumulative, last run):")
+for cumulative, name in sorted(imports, reverse=True)[:bench_args.top]:
+    print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+eager = [name for name in HEAVY_MODULES if name in modules]
+if eager:
+    print(f"\n❌ Imported eagerly: {', '.join(eager)}")
+    sys.exit(1)
+print(f"\n✅ None of {', '.join(HEAVY_MODULES)} imported")
@@ -0,0 +1,204 @@
+"""
+Microbenchmark: single-pass parse_llm1 vs the original per-field regex version.
+
+Builds LLM1 responses of ~16k tokens for each category, checks both parsers
+return identical dicts (same random seed for the option shuffle) and prints
+the per-call time of each.
+
+Usage: python benchmark_parse_llm1.py [--tokens 16000] [--repeat 50]
+"""
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+parser = argparse.ArgumentParser(description='Benchmark parse_llm1')
+parser.add_argument('--tokens', type=int, default=16000, help='Approximate response size in tokens (default: 16000)')
+parser.add_argument('--repeat', type=int, default=50, help='Calls per parser per category (default: 50)')
+bench_args = parser.parse_args()
+
+from llm_query import parse_llm1
+
+def legacy_parse_llm1(response, subtopic_category):
+    """parse_llm1 as it was before the single-pass tokenizer (12+ re.search calls per response)"""
+    # Extract correct answer index
+    correct_answer_match = re.search(r'Correct Answer Index:\s*(\d+)', response, re.IGNORECASE)
+    correct_answer = int(correct_answer_match.group(1)) if correct_answer_match else 0
+
+    # Extract options as JSON array
+    options_match = re.search(r'Options:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
+    options = []
+    if options_match:
+        try:
+            options = json.loads(options_match.group(1))
+        except json.JSONDecodeError:
+            # Fallback: parse as text
+            options_text = options_match.group(1)
+            options = [opt.strip() for opt in options_text.strip('[]').split(',') if opt.strip()]
+
+    # Ensure exactly 4 options
+    while len(options) < 4:
+        options.append("")
+    options = options[:4]
+
+    # Shuffle options to randomize correct answer index
+    if len(options) == 4 and 0 <= correct_answer < 4:
+        correct_option = options[correct_answer]
+        random.shuffle(options)
+        correct_answer = options.index(correct_option)
+
+    # Extract additional fields
+    difficulty_match = re.search(r'Difficulty:\s*(easy|medium|hard)', response, re.IGNORECASE)
+    difficulty = difficulty_match.group(1).lower() if difficulty_match else "medium"
+
+    category_match = re.search(r'Category:\s*(.*?)\s*(?=Subtopic:|Difficulty:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+    category = category_match.group(1).strip() if category_match else subtopic_category.lower().replace(" ", "-")
+
+    subtopic_match = re.search(r'Subtopic:\s*(.*?)\s*(?=Difficulty:|Category:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+    subtopic = subtopic_match.group(1).strip() if subtopic_match else ""
+
+    time_estimate_match = re.search(r'Time Estimate:\s*(\d+)', response, re.IGNORECASE)
+    time_estimate = int(time_estimate_match.group(1)) if time_estimate_match else 60
+
+    source_match = re.search(r'Source:\s*(.*?)\s*(?=Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+    source = source_match.group(1).strip() if source_match else "AI Generated"
+
+    tags_match = re.search(r'Tags:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
+    tags = []
+    if tags_match:
+        try:
+            tags = json.loads(tags_match.group(1))
+        except json.JSONDecodeError:
+            tags_text = tags_match.group(1)
+            tags = [tag.strip() for tag in tags_text.strip('[]').split(',') if tag.strip()]
+
+    wrong_answer_explanations_match = re.search(r'Wrong Answer Explanations:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
+    wrong_answer_explanations = []
+    if wrong_answer_explanations_match:
+        try:
+            wrong_answer_explanations = json.loads(wrong_answer_explanations_match.group(1))
+        except json.JSONDecodeError:
+            pass  # Leave as empty list
+
+    if subtopic_category == "Reading":
+        passage_match = re.search(r'Passage:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
+        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
+        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+        passage = passage_match.group(1).strip() if passage_match else ""
+        question = question_match.group(1).strip() if question_match else ""
+        explanation = exp_match.group(1).strip() if exp_match else ""
+        return {
+            "content": passage,
+            "question": question,
+            "explanation": explanation,
+            "options": options,
+            "correct_answer": correct_answer,
+            "difficulty": difficulty,
+            "category": category,
+            "subtopic": subtopic,
+            "time_estimate": time_estimate,
+            "source": source,
+            "tags": tags,
+            "wrong_answer_explanations": wrong_answer_explanations
+        }
+    elif subtopic_category == "Writing":
+        text_match = re.search(r'Text to Edit:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
+        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
+        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+        text_to_edit = text_match.group(1).strip() if text_match else ""
+        question = question_match.group(1).strip() if question_match else ""
+        explanation = exp_match.group(1).strip() if exp_match else ""
+        return {
+            "content": text_to_edit,
+            "question": question,
+            "explanation": explanation,
+            "options": options,
+            "correct_answer": correct_answer,
+            "difficulty": difficulty,
+            "category": category,
+            "subtopic": subtopic,
+            "time_estimate": time_estimate,
+            "source": source,
+            "tags": tags,
+            "wrong_answer_explanations": wrong_answer_explanations
+        }
+    else:  # Math
+        desc_match = re.search(r'Diagram Description:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
+        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
+        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
+        diagram_desc = desc_match.group(1).strip() if desc_match else ""
+        question = question_match.group(1).strip() if question_match else ""
+        explanation = exp_match.group(1).strip() if exp_match else ""
+        return {
+            "content": diagram_desc,
+            "question": question,
+            "explanation": explanation,
+            "options": options,
+            "correct_answer": correct_answer,
+            "difficulty": difficulty,
+            "category": category,
+            "subtopic": subtopic,
+            "time_estimate": time_estimate,
+            "source": source,
+            "tags": tags,
+            "wrong_answer_explanations": wrong_answer_explanations
+        }
+
+
+CONTENT_LABELS = {'Reading': 'Passage', 'Writing': 'Text to Edit', 'Math': 'Diagram Description'}
+WORDS = ['the', 'student', 'measured', 'angle', 'triangle', 'data', 'shows', 'author', 'argues', 'that', 'because', 'however', 'question', 'source', 'value']
+
+
+def build_response(category, tokens):
+    """An LLM1-shaped response whose long sections add up to roughly `tokens` tokens (~4 chars each)"""
+    rng = random.Random(42)
+    target_chars = tokens * 4
+    body = ' '.join(rng.choice(WORDS) for _ in range(target_chars // 12))
+    explanation = ' '.join(rng.choice(WORDS) for _ in range(target_chars // 12))
+    return (
+        f"{CONTENT_LABELS[category]}: {body}\n"
+        "Question: Which choice best describes the main idea?\n"
+        f"Explanation: {explanation}\n"
+        "Difficulty: hard\n"
+        f"Category: {category.lower()}\n"
+        "Subtopic: main-idea\n"
+        "Time Estimate: 90\n"
+        "Source: AI Generated\n"
+        'Tags: ["sat", "practice"]\n'
+        'Wrong Answer Explanations: ["too broad", "not supported", "contradicts the passage"]\n'
+        "Correct Answer Index: 2\n"
+        'Options: ["Option A", "Option B", "Option C", "Option D"]\n'
+    )
+
+
+def time_parser(fn, response, category, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(response, category)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    print(f"Benchmarking parse_llm1 on ~{bench_args.tokens}-token responses ({bench_args.repeat} calls each)")
+    for category in ('Reading', 'Writing', 'Math'):
+        response = build_response(category, bench_args.tokens)
+
+        random.seed(0)
+        expected = legacy_parse_llm1(response, category)
+        random.seed(0)
+        actual = parse_llm1(response, category)
+        if actual != expected:
+            print(f"❌ {category}: outputs differ")
+            print(f"  legacy: {json.dumps(expected)[:300]}")
+            print(f"  new:    {json.dumps(actual)[:300]}")
+            sys.exit(1)
+
+        legacy_ms = time_parser(legacy_parse_llm1, response, category, bench_args.repeat)
+        new_ms = time_parser(parse_llm1, response, category, bench_args.repeat)
+        print(f"✅ {category:8s} {len(response):>7d} chars  legacy {legacy_ms:8.3f} ms  single-pass {new_ms:8.3f} ms  speedup {legacy_ms / new_ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
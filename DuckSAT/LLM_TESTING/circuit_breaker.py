@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+import threading
+
+from llm_retry import is_transient_error
+from rate_limiter import is_rate_limited
+from metrics import CIRCUIT_OPENS
+
+# Per-endpoint circuit breakers for query_llm
+#
+# When a provider degrades, every call to it used to sit out its full timeout
+# (and its retries). Each model deployment (endpoint + deployment name) now
+# has a breaker:
+#
+#   closed      calls go through; failures and slow calls are counted
+#   open        after CIRCUIT_FAILURE_THRESHOLD failures or slow calls in a
+#               row: calls are refused at once, so query_llm moves on to the
+#               role's fallback model (see "_roles" in llms_config.json)
+#   half-open   CIRCUIT_OPEN_SECONDS later one probe call is let through; it
+#               closes the breaker if it succeeds and reopens it otherwise
+#
+# Only signs of an unhealthy endpoint count as failures: timeouts, dropped
+# connections and 5xx. A 429 is the rate limiter's business, and other 4xx
+# replies mean the endpoint is up; neither moves the failure count. A call
+# slower than the model's "slow_call_seconds" (llms_config.json, default 80%
+# of its timeout) counts as a failure even though its reply is used, so an
+# endpoint whose calls creep up on the timeout opens before they time out.
+
+FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+OPEN_SECONDS = float(os.getenv('CIRCUIT_OPEN_SECONDS', '60'))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+logger = logging.getLogger(__name__)
+
+
+def is_endpoint_failure(exc):
+    """Errors that say the endpoint itself is unhealthy (not rate limited, not a bad request)"""
+    return is_transient_error(exc) and not is_rate_limited(exc)
+
+
+class CircuitBreaker:
+    def __init__(self, name, slow_call_seconds=None, failure_threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now; in half-open state only one probe at a time gets through"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at < self.open_seconds:
+                return False
+            # A probe whose outcome was never recorded (e.g. a cancelled task) doesn't block forever
+            if self.state == HALF_OPEN and now - self.probe_started < self.open_seconds:
+                return False
+            self.state = HALF_OPEN
+            self.probe_started = now
+            return True
+
+    def record(self, error, seconds):
+        """Record the outcome of an allowed call: the exception it raised (or None) and how long it took"""
+        with self._lock:
+            if error is not None and not is_endpoint_failure(error):
+                # The endpoint answered (429 or another 4xx): not a failure, but no sign of recovery
+                # either, so the count stands; a half-open probe that got an answer still closes it
+                if self.state == HALF_OPEN:
+                    logger.info(f"Circuit for {self.name} closed again")
+                    self.state = CLOSED
+                    self.failures = 0
+                return
+            failed = error is not None or (self.slow_call_seconds and seconds >= self.slow_call_seconds)
+            if not failed:
+                if self.state != CLOSED:
+                    logger.info(f"Circuit for {self.name} closed again")
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    reason = f"{error}" if error is not None else f"slow call ({seconds:.1f}s)"
+                    logger.warning(f"Circuit for {self.name} open for {self.open_seconds:.0f}s after {self.failures} failures, last: {reason}")
+                    CIRCUIT_OPENS.inc(model=self.name)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model_name, endpoint, deployment, slow_call_seconds=None):
+    """Return the shared breaker for a deployment on an endpoint (named after the model in logs)"""
+    key = (endpoint, deployment)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(model_name, slow_call_seconds)
+            _breakers[key] = breaker
+        # Follow llms_config.json edits picked up by the model registry
+        breaker.slow_call_seconds = slow_call_seconds
+        return breaker
@@ -4,9 +4,17 @@ import re
 import json
 import base64
 import uuid
+import atexit
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from metrics import DB_INSERT_SECONDS
+from tracing import traced, current_span
 
 # DuckSAT integration functions for LLM TESTING
 
+GENERATED_IMAGES_DIR = '../ducksat-app/public/generated-images'
+
 def parse_answers_to_options(answers_text):
     """Parse answers text into options array and determine correct answer index"""
     # Look for patterns like "A) option1 B) option2 C) option3 D) option4"
@@ -38,12 +46,24 @@ def parse_answers_to_options(answers_text):
 
     return options[:4], correct_answer
 
+def normalize_subtopic(subtopic):
+    """Subtopic name as stored in the subtopics table"""
+    return subtopic.lower().replace(' ', '-').replace('(', '').replace(')', '').replace(',', '').replace('–', '-').replace('&', 'and')
+
+def category_topic(category):
+    """(moduleType, topic name) that questions of an LLM TESTING category are filed under"""
+    if category == 'Math':
+        return 'math', 'Geometry and Trigonometry'  # Use the actual topic name from seed
+    if category == 'Reading':
+        return 'reading-writing', 'Reading Comprehension'  # Use the actual topic name from seed
+    return 'reading-writing', 'Writing and Language'  # Use the actual topic name from seed
+
 def determine_difficulty_and_subtopic(question_text, diagram_desc, category, subtopic):
     """Determine difficulty and subtopic based on question content"""
     text = (question_text + " " + diagram_desc).lower()
 
     # For SAT, use the provided subtopic, normalized
-    subtopic_normalized = subtopic.lower().replace(' ', '-').replace('(', '').replace(')', '').replace(',', '').replace('–', '-').replace('&', 'and')
+    subtopic_normalized = normalize_subtopic(subtopic)
 
     # Determine difficulty based on complexity
     word_count = len(question_text.split())
@@ -60,7 +80,8 @@ def generate_image_from_vega_spec(spec, diagram_desc):
     """Generate image from Vega spec and save to DuckSAT public directory"""
     try:
         # Try to use DuckSAT's image generation service
-        sys.path.append('../ducksat-app')
+        if '../ducksat-app' not in sys.path:
+            sys.path.append('../ducksat-app')
         try:
             from services.imageGenerationService import imageGenerationService
             chart_config = {
@@ -75,200 +96,399 @@ def generate_image_from_vega_spec(spec, diagram_desc):
         except ImportError:
             pass
 
-        # Fallback: render using selenium and save to file
-        from selenium import webdriver
-        from selenium.webdriver.chrome.service import Service
-        from webdriver_manager.chrome import ChromeDriverManager
-
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-<script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
-</head>
-<body>
-<div id="vis" style="width: 600px; height: 400px;"></div>
-<script>
-const spec = {json.dumps(spec)};
-const view = new vega.View(vega.parse(spec)).renderer('canvas').initialize('#vis').runAsync();
-</script>
-</body>
-</html>"""
-
-        temp_file = 'temp_diagram.html'
-        with open(temp_file, 'w') as f:
-            f.write(html_content)
-
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--window-size=600,400')
-
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-        driver.get(f'file://{os.path.abspath(temp_file)}')
-        import time
-        time.sleep(3)  # Wait for rendering
-
-        canvas = driver.find_element('id', 'vis').find_element('tag name', 'canvas')
-        screenshot = canvas.screenshot_as_png
-        driver.quit()
-        os.remove(temp_file)
-
-        if screenshot:
-            # Save to DuckSAT public directory
-            os.makedirs('../ducksat-app/public/generated-images', exist_ok=True)
-            filename = f"chart-{uuid.uuid4()}.png"
-            filepath = f"../ducksat-app/public/generated-images/{filename}"
-
-            with open(filepath, 'wb') as f:
-                f.write(screenshot)
-
-            return f"/generated-images/{filename}"
+        # Fallback: render on the shared headless browser pool. Images are stored
+        # by spec hash, so re-rendering the same spec reuses the existing PNG.
+        from vega_renderer import render_vega_to_file
+        filename = render_vega_to_file(spec, GENERATED_IMAGES_DIR)
+        return f"/generated-images/{filename}"
 
     except Exception as e:
         print(f"Image generation failed: {e}")
 
     return None
 
-def store_question_in_ducksat(question_data):
-    """Store question in DuckSAT database using direct SQL"""
-    import psycopg2
-    from dotenv import load_dotenv
-    import json
+# Database access
+#
+# Connections come from a process-wide psycopg2 pool (autocommit), so a store is
+# not paying a TCP + TLS handshake to Neon every time. Topic and subtopic IDs are
+# cached in-process and only re-read when a lookup misses. With warm caches a
+# question is stored in one round-trip: the INSERT and the subtopic counter
+# UPDATE run as a single CTE statement.
 
+DB_POOL_MIN = int(os.getenv('DUCKSAT_DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DUCKSAT_DB_POOL_MAX', '8'))
+
+_db_pool = None
+_db_lock = threading.Lock()
+_topic_ids = {}       # topic name -> id
+_subtopic_ids = {}    # (topic id, subtopic name) -> id
+_id_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _load_env():
+    from dotenv import load_dotenv
     # Load environment variables from the current directory
     env_path = os.path.join(os.path.dirname(__file__), '.env')
     load_dotenv(dotenv_path=env_path)
-    
+
+
+def get_database_url():
+    _load_env()
     database_url = os.getenv('DATABASE_URL')
     if not database_url:
         print("❌ DATABASE_URL not found in .env file, skipping database storage")
         return None
-    
+
     if database_url == "your_neon_database_url_here":
         print("❌ Please update DATABASE_URL in .env file with your actual Neon database URL")
         return None
+    return database_url
 
-    conn = None
-    try:
-        conn = psycopg2.connect(database_url)
-        cur = conn.cursor()
-
-        category = question_data.get('category', 'Math')
-        subtopic_raw = question_data.get('subtopic', 'General')
-
-        # Map category to moduleType and topic
-        if category == 'Math':
-            moduleType = 'math'
-            topic_name = 'Geometry and Trigonometry'  # Use the actual topic name from seed
-            topic_desc = 'SAT Math topics'
-        elif category == 'Reading':
-            moduleType = 'reading-writing'
-            topic_name = 'Reading Comprehension'  # Use the actual topic name from seed
-            topic_desc = 'SAT Reading and Writing topics'
-        else:  # Writing
-            moduleType = 'reading-writing'
-            topic_name = 'Writing and Language'  # Use the actual topic name from seed
-            topic_desc = 'SAT Reading and Writing topics'
-
-        # Parse answers
-        options, correct_answer = parse_answers_to_options(question_data['answers'])
-
-        # Determine metadata
-        difficulty, subtopic = determine_difficulty_and_subtopic(
-            question_data['question'],
-            question_data.get('diagram_desc', ''),
-            category,
-            subtopic_raw
-        )
 
-        # Generate image only for Math or Reading data interp with spec
-        image_url = None
-        if question_data.get('spec') and (category == 'Math' or (category == 'Reading' and 'data interpretation' in subtopic_raw.lower())):
-            image_url = generate_image_from_vega_spec(
-                question_data['spec'],
-                question_data.get('diagram_desc', '')
-            )
-
-        # Find topic
-        cur.execute("SELECT id FROM topics WHERE name = %s", (topic_name,))
-        topic_row = cur.fetchone()
-        if not topic_row:
-            print(f"Topic '{topic_name}' not found in database")
+def get_db_pool():
+    """Process-wide connection pool, created on first use (None if the database isn't configured)"""
+    global _db_pool
+    if _db_pool is None:
+        database_url = get_database_url()
+        if not database_url:
             return None
-        topic_id = topic_row[0]
+        with _db_lock:
+            if _db_pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                _db_pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, database_url)
+                atexit.register(close_db_pool)
+    return _db_pool
+
+
+def close_db_pool():
+    global _db_pool
+    with _db_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+
+@contextmanager
+def db_connection():
+    """Borrow an autocommit connection from the pool; broken connections are discarded"""
+    pool = get_db_pool()
+    if pool is None:
+        yield None
+        return
+    conn = pool.getconn()
+    try:
+        if conn.autocommit is False:
+            conn.autocommit = True
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
 
-        # Find or create subtopic
-        cur.execute("SELECT id FROM subtopics WHERE name = %s AND \"topicId\" = %s", (subtopic, topic_id))
-        subtopic_row = cur.fetchone()
-        if not subtopic_row:
-            subtopic_id = str(uuid.uuid4())
-            cur.execute("""
-                INSERT INTO subtopics (id, "topicId", name, description, "targetQuestions", "currentCount", "isActive", "createdAt", "updatedAt")
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
-            """, (subtopic_id, topic_id, subtopic, f'{subtopic_raw} questions', 100, 0, True))
-        else:
-            subtopic_id = subtopic_row[0]
-
-        # Prepare explanation with content if needed
-        explanation = question_data['explanation']
-        content = question_data.get('content', '')
-        if content:
-            if category == 'Reading':
-                explanation = f"Passage: {content}\n\n{explanation}"
-            elif category == 'Writing':
-                explanation = f"Text to Edit: {content}\n\n{explanation}"
-
-        # Prepare chartData
-        chartData = None
-        if question_data.get('spec'):
-            chartData = {
-                'description': question_data.get('diagram_desc', ''),
-                'interactionType': 'point-placement' if category == 'Math' else 'none',
-                'graphType': 'coordinate-plane' if category == 'Math' else 'chart',
-                'vegaSpec': question_data['spec']
-            }
 
-        # Time estimate based on category
-        time_estimate = 120 if category == 'Math' else 90 if category == 'Reading' else 60
-
-        # Create question
-        question_id = str(uuid.uuid4())
-        cur.execute("""
-            INSERT INTO questions (
-                id, "subtopicId", "moduleType", difficulty, category, subtopic,
-                question, options, "correctAnswer", explanation,
-                "imageUrl", "chartData", "timeEstimate", source, tags, "isActive", "createdAt", "updatedAt"
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
-        """, (
-            question_id, subtopic_id, moduleType, difficulty, topic_name, subtopic,
+def _with_connection(fn):
+    """Run fn(conn), retrying once on a fresh connection if the pooled one went stale"""
+    import psycopg2
+    for attempt in range(2):
+        with db_connection() as conn:
+            if conn is None:
+                return None
+            try:
+                return fn(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt or not conn.closed:
+                    raise
+                print("⚠️ Database connection was closed, retrying on a new one")
+
+
+def clear_id_cache():
+    with _id_cache_lock:
+        _topic_ids.clear()
+        _subtopic_ids.clear()
+
+
+def get_topic_id(cur, topic_name):
+    topic_id = _topic_ids.get(topic_name)
+    if topic_id is None:
+        cur.execute("SELECT name, id FROM topics")
+        rows = cur.fetchall()
+        with _id_cache_lock:
+            _topic_ids.clear()
+            _topic_ids.update(rows)
+        topic_id = _topic_ids.get(topic_name)
+    return topic_id
+
+
+def get_subtopic_id(cur, topic_id, subtopic, description):
+    """Cached subtopic ID; refreshes the cache on a miss and creates the subtopic if it doesn't exist"""
+    subtopic_id = _subtopic_ids.get((topic_id, subtopic))
+    if subtopic_id is not None:
+        return subtopic_id
+
+    cur.execute('SELECT "topicId", name, id FROM subtopics')
+    rows = cur.fetchall()
+    with _id_cache_lock:
+        _subtopic_ids.clear()
+        _subtopic_ids.update(((t, n), i) for t, n, i in rows)
+    subtopic_id = _subtopic_ids.get((topic_id, subtopic))
+    if subtopic_id is not None:
+        return subtopic_id
+
+    # ON CONFLICT covers another worker creating the same subtopic concurrently
+    cur.execute("""
+        INSERT INTO subtopics (id, "topicId", name, description, "targetQuestions", "currentCount", "isActive", "createdAt", "updatedAt")
+        VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+        ON CONFLICT ("topicId", name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id
+    """, (str(uuid.uuid4()), topic_id, subtopic, description, 100, 0, True))
+    subtopic_id = cur.fetchone()[0]
+    with _id_cache_lock:
+        _subtopic_ids[(topic_id, subtopic)] = subtopic_id
+    return subtopic_id
+
+
+def build_question_record(question_data):
+    """Map an LLM TESTING question dict onto the questions table (everything but the IDs)"""
+    category = question_data.get('category', 'Math')
+    subtopic_raw = question_data.get('subtopic', 'General')
+
+    # Map category to moduleType and topic
+    moduleType, topic_name = category_topic(category)
+
+    # Parse answers
+    options, correct_answer = parse_answers_to_options(question_data['answers'])
+
+    # Determine metadata
+    difficulty, subtopic = determine_difficulty_and_subtopic(
+        question_data['question'],
+        question_data.get('diagram_desc', ''),
+        category,
+        subtopic_raw
+    )
+
+    # Generate image only for Math or Reading data interp with spec
+    image_url = None
+    if question_data.get('spec') and (category == 'Math' or (category == 'Reading' and 'data interpretation' in subtopic_raw.lower())):
+        image_url = generate_image_from_vega_spec(
+            question_data['spec'],
+            question_data.get('diagram_desc', '')
+        )
+
+    # Prepare explanation with content if needed
+    explanation = question_data['explanation']
+    content = question_data.get('content', '')
+    if content:
+        if category == 'Reading':
+            explanation = f"Passage: {content}\n\n{explanation}"
+        elif category == 'Writing':
+            explanation = f"Text to Edit: {content}\n\n{explanation}"
+
+    # Prepare chartData
+    chartData = None
+    if question_data.get('spec'):
+        chartData = {
+            'description': question_data.get('diagram_desc', ''),
+            'interactionType': 'point-placement' if category == 'Math' else 'none',
+            'graphType': 'coordinate-plane' if category == 'Math' else 'chart',
+            'vegaSpec': question_data['spec']
+        }
+
+    # Time estimate based on category
+    time_estimate = 120 if category == 'Math' else 90 if category == 'Reading' else 60
+
+    return {
+        'id': question_data.get('id'),
+        'topic_name': topic_name,
+        'subtopic': subtopic,
+        'subtopic_description': f'{subtopic_raw} questions',
+        'values': (
+            moduleType, difficulty, topic_name, subtopic,
             question_data['question'], json.dumps(options), correct_answer, explanation,
             image_url, json.dumps(chartData) if chartData else None, time_estimate,
             'LLM TESTING Generated', [difficulty, category.lower(), subtopic], True
-        ))
+        ),
+    }
+
+
+QUESTION_COLUMNS = """
+    id, "subtopicId", "moduleType", difficulty, category, subtopic,
+    question, options, "correctAnswer", explanation,
+    "imageUrl", "chartData", "timeEstimate", source, tags, "isActive", "createdAt", "updatedAt"
+"""
+
+INSERT_QUESTION_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO questions ({QUESTION_COLUMNS})
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())
+        ON CONFLICT (id) DO NOTHING
+        RETURNING "subtopicId"
+    )
+    UPDATE subtopics
+    SET "currentCount" = "currentCount" + 1
+    WHERE id = (SELECT "subtopicId" FROM inserted)
+"""
+
+
+@traced('store')
+def store_question_in_ducksat(question_data):
+    """Store question in DuckSAT database using direct SQL"""
+    import psycopg2
 
-        # Update subtopic count
-        cur.execute("""
-            UPDATE subtopics
-            SET "currentCount" = "currentCount" + 1
-            WHERE id = %s
-        """, (subtopic_id,))
+    if get_database_url() is None:
+        return None
 
-        conn.commit()
-        print(f"✅ Question stored in DuckSAT database with ID: {question_id}")
+    try:
+        record = build_question_record(question_data)
+
+        def insert(conn):
+            with conn.cursor() as cur:
+                # Find topic
+                topic_id = get_topic_id(cur, record['topic_name'])
+                if topic_id is None:
+                    print(f"Topic '{record['topic_name']}' not found in database")
+                    return None
+
+                # Find or create subtopic
+                subtopic_id = get_subtopic_id(cur, topic_id, record['subtopic'], record['subtopic_description'])
+
+                # Create question and bump the subtopic count in one statement. A
+                # question that carries an id (e.g. from the outbox) is inserted at
+                # most once; replays neither duplicate it nor bump the count again.
+                question_id = record['id'] or str(uuid.uuid4())
+                try:
+                    cur.execute(INSERT_QUESTION_SQL, (question_id, subtopic_id) + record['values'])
+                except psycopg2.errors.ForeignKeyViolation:
+                    # Cached subtopic was deleted underneath us; re-resolve once
+                    clear_id_cache()
+                    subtopic_id = get_subtopic_id(cur, topic_id, record['subtopic'], record['subtopic_description'])
+                    cur.execute(INSERT_QUESTION_SQL, (question_id, subtopic_id) + record['values'])
+                return question_id
+
+        with DB_INSERT_SECONDS.time(operation='single'):
+            question_id = _with_connection(insert)
+        if question_id:
+            print(f"✅ Question stored in DuckSAT database with ID: {question_id}")
         return question_id
 
     except psycopg2.Error as e:
         print(f"❌ Database error: {e}")
-        if conn:
-            conn.rollback()
         return None
     except Exception as e:
         print(f"❌ Failed to store question in database: {e}")
-        if conn:
-            conn.rollback()
         return None
-    finally:
-        if conn:
-            conn.close()
+
+
+@traced('store')
+def store_questions_in_ducksat(questions, page_size=500):
+    """
+    Store many questions in one transaction: a multi-row INSERT (execute_values)
+    and one aggregated counter UPDATE per subtopic. Accepts any iterable of
+    question dicts and returns a list of question IDs aligned with the input
+    (None for questions that could not be stored). If the transaction fails,
+    nothing is stored and every entry is None. Questions that carry an 'id'
+    already present in the table are skipped, so replaying a batch is safe.
+    """
+    import psycopg2
+    from psycopg2.extras import execute_values
+
+    questions = list(questions)
+    current_span().set_attribute('questions', len(questions))
+    if not questions or get_database_url() is None:
+        return [None] * len(questions)
+
+    records = []
+    for i, question_data in enumerate(questions):
+        try:
+            records.append((i, build_question_record(question_data)))
+        except Exception as e:
+            print(f"❌ Skipping question {i + 1}: {e}")
+
+    def insert(conn):
+        question_ids = [None] * len(questions)
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                rows = []
+                for i, record in records:
+                    topic_id = get_topic_id(cur, record['topic_name'])
+                    if topic_id is None:
+                        print(f"Topic '{record['topic_name']}' not found in database")
+                        continue
+                    subtopic_id = get_subtopic_id(cur, topic_id, record['subtopic'], record['subtopic_description'])
+                    question_id = record['id'] or str(uuid.uuid4())
+                    rows.append((question_id, subtopic_id) + record['values'])
+                    question_ids[i] = question_id
+
+                counts = {}
+                if rows:
+                    # Rows whose id already exists are skipped, and only newly
+                    # inserted rows count towards the subtopic counters
+                    inserted = execute_values(
+                        cur,
+                        f"INSERT INTO questions ({QUESTION_COLUMNS}) VALUES %s ON CONFLICT (id) DO NOTHING RETURNING \"subtopicId\"",
+                        rows,
+                        template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), NOW())",
+                        page_size=page_size,
+                        fetch=True
+                    )
+                    for (subtopic_id,) in inserted:
+                        counts[subtopic_id] = counts.get(subtopic_id, 0) + 1
+                if counts:
+                    execute_values(
+                        cur,
+                        """
+                        UPDATE subtopics AS s
+                        SET "currentCount" = s."currentCount" + v.n
+                        FROM (VALUES %s) AS v(id, n)
+                        WHERE s.id = v.id
+                        """,
+                        list(counts.items()),
+                        page_size=page_size
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Subtopics created inside the rolled back transaction must not stay cached
+            clear_id_cache()
+            raise
+        finally:
+            conn.autocommit = True
+        return question_ids
+
+    try:
+        with DB_INSERT_SECONDS.time(operation='batch'):
+            question_ids = _with_connection(insert)
+    except psycopg2.Error as e:
+        print(f"❌ Database error: {e}")
+        return [None] * len(questions)
+    except Exception as e:
+        print(f"❌ Failed to store questions in database: {e}")
+        return [None] * len(questions)
+
+    if question_ids is None:
+        return [None] * len(questions)
+    stored = sum(1 for question_id in question_ids if question_id)
+    print(f"✅ Stored {stored}/{len(questions)} questions in DuckSAT database")
+    return question_ids
+
+
+def get_subtopic_targets():
+    """
+    {(topic name, subtopic name): targetQuestions} for active subtopics, as used
+    by the API's inventory refill. Look entries up with
+    (category_topic(category)[1], normalize_subtopic(subtopic)). Empty if the
+    database isn't configured or can't be reached.
+    """
+    def query(conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT t.name, s.name, s."targetQuestions"
+                FROM subtopics s JOIN topics t ON t.id = s."topicId"
+                WHERE s."isActive" AND t."isActive"
+            """)
+            return {(topic, subtopic): target for topic, subtopic, target in cur.fetchall()}
+
+    try:
+        return _with_connection(query) or {}
+    except Exception as e:
+        print(f"❌ Failed to load subtopic targets: {e}")
+        return {}
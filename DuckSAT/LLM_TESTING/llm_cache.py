@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# Content-addressed on-disk cache for LLM responses (opt-in)
+#
+# Responses are keyed on a SHA-256 of (model, deployment, messages, temperature,
+# max_tokens, sample) and stored as <cache_dir>/<key[:2]>/<key>.json. The
+# sample names the question and attempt (retry cycle or speculative candidate)
+# a query was made for, so each attempt records and replays its own response.
+# Modes:
+#
+#   off     - default, every query goes to the network
+#   record  - serve hits from disk, query the network on a miss and store it
+#   replay  - read-only: serve hits, never write, and never touch the network;
+#             a miss is reported and the query fails like any other LLM error
+#
+# The cache is size-bounded: file mtimes are bumped on every hit and the least
+# recently used entries are evicted once the directory grows past max_bytes.
+# Configure with LLM_CACHE_MODE / LLM_CACHE_DIR / LLM_CACHE_MAX_MB or the
+# --cache_mode / --cache_dir flags of llm_query.py.
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ('off', 'record', 'replay')
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), '.llm_cache')
+DEFAULT_MAX_MB = 500
+
+
+def cache_key(model_name, deployment, messages, temperature, max_tokens, sample=None):
+    """Stable hash of everything that determines the response (plus which attempt it was, if given)"""
+    fields = {
+        'model': model_name,
+        'deployment': deployment,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+    }
+    if sample is not None:
+        fields['sample'] = sample
+    payload = json.dumps(fields, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, mode='off', directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{mode}'. Must be one of {CACHE_MODES}")
+        self.mode = mode
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # computed lazily on first write
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @property
+    def read_only(self):
+        return self.mode == 'replay'
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry dict ({'content', 'total_tokens', ...}) or None"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not self.read_only:
+            try:
+                os.utime(path)  # mark as recently used for LRU eviction
+            except OSError:
+                pass
+        return entry
+
+    def put(self, key, content, total_tokens=None, model_name=None):
+        if not self.enabled or self.read_only or content is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'model': model_name,
+            'content': content,
+            'total_tokens': total_tokens,
+            'created': time.time(),
+        }
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+
+        with self._lock:
+            # An overwritten entry's bytes are replaced, not added
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += os.path.getsize(path) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """(path, size, mtime) for every cached response"""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes"""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+        self._size = size
+        logger.info(f"LLM cache evicted {evicted} entries ({size} bytes remaining)")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_response_cache(mode=None, directory=None, max_mb=None):
+    """Replace the process-wide cache; unspecified settings fall back to the LLM_CACHE_* env vars"""
+    global _cache
+    mode = mode or os.getenv('LLM_CACHE_MODE', 'off')
+    directory = directory or os.getenv('LLM_CACHE_DIR', DEFAULT_CACHE_DIR)
+    max_mb = max_mb or float(os.getenv('LLM_CACHE_MAX_MB', DEFAULT_MAX_MB))
+    with _cache_lock:
+        _cache = ResponseCache(mode, directory, int(max_mb * 1024 * 1024))
+    return _cache
+
+
+def get_response_cache():
+    if _cache is None:
+        return configure_response_cache()
+    return _cache
@@ -0,0 +1,213 @@
+import os
+import atexit
+import asyncio
+import threading
+import weakref
+
+# Shared LLM clients for llm_query.py
+#
+# Every query used to build a brand new AzureOpenAI/OpenAI client (or call
+# requests.post directly), so each LLM1/LLM2/LLM3 call paid for its own TCP and
+# TLS handshake. Clients are now created once per endpoint/api_version and kept
+# for the life of the process; their HTTP pools keep connections alive between
+# calls.
+#
+# Async clients (used by aquery_llm / generate_questions_async) are bound to the
+# event loop that created them, so they are cached per running loop.
+#
+# openai, httpx and requests are imported when the first client is created,
+# keeping them out of the import time of llm_query and the Flask service.
+
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '10'))
+KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '90'))
+DEFAULT_TIMEOUT = 120
+
+_clients = {}
+_sessions = {}
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _new_http_client():
+    """Create an httpx client with a keep-alive connection pool for the openai SDK"""
+    import httpx
+    return httpx.Client(limits=_pool_limits(), timeout=DEFAULT_TIMEOUT)
+
+
+def _new_async_http_client():
+    import httpx
+    return httpx.AsyncClient(limits=_pool_limits(), timeout=DEFAULT_TIMEOUT)
+
+
+def split_endpoint_query(endpoint):
+    """Split 'base?key=value&...' into the base URL and a dict of default headers"""
+    base_url = endpoint
+    default_headers = {}
+    if "?" in endpoint:
+        base_url, query = endpoint.split("?", 1)
+        for param in query.split("&"):
+            if "=" in param:
+                key, value = param.split("=", 1)
+                default_headers[key] = value
+    return base_url, default_headers
+
+
+def get_azure_client(endpoint, api_version, api_key):
+    """Return the shared AzureOpenAI client for this endpoint/api_version"""
+    key = ('azure', endpoint, api_version, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            import openai
+            client = openai.AzureOpenAI(
+                api_version=api_version,
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                http_client=_new_http_client(),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_openai_client(endpoint, api_key):
+    """Return the shared OpenAI-compatible client for this endpoint, or None if unsupported"""
+    import openai
+    OpenAI = getattr(openai, 'OpenAI', None)
+    if OpenAI is None:
+        return None
+    key = ('openai', endpoint, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            base_url, default_headers = split_endpoint_query(endpoint)
+            client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                default_headers=default_headers,
+                http_client=_new_http_client(),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_http_session(endpoint):
+    """Return a pooled requests.Session for raw Azure AI (/models/) endpoints"""
+    session = _sessions.get(endpoint)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(endpoint)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[endpoint] = session
+    return session
+
+
+def _loop_clients():
+    """Client cache for the running event loop (async clients can't be shared across loops)"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = {}
+        _async_clients[loop] = clients
+    return clients
+
+
+def get_async_azure_client(endpoint, api_version, api_key):
+    """Return the AsyncAzureOpenAI client for this endpoint/api_version on the running loop"""
+    clients = _loop_clients()
+    key = ('azure', endpoint, api_version, api_key)
+    client = clients.get(key)
+    if client is None:
+        import openai
+        client = openai.AsyncAzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            http_client=_new_async_http_client(),
+        )
+        clients[key] = client
+    return client
+
+
+def get_async_openai_client(endpoint, api_key):
+    """Return the AsyncOpenAI-compatible client for this endpoint on the running loop, or None if unsupported"""
+    import openai
+    AsyncOpenAI = getattr(openai, 'AsyncOpenAI', None)
+    if AsyncOpenAI is None:
+        return None
+    clients = _loop_clients()
+    key = ('openai', endpoint, api_key)
+    client = clients.get(key)
+    if client is None:
+        base_url, default_headers = split_endpoint_query(endpoint)
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            default_headers=default_headers,
+            http_client=_new_async_http_client(),
+        )
+        clients[key] = client
+    return client
+
+
+def get_async_http_client():
+    """Return the pooled httpx.AsyncClient for raw Azure AI (/models/) endpoints on the running loop"""
+    clients = _loop_clients()
+    client = clients.get('http')
+    if client is None:
+        client = _new_async_http_client()
+        clients['http'] = client
+    return client
+
+
+async def aclose_loop_clients():
+    """Close the async clients created on the running loop; call before the loop shuts down"""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.pop(loop, {})
+    for client in clients.values():
+        try:
+            if hasattr(client, 'aclose'):
+                await client.aclose()
+            else:
+                await client.close()
+        except Exception:
+            pass
+
+
+def close_all_clients():
+    """Close every pooled client and session (called automatically at exit)"""
+    with _lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        for session in _sessions.values():
+            session.close()
+        _clients.clear()
+        _sessions.clear()
+
+
+atexit.register(close_all_clients)
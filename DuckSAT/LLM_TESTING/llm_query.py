@@ -2,36 +2,61 @@
 
 import os
 import argparse
+import asyncio
 import json
 import re
-import requests
-import openai
-import webbrowser
 import base64
 import time
 import sys
 import random
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+import contextvars
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import logging
-
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Generate SAT questions using LLMs')
-parser.add_argument('--model1', type=str, help='Model name for LLM1 (question generation)')
-parser.add_argument('--model2', type=str, help='Model name for LLM2 (diagram generation)')
-parser.add_argument('--model3', type=str, help='Model name for LLM3 (checking)')
-parser.add_argument('--temperature', type=float, default=0.7, help='Temperature for LLM queries (default: 0.7)')
-parser.add_argument('--max_tokens', type=int, default=16384, help='Max tokens for LLM queries (default: 16384)')
-parser.add_argument('--num_questions', type=int, default=5, help='Number of questions to generate (default: 5)')
-parser.add_argument('--delay_minutes', type=float, default=1, help='Delay in minutes between questions (default: 1)')
-parser.add_argument('--category', type=str, help='SAT category (Reading, Writing, Math)')
-parser.add_argument('--subtopic', type=str, help='SAT subtopic')
-parser.add_argument('--interactive', action='store_true', help='Run in interactive mode')
-parser.add_argument('--batch', action='store_true', help='Run in batch mode to generate all questions (3 per subtopic)')
-
-args = parser.parse_args()
+from llm_clients import (
+    get_azure_client, get_openai_client, get_http_session,
+    get_async_azure_client, get_async_openai_client, get_async_http_client,
+    aclose_loop_clients
+)
+from rate_limiter import get_rate_limiter, estimate_tokens, is_rate_limited, retry_after_seconds
+from llm_retry import retry_policy_for, is_transient_error, is_timeout_error
+from circuit_breaker import get_circuit_breaker, OPEN as CIRCUIT_OPEN
+from llm_cache import cache_key, get_response_cache, configure_response_cache
+from question_schema import validate_question_json
+from batch_checkpoint import BatchCheckpoint, unit_key, CHECKPOINT_PATH
+from model_registry import get_model_registry
+from metrics import (
+    LLM_LATENCY, LLM_RATE_LIMIT_WAIT, LLM_TOKENS, LLM_ERRORS, LLM_RETRIES, LLM_FAILOVERS, LLM_CACHE_HITS,
+    GENERATION_RETRIES, CHECKER_REJECTIONS, PARSE_FAILURES
+)
+from tracing import traced, span, current_span, start_span, use_span
+
+def build_arg_parser():
+    """Command line flags; only parsed when llm_query.py runs as a script, so importing it has no side effects"""
+    parser = argparse.ArgumentParser(description='Generate SAT questions using LLMs')
+    parser.add_argument('--model1', type=str, help='Model name for LLM1 (question generation)')
+    parser.add_argument('--model2', type=str, help='Model name for LLM2 (diagram generation)')
+    parser.add_argument('--model3', type=str, help='Model name for LLM3 (checking)')
+    parser.add_argument('--temperature', type=float, default=0.7, help='Temperature for LLM queries (default: 0.7)')
+    parser.add_argument('--max_tokens', type=int, default=16384, help='Max tokens for LLM queries (default: 16384)')
+    parser.add_argument('--num_questions', type=int, default=5, help='Number of questions to generate (default: 5)')
+    parser.add_argument('--delay_minutes', type=float, default=0, help='Extra delay in minutes between questions (default: 0; set per-model rate_limits in llms_config.json to pace requests)')
+    parser.add_argument('--category', type=str, help='SAT category (Reading, Writing, Math)')
+    parser.add_argument('--subtopic', type=str, help='SAT subtopic')
+    parser.add_argument('--interactive', action='store_true', help='Run in interactive mode')
+    parser.add_argument('--batch', action='store_true', help='Run in batch mode to generate all questions (3 per subtopic)')
+    parser.add_argument('--cache_mode', choices=['off', 'record', 'replay'], help='LLM response cache: record (read+write), replay (read-only, no network) or off (default: $LLM_CACHE_MODE or off)')
+    parser.add_argument('--cache_dir', type=str, help='Directory for the LLM response cache (default: $LLM_CACHE_DIR or LLM_TESTING/.llm_cache)')
+    parser.add_argument('--output_format', choices=['text', 'json'], default='text', help='LLM1 output format: labelled text (default) or schema-validated JSON')
+    parser.add_argument('--use_async', action='store_true', help='Use the asyncio engine (questions and subtopics run concurrently)')
+    parser.add_argument('--max_concurrency', type=int, default=16, help='Async engine: max in-flight LLM calls overall (default: 16)')
+    parser.add_argument('--per_model_concurrency', type=int, default=4, help='Async engine: max in-flight LLM calls per model (default: 4)')
+    parser.add_argument('--speculative', type=int, default=1, metavar='K', help='Launch K LLM1 candidates per question at once and keep the first accepted one (default: 1, off)')
+    parser.add_argument('--pipeline', action='store_true', help='Async engine: run LLM1/LLM2/LLM3 as pipelined stages with their own workers')
+    parser.add_argument('--stage_workers', type=str, default='4,2,4', help='Pipeline workers for LLM1,LLM2,LLM3 (default: 4,2,4)')
+    parser.add_argument('--resume', action='store_true', help='Batch mode: continue from the checkpoint of an interrupted run instead of starting over')
+    parser.add_argument('--checkpoint', type=str, default=CHECKPOINT_PATH, help='Batch mode: checkpoint file (default: $BATCH_CHECKPOINT_PATH or LLM_TESTING/.checkpoints/batch_generation.json)')
+    return parser
 
 # Load environment variables from LLM_TESTING/.env file explicitly
 ENV_PATH = os.path.join(os.path.dirname(__file__), '.env')
@@ -51,41 +76,131 @@ DUCKSAT_AVAILABLE = True
 
 # Import DuckSAT integration functions
 try:
-    from ducksat_integration import store_question_in_ducksat
+    from question_writer import get_question_writer
     DUCKSAT_INTEGRATION_AVAILABLE = True
 except ImportError:
     DUCKSAT_INTEGRATION_AVAILABLE = False
     print("Warning: DuckSAT integration functions not available.")
 
-try:
-    OpenAI = openai.OpenAI
-except AttributeError:
-    OpenAI = None
-
 def load_llms_config():
+    """Configured models as {name: entry}, from the cached model registry (see model_registry.py)"""
+    registry = get_model_registry()
+    return {name: registry.get(name).raw for name in registry.names()}
+
+# SAT Subtopics
+SAT_SUBTOPICS = {
+    "Reading": [
+        "Comprehension",
+        "Vocabulary in Context",
+        "Inference",
+        "Main Idea & Supporting Details",
+        "Text Structure & Purpose",
+        "Rhetorical Effect",
+        "Data Interpretation (Charts, Tables)"
+    ],
+    "Writing": [
+        "Sentence Structure",
+        "Grammar & Usage",
+        "Punctuation",
+        "Conciseness & Clarity",
+        "Logical Flow",
+        "Tone & Style",
+        "Transitions & Organization"
+    ],
+    "Math": [
+        "Linear Equations",
+        "Inequalities",
+        "Systems of Equations",
+        "Quadratic Equations",
+        "Polynomials",
+        "Rational Expressions",
+        "Exponents & Radicals",
+        "Ratios & Proportions",
+        "Percentages",
+        "Statistics & Probability",
+        "Graph Interpretation",
+        "Geometry – Angles",
+        "Geometry – Triangles",
+        "Geometry – Circles",
+        "Geometry – Coordinate Geometry",
+        "Trigonometry – Sine, Cosine, Tangent"
+    ]
+}
+
+# parse_llm1 tokenizer: every "<Label>:" occurrence is found in one scan, then
+# each field is cut out between its label and the next relevant label. Field
+# boundaries match the original per-field regexes exactly (first label whose
+# value pattern matches, ended by the first terminator label after it).
+# Labels all end in ':' and none is a suffix of another, so the scan only
+# visits colons and checks the few characters before each one.
+_LLM1_LABEL_RE = re.compile(
+    r'(Wrong Answer Explanations|Correct Answer Index|Diagram Description|Text to Edit|Time Estimate'
+    r'|Explanation|Difficulty|Category|Subtopic|Question|Passage|Source|Options|Tags)\Z',
+    re.IGNORECASE
+)
+_LLM1_LABEL_MAX_LEN = len('Wrong Answer Explanations')
+_INT_VALUE_RE = re.compile(r'\s*(\d+)')
+_DIFFICULTY_VALUE_RE = re.compile(r'\s*(easy|medium|hard)', re.IGNORECASE)
+_ARRAY_VALUE_RE = re.compile(r'\s*(\[.*?\])', re.DOTALL)
+
+_METADATA_LABELS = ('difficulty', 'category', 'subtopic', 'time estimate', 'source', 'tags', 'wrong answer explanations', 'correct answer index')
+_LLM1_TERMINATORS = {
+    'explanation': frozenset(_METADATA_LABELS),
+    'category': frozenset(('subtopic', 'difficulty', 'time estimate', 'source', 'tags', 'wrong answer explanations', 'explanation', 'correct answer index')),
+    'subtopic': frozenset(('difficulty', 'category', 'time estimate', 'source', 'tags', 'wrong answer explanations', 'explanation', 'correct answer index')),
+    'source': frozenset(('tags', 'wrong answer explanations', 'explanation', 'correct answer index')),
+    'question': frozenset(('explanation',)),
+    'passage': frozenset(('question',)),
+    'text to edit': frozenset(('question',)),
+    'diagram description': frozenset(('question',)),
+}
+_CONTENT_LABELS = {"Reading": 'passage', "Writing": 'text to edit'}  # anything else is Math
+
+def _tokenize_llm1(response):
+    """Single pass over the response: list of (label, start, end) plus label -> [index into that list]"""
+    tokens = []
+    by_label = {}
+    colon = response.find(':')
+    while colon != -1:
+        match = _LLM1_LABEL_RE.search(response, max(0, colon - _LLM1_LABEL_MAX_LEN), colon)
+        if match:
+            label = match.group(1).lower()
+            by_label.setdefault(label, []).append(len(tokens))
+            tokens.append((label, match.start(), colon + 1))
+        colon = response.find(':', colon + 1)
+    return tokens, by_label
+
+def _section(response, tokens, by_label, label):
+    """Text between the first `label:` and the next terminator label after it, or None"""
+    indexes = by_label.get(label)
+    if not indexes:
+        return None
+    terminators = _LLM1_TERMINATORS[label]
+    i = indexes[0]
+    start = tokens[i][2]
+    for other, other_start, _ in tokens[i + 1:]:
+        if other in terminators:
+            return response[start:other_start].strip()
+    return None
+
+def _value(response, tokens, by_label, label, pattern):
+    """First `label:` occurrence whose value matches pattern (anchored right after the colon)"""
+    for i in by_label.get(label, ()):
+        match = pattern.match(response, tokens[i][2])
+        if match:
+            return match.group(1)
+    return None
+
+def _json_list(text, fallback_split):
     try:
-        config_path = os.path.join(os.path.dirname(__file__), 'llms_config.json')
-        with open(config_path, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-def parse_llm1(response, subtopic_category):
-    # Extract correct answer index
-    correct_answer_match = re.search(r'Correct Answer Index:\s*(\d+)', response, re.IGNORECASE)
-    correct_answer = int(correct_answer_match.group(1)) if correct_answer_match else 0
-
-    # Extract options as JSON array
-    options_match = re.search(r'Options:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
-    options = []
-    if options_match:
-        try:
-            options = json.loads(options_match.group(1))
-        except json.JSONDecodeError:
-            # Fallback: parse as text
-            options_text = options_match.group(1)
-            options = [opt.strip() for opt in options_text.strip('[]').split(',') if opt.strip()]
-
+        return json.loads(text)
+    except json.JSONDecodeError:
+        if not fallback_split:
+            return []
+        # Fallback: parse as text
+        return [item.strip() for item in text.strip('[]').split(',') if item.strip()]
+
+def _shuffle_options(options, correct_answer):
     # Ensure exactly 4 options
     while len(options) < 4:
         options.append("")
@@ -96,167 +211,113 @@ def parse_llm1(response, subtopic_category):
         correct_option = options[correct_answer]
         random.shuffle(options)
         correct_answer = options.index(correct_option)
+    return options, correct_answer
 
-    # Extract additional fields
-    difficulty_match = re.search(r'Difficulty:\s*(easy|medium|hard)', response, re.IGNORECASE)
-    difficulty = difficulty_match.group(1).lower() if difficulty_match else "medium"
+@traced()
+def parse_llm1(response, subtopic_category):
+    tokens, by_label = _tokenize_llm1(response)
 
-    category_match = re.search(r'Category:\s*(.*?)\s*(?=Subtopic:|Difficulty:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-    category = category_match.group(1).strip() if category_match else subtopic_category.lower().replace(" ", "-")
+    # Extract correct answer index
+    correct_answer = _value(response, tokens, by_label, 'correct answer index', _INT_VALUE_RE)
+    correct_answer = int(correct_answer) if correct_answer else 0
 
-    subtopic_match = re.search(r'Subtopic:\s*(.*?)\s*(?=Difficulty:|Category:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-    subtopic = subtopic_match.group(1).strip() if subtopic_match else ""
+    # Extract options as JSON array
+    options_text = _value(response, tokens, by_label, 'options', _ARRAY_VALUE_RE)
+    options = _json_list(options_text, fallback_split=True) if options_text else []
 
-    time_estimate_match = re.search(r'Time Estimate:\s*(\d+)', response, re.IGNORECASE)
-    time_estimate = int(time_estimate_match.group(1)) if time_estimate_match else 60
+    options, correct_answer = _shuffle_options(options, correct_answer)
 
-    source_match = re.search(r'Source:\s*(.*?)\s*(?=Tags:|Wrong Answer Explanations:|Explanation:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-    source = source_match.group(1).strip() if source_match else "AI Generated"
+    # Extract additional fields
+    difficulty = _value(response, tokens, by_label, 'difficulty', _DIFFICULTY_VALUE_RE)
+    difficulty = difficulty.lower() if difficulty else "medium"
+
+    category = _section(response, tokens, by_label, 'category')
+    if category is None:
+        category = subtopic_category.lower().replace(" ", "-")
+
+    subtopic = _section(response, tokens, by_label, 'subtopic') or ""
+
+    time_estimate = _value(response, tokens, by_label, 'time estimate', _INT_VALUE_RE)
+    time_estimate = int(time_estimate) if time_estimate else 60
+
+    source = _section(response, tokens, by_label, 'source')
+    if source is None:
+        source = "AI Generated"
+
+    tags_text = _value(response, tokens, by_label, 'tags', _ARRAY_VALUE_RE)
+    tags = _json_list(tags_text, fallback_split=True) if tags_text else []
+
+    wrong_answer_text = _value(response, tokens, by_label, 'wrong answer explanations', _ARRAY_VALUE_RE)
+    wrong_answer_explanations = _json_list(wrong_answer_text, fallback_split=False) if wrong_answer_text else []
+
+    # passage for Reading, text to edit for Writing, diagram description for Math
+    content_label = _CONTENT_LABELS.get(subtopic_category, 'diagram description')
+    return {
+        "content": _section(response, tokens, by_label, content_label) or "",
+        "question": _section(response, tokens, by_label, 'question') or "",
+        "explanation": _section(response, tokens, by_label, 'explanation') or "",
+        "options": options,
+        "correct_answer": correct_answer,
+        "difficulty": difficulty,
+        "category": category,
+        "subtopic": subtopic,
+        "time_estimate": time_estimate,
+        "source": source,
+        "tags": tags,
+        "wrong_answer_explanations": wrong_answer_explanations
+    }
 
-    tags_match = re.search(r'Tags:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
-    tags = []
-    if tags_match:
-        try:
-            tags = json.loads(tags_match.group(1))
-        except json.JSONDecodeError:
-            tags_text = tags_match.group(1)
-            tags = [tag.strip() for tag in tags_text.strip('[]').split(',') if tag.strip()]
-
-    wrong_answer_explanations_match = re.search(r'Wrong Answer Explanations:\s*(\[.*?\])', response, re.DOTALL | re.IGNORECASE)
-    wrong_answer_explanations = []
-    if wrong_answer_explanations_match:
-        try:
-            wrong_answer_explanations = json.loads(wrong_answer_explanations_match.group(1))
-        except json.JSONDecodeError:
-            pass  # Leave as empty list
-
-    if subtopic_category == "Reading":
-        passage_match = re.search(r'Passage:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
-        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
-        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-        passage = passage_match.group(1).strip() if passage_match else ""
-        question = question_match.group(1).strip() if question_match else ""
-        explanation = exp_match.group(1).strip() if exp_match else ""
-        return {
-            "content": passage,
-            "question": question,
-            "explanation": explanation,
-            "options": options,
-            "correct_answer": correct_answer,
-            "difficulty": difficulty,
-            "category": category,
-            "subtopic": subtopic,
-            "time_estimate": time_estimate,
-            "source": source,
-            "tags": tags,
-            "wrong_answer_explanations": wrong_answer_explanations
-        }
-    elif subtopic_category == "Writing":
-        text_match = re.search(r'Text to Edit:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
-        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
-        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-        text_to_edit = text_match.group(1).strip() if text_match else ""
-        question = question_match.group(1).strip() if question_match else ""
-        explanation = exp_match.group(1).strip() if exp_match else ""
-        return {
-            "content": text_to_edit,
-            "question": question,
-            "explanation": explanation,
-            "options": options,
-            "correct_answer": correct_answer,
-            "difficulty": difficulty,
-            "category": category,
-            "subtopic": subtopic,
-            "time_estimate": time_estimate,
-            "source": source,
-            "tags": tags,
-            "wrong_answer_explanations": wrong_answer_explanations
-        }
-    else:  # Math
-        desc_match = re.search(r'Diagram Description:\s*(.*?)\s*Question:', response, re.DOTALL | re.IGNORECASE)
-        question_match = re.search(r'Question:\s*(.*?)\s*Explanation:', response, re.DOTALL | re.IGNORECASE)
-        exp_match = re.search(r'Explanation:\s*(.*?)\s*(?=Difficulty:|Category:|Subtopic:|Time Estimate:|Source:|Tags:|Wrong Answer Explanations:|Correct Answer Index:)', response, re.DOTALL | re.IGNORECASE)
-        diagram_desc = desc_match.group(1).strip() if desc_match else ""
-        question = question_match.group(1).strip() if question_match else ""
-        explanation = exp_match.group(1).strip() if exp_match else ""
-        return {
-            "content": diagram_desc,
-            "question": question,
-            "explanation": explanation,
-            "options": options,
-            "correct_answer": correct_answer,
-            "difficulty": difficulty,
-            "category": category,
-            "subtopic": subtopic,
-            "time_estimate": time_estimate,
-            "source": source,
-            "tags": tags,
-            "wrong_answer_explanations": wrong_answer_explanations
-        }
+@traced()
+def parse_llm1_json(response, subtopic_category):
+    """
+    Parse an LLM1 reply produced in JSON output mode (see question_schema.py).
+    Returns (parsed, errors): parsed has the same shape as parse_llm1's dict and
+    is None when the reply fails schema validation.
+    """
+    data, errors = validate_question_json(response)
+    if errors:
+        PARSE_FAILURES.inc(stage='llm1_json')
+        return None, errors
+
+    options, correct_answer = _shuffle_options(list(data["options"]), data["correctAnswer"])
+    return {
+        "content": (data.get("passage") or "").strip(),
+        "question": data["question"].strip(),
+        "explanation": data["explanation"].strip(),
+        "options": options,
+        "correct_answer": correct_answer,
+        "difficulty": data.get("difficulty", "medium"),
+        "category": data.get("category") or subtopic_category.lower().replace(" ", "-"),
+        "subtopic": data.get("subtopic", ""),
+        "time_estimate": data.get("timeEstimate", 60),
+        "source": data.get("source") or "AI Generated",
+        "tags": data.get("tags", []),
+        "wrong_answer_explanations": data.get("wrongAnswerExplanations", [])
+    }, []
 
 def render_vega_to_base64(spec):
     try:
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-<script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
-</head>
-<body>
-<div id="vis" style="width: 400px; height: 300px;"></div>
-<script>
-const spec = {json.dumps(spec)};
-const view = new vega.View(vega.parse(spec)).renderer('canvas').initialize('#vis').runAsync();
-</script>
-</body>
-</html>"""
-        temp_file = 'temp_diagram.html'
-        with open(temp_file, 'w') as f:
-            f.write(html_content)
-        
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--window-size=400,300')
-        
-        driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-        driver.get(f'file://{os.path.abspath(temp_file)}')
-        time.sleep(3)  # Wait for rendering
-        
-        canvas = driver.find_element('id', 'vis').find_element('tag name', 'canvas')
-        screenshot = canvas.screenshot_as_png
-        driver.quit()
-        os.remove(temp_file)
-        
+        # selenium is only imported once something is actually rendered
+        from vega_renderer import get_vega_renderer
+        screenshot = get_vega_renderer().render_png(spec)
         return base64.b64encode(screenshot).decode('utf-8')
     except Exception as e:
         print(f"Failed to render diagram to image: {e}. Falling back to spec text.")
         return None
 
-def query_llm(model_name, prompt, context, max_tokens, temperature, image_b64=None):
-    logger.info(f"Querying LLM: model={model_name}, max_tokens={max_tokens}, temperature={temperature}")
-
-    llms_config = load_llms_config()
-
-    if model_name not in llms_config:
+def _prepare_llm_request(model_name, prompt, context, max_tokens, temperature, image_b64=None, response_format=None):
+    """Resolve model config, credentials and messages for a query; returns None if the query can't be made"""
+    model = get_model_registry().get(model_name)
+    if model is None:
         logger.error(f"Model '{model_name}' not found in llms_config.json")
         print(f"Model '{model_name}' not found in llms_config.json")
-        return
-
-    llm_data = llms_config[model_name]
-    endpoint = llm_data['endpoint']
-    deployment = llm_data['model']
-    api_version = llm_data.get('api_version', '2024-12-01-preview')
-
-    # Adjust temperature for models that require it
-    if deployment == 'gpt-5':
-        temperature = 1.0
+        return None
 
     api_key = os.getenv("AZURE_OPENAI_API_KEY")
     if not api_key:
         logger.error("AZURE_OPENAI_API_KEY not set in .env file")
         print("Please set AZURE_OPENAI_API_KEY in your .env file.")
-        return
+        return None
 
     if image_b64:
         user_content = [
@@ -271,79 +332,390 @@ def query_llm(model_name, prompt, context, max_tokens, temperature, image_b64=No
         {"role": "user", "content": user_content}
     ]
 
-    try:
-        if "cognitiveservices.azure.com" in endpoint or "openai.azure.com" in endpoint:
-            # Azure OpenAI
-            client = openai.AzureOpenAI(
-                api_version=api_version,
-                azure_endpoint=endpoint,
-                api_key=api_key,
-            )
-            response = client.chat.completions.create(
-                model=deployment,
-                messages=messages,
-                max_completion_tokens=max_tokens,
-                temperature=temperature,
-                timeout=120,
-            )
-        else:
-            if "/models/" in endpoint:
-                # Azure AI
-                headers = {
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                    "api-version": api_version
-                }
-                payload = {
-                    "model": deployment,
-                    "messages": messages,
-                    "max_tokens": max_tokens,
-                    "temperature": temperature
-                }
-                response = requests.post(endpoint, headers=headers, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                # Other OpenAI compatible
-                base_url = endpoint
-                default_headers = {}
-                if "?" in endpoint:
-                    base_url, query = endpoint.split("?", 1)
-                    for param in query.split("&"):
-                        if "=" in param:
-                            key, value = param.split("=", 1)
-                            default_headers[key] = value
-                if OpenAI is None:
-                    print("OpenAI client not available in this openai library version.")
-                    return
-                client = OpenAI(
-                    base_url=base_url,
-                    api_key=api_key,
-                    default_headers=default_headers,
-                )
-                response = client.chat.completions.create(
-                    model=deployment,
-                    messages=messages,
-                    max_completion_tokens=max_tokens,
-                    temperature=temperature,
-                )
-                return response.choices[0].message.content
-        # Immediately delete api_key from memory
-        del api_key
+    return {
+        'model_name': model_name,
+        'endpoint': model.endpoint,
+        'deployment': model.deployment,
+        'api_version': model.api_version,
+        'api_key': api_key,
+        'messages': messages,
+        'max_tokens': max_tokens,
+        # Models with a forced_temperature only accept that value
+        'temperature': model.temperature(temperature),
+        'rate_limits': model.rate_limits,
+        'timeout': model.timeout,
+        'slow_call_seconds': model.slow_call_seconds,
+        'max_retries': model.max_retries,
+        # Only models flagged supports_json_mode get response_format; others rely on the prompt alone
+        'response_format': response_format if model.supports_json_mode else None,
+    }
+
+def _completion_options(request):
+    """Optional chat.completions arguments, only sent when set"""
+    options = {}
+    if request.get('response_format'):
+        options['response_format'] = request['response_format']
+    return options
+
+def _raw_azure_ai_request(request):
+    """Headers and payload for raw Azure AI (/models/) endpoints"""
+    headers = {
+        "Authorization": f"Bearer {request['api_key']}",
+        "Content-Type": "application/json",
+        "api-version": request['api_version']
+    }
+    payload = {
+        "model": request['deployment'],
+        "messages": request['messages'],
+        "max_tokens": request['max_tokens'],
+        "temperature": request['temperature'],
+        **_completion_options(request)
+    }
+    return headers, payload
+
+def _usage_counts(usage):
+    """prompt/completion/total token counts from an SDK usage object or a raw JSON dict (None where missing)"""
+    if usage is None:
+        return {}
+    if isinstance(usage, dict):
+        return {name: usage.get(name) for name in ('prompt_tokens', 'completion_tokens', 'total_tokens')}
+    return {name: getattr(usage, name, None) for name in ('prompt_tokens', 'completion_tokens', 'total_tokens')}
+
+def _send_llm_request(request):
+    """Send a prepared request. Returns (content, token usage dict, see _usage_counts)."""
+    endpoint = request['endpoint']
+    if "cognitiveservices.azure.com" in endpoint or "openai.azure.com" in endpoint:
+        # Azure OpenAI
+        client = get_azure_client(endpoint, request['api_version'], request['api_key'])
+        response = client.chat.completions.create(
+            model=request['deployment'],
+            messages=request['messages'],
+            max_completion_tokens=request['max_tokens'],
+            temperature=request['temperature'],
+            **_completion_options(request),
+            timeout=request['timeout'],
+        )
         logger.info(f"LLM response length: {len(response.choices[0].message.content)}")
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"Error querying LLM: {e}")
-        return None
+        return response.choices[0].message.content, _usage_counts(getattr(response, 'usage', None))
+    elif "/models/" in endpoint:
+        # Azure AI
+        headers, payload = _raw_azure_ai_request(request)
+        response = get_http_session(endpoint).post(endpoint, headers=headers, json=payload, timeout=request['timeout'])
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"], _usage_counts(data.get("usage"))
+    else:
+        # Other OpenAI compatible
+        client = get_openai_client(endpoint, request['api_key'])
+        if client is None:
+            print("OpenAI client not available in this openai library version.")
+            return None, {}
+        response = client.chat.completions.create(
+            model=request['deployment'],
+            messages=request['messages'],
+            max_completion_tokens=request['max_tokens'],
+            temperature=request['temperature'],
+            **_completion_options(request),
+            timeout=request['timeout'],
+        )
+        return response.choices[0].message.content, _usage_counts(getattr(response, 'usage', None))
+
+async def _asend_llm_request(request):
+    endpoint = request['endpoint']
+    if "cognitiveservices.azure.com" in endpoint or "openai.azure.com" in endpoint:
+        # Azure OpenAI
+        client = get_async_azure_client(endpoint, request['api_version'], request['api_key'])
+        response = await client.chat.completions.create(
+            model=request['deployment'],
+            messages=request['messages'],
+            max_completion_tokens=request['max_tokens'],
+            temperature=request['temperature'],
+            **_completion_options(request),
+            timeout=request['timeout'],
+        )
+        logger.info(f"LLM response length: {len(response.choices[0].message.content)}")
+        return response.choices[0].message.content, _usage_counts(getattr(response, 'usage', None))
+    elif "/models/" in endpoint:
+        # Azure AI
+        headers, payload = _raw_azure_ai_request(request)
+        response = await get_async_http_client().post(endpoint, headers=headers, json=payload, timeout=request['timeout'])
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"], _usage_counts(data.get("usage"))
+    else:
+        # Other OpenAI compatible
+        client = get_async_openai_client(endpoint, request['api_key'])
+        if client is None:
+            print("OpenAI client not available in this openai library version.")
+            return None, {}
+        response = await client.chat.completions.create(
+            model=request['deployment'],
+            messages=request['messages'],
+            max_completion_tokens=request['max_tokens'],
+            temperature=request['temperature'],
+            **_completion_options(request),
+            timeout=request['timeout'],
+        )
+        return response.choices[0].message.content, _usage_counts(getattr(response, 'usage', None))
+
+def _handle_llm_error(request, limiter, e, stage, policy, retries, circuit_open=False):
+    """
+    Count and log a failed call; returns the seconds to wait before retrying it, or None to give
+    up (see llm_retry.py). A call whose failure opened the model's circuit breaker isn't retried.
+    """
+    model_name = request['model_name']
+    LLM_ERRORS.inc(model=model_name, stage=stage)
+    if is_rate_limited(e):
+        retry_after = retry_after_seconds(e)
+        logger.warning(f"Rate limited by {model_name}, pausing for {retry_after or 1.0}s")
+        limiter.penalize(retry_after)
+    if not circuit_open and policy.should_retry(e, retries):
+        delay = policy.delay(retries, e)
+        LLM_RETRIES.inc(model=model_name, stage=stage)
+        current_span().set_attribute('retries', retries + 1)
+        logger.warning(f"Transient error from {model_name} ({stage}): {e}; retry {retries + 1}/{policy.max_retries} in {delay:.1f}s")
+        return delay
+    current_span().record_exception(e)
+    kind = 'transient' if is_transient_error(e) else 'permanent'
+    logger.error(f"Error querying LLM ({kind} error, {retries} retries): {e}")
+    return None
+
+# Which attempt at which question the current queries belong to: part of the
+# response cache key, so a retry cycle or another speculative candidate draws
+# its own response instead of replaying the one that was just rejected
+_cache_sample = contextvars.ContextVar('llm_cache_sample', default=None)
+
+def _set_cache_sample(unit, attempt):
+    """Cache queries made from now on (in this thread or asyncio task) as this attempt at unit"""
+    return _cache_sample.set(f"{unit}#{attempt}")
+
+def _cache_lookup(request):
+    """
+    Check the response cache (see llm_cache.py). Returns (key, cached_content, replay_miss);
+    key is None when the cache is off.
+    """
+    cache = get_response_cache()
+    if not cache.enabled:
+        return None, None, False
+    key = cache_key(request['model_name'], request['deployment'], request['messages'], request['temperature'], request['max_tokens'],
+                    _cache_sample.get())
+    entry = cache.get(key)
+    if entry is not None:
+        logger.info(f"LLM cache hit: model={request['model_name']}")
+        return key, entry['content'], False
+    if cache.read_only:
+        logger.error(f"LLM cache miss in replay mode: model={request['model_name']}")
+        return key, None, True
+    return key, None, False
+
+# Per-task usage accounting: track_llm_usage() installs an LLMUsage that every
+# query made afterwards in the same context (thread or asyncio task) adds to.
+_llm_usage = contextvars.ContextVar('llm_usage', default=None)
+
+class LLMUsage:
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0  # as reported by the API, estimated when it reports none
+        self.cache_hits = 0
+
+def track_llm_usage():
+    """Start tallying LLM calls and tokens for the current thread or asyncio task; returns the LLMUsage"""
+    usage = LLMUsage()
+    _llm_usage.set(usage)
+    return usage
+
+def _record_llm_usage(tokens, cache_hit=False):
+    usage = _llm_usage.get()
+    if usage is not None:
+        usage.calls += 1
+        usage.tokens += tokens or 0
+        usage.cache_hits += int(cache_hit)
+
+def _record_llm_metrics(request, stage, seconds, usage):
+    model_name = request['model_name']
+    current_span().set_attributes(**{name: count for name, count in usage.items() if count is not None})
+    LLM_LATENCY.observe(seconds, model=model_name, stage=stage, outcome='ok')
+    if usage.get('prompt_tokens') is not None:
+        LLM_TOKENS.inc(usage['prompt_tokens'], model=model_name, direction='in')
+    if usage.get('completion_tokens') is not None:
+        LLM_TOKENS.inc(usage['completion_tokens'], model=model_name, direction='out')
+
+# Pipeline role of each stage; a failed call fails over along the role's chain
+# from the "_roles" section of llms_config.json (see model_registry.py)
+STAGE_ROLES = {
+    'llm1': 'generator', 'llm1_repair': 'generator',
+    'llm2': 'diagrammer', 'llm2_fix': 'diagrammer',
+    'llm3': 'checker',
+}
+
+def _fallback_chain(model_name, stage):
+    role = STAGE_ROLES.get(stage)
+    if role is None:
+        return [model_name]
+    return get_model_registry().fallback_chain(role, model_name)
+
+def _log_failover(model_name, chain, i, stage):
+    """Count and log handing a call from chain[i - 1] to chain[i]"""
+    LLM_FAILOVERS.inc(stage=stage, model=chain[i - 1])
+    current_span().set_attribute('fallback_from', model_name)
+    logger.warning(f"{chain[i - 1]} failed for {stage}, failing over to {chain[i]}")
+
+@traced()
+def query_llm(model_name, prompt, context, max_tokens, temperature, image_b64=None, response_format=None, stage='query'):
+    """
+    Query a model from llms_config.json; returns the reply text or None. Transient errors
+    are retried with backoff (see llm_retry.py); if they persist, or the model's circuit
+    breaker is open, the stage's role falls back to the next model in its "_roles" chain.
+    Other failures (bad request, missing key, replay cache miss) don't fail over.
+    stage labels the call in metrics and traces.
+    """
+    chain = _fallback_chain(model_name, stage)
+    for i, candidate in enumerate(chain):
+        if i:
+            _log_failover(model_name, chain, i, stage)
+        content, failover = _query_model(candidate, prompt, context, max_tokens, temperature, image_b64, response_format, stage)
+        if content is not None or not failover:
+            return content
+    return None
+
+def _query_model(model_name, prompt, context, max_tokens, temperature, image_b64, response_format, stage):
+    """
+    One model's attempt at a query_llm call, with retries. Returns (content, failover):
+    content is None on failure, and failover says whether the endpoint is the problem
+    (its circuit is open or transient errors outlasted the retries), so another model may help.
+    """
+    current_span().set_attributes(model=model_name, stage=stage)
+    logger.info(f"Querying LLM: model={model_name}, stage={stage}, max_tokens={max_tokens}, temperature={temperature}")
+
+    request = _prepare_llm_request(model_name, prompt, context, max_tokens, temperature, image_b64, response_format)
+    if request is None:
+        return None, False
+
+    response_key, cached, replay_miss = _cache_lookup(request)
+    if cached is not None or replay_miss:
+        if cached is not None:
+            _record_llm_usage(0, cache_hit=True)
+            LLM_CACHE_HITS.inc(model=model_name)
+            current_span().set_attribute('cache_hit', True)
+        return cached, False
+
+    # Wait for this model's requests/min and tokens/min budget (see rate_limiter.py)
+    limiter = get_rate_limiter(model_name, request['rate_limits'])
+    estimated = estimate_tokens(request['messages'], max_tokens)
+    policy = retry_policy_for(request)
+    breaker = get_circuit_breaker(model_name, request['endpoint'], request['deployment'], request['slow_call_seconds'])
+    retries = 0
+    while True:
+        if not breaker.allow():
+            logger.warning(f"Circuit for {model_name} is open, not sending {stage}")
+            current_span().set_attribute('circuit_open', True)
+            return None, True
+        with LLM_RATE_LIMIT_WAIT.time(model=model_name):
+            limiter.acquire(estimated)
+        started = time.perf_counter()
+        try:
+            content, usage = _send_llm_request(request)
+            break
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            breaker.record(e, seconds)
+            # A failed attempt used no completion tokens; give its reservation back before any retry takes another
+            limiter.record_usage(estimated, 0)
+            LLM_LATENCY.observe(seconds, model=model_name, stage=stage, outcome='timeout' if is_timeout_error(e) else 'error')
+            delay = _handle_llm_error(request, limiter, e, stage, policy, retries, breaker.state == CIRCUIT_OPEN)
+            if delay is None:
+                return None, is_transient_error(e)
+        # Only this call is retried; the caller's cycle keeps what it already has
+        time.sleep(delay)
+        retries += 1
+    seconds = time.perf_counter() - started
+    breaker.record(None, seconds)
+    _record_llm_metrics(request, stage, seconds, usage)
+    used_tokens = usage.get('total_tokens')
+    limiter.record_usage(estimated, used_tokens)
+    _record_llm_usage(used_tokens if used_tokens is not None else estimated)
+    if response_key:
+        get_response_cache().put(response_key, content, used_tokens, model_name)
+    return content, False
+
+@traced('query_llm')
+async def aquery_llm(model_name, prompt, context, max_tokens, temperature, image_b64=None, response_format=None, stage='query', limits=None):
+    """
+    Async counterpart of query_llm, using the async clients from llm_clients. With limits
+    (a ConcurrencyLimits), each model in the fallback chain is called within its own slots.
+    """
+    chain = _fallback_chain(model_name, stage)
+    for i, candidate in enumerate(chain):
+        if i:
+            _log_failover(model_name, chain, i, stage)
+        if limits is None:
+            content, failover = await _aquery_model(candidate, prompt, context, max_tokens, temperature, image_b64, response_format, stage)
+        else:
+            async with limits.slot(candidate):
+                content, failover = await _aquery_model(candidate, prompt, context, max_tokens, temperature, image_b64, response_format, stage)
+        if content is not None or not failover:
+            return content
+    return None
+
+async def _aquery_model(model_name, prompt, context, max_tokens, temperature, image_b64, response_format, stage):
+    current_span().set_attributes(model=model_name, stage=stage)
+    logger.info(f"Querying LLM (async): model={model_name}, stage={stage}, max_tokens={max_tokens}, temperature={temperature}")
+
+    request = _prepare_llm_request(model_name, prompt, context, max_tokens, temperature, image_b64, response_format)
+    if request is None:
+        return None, False
+
+    response_key, cached, replay_miss = _cache_lookup(request)
+    if cached is not None or replay_miss:
+        if cached is not None:
+            _record_llm_usage(0, cache_hit=True)
+            LLM_CACHE_HITS.inc(model=model_name)
+            current_span().set_attribute('cache_hit', True)
+        return cached, False
+
+    limiter = get_rate_limiter(model_name, request['rate_limits'])
+    estimated = estimate_tokens(request['messages'], max_tokens)
+    policy = retry_policy_for(request)
+    breaker = get_circuit_breaker(model_name, request['endpoint'], request['deployment'], request['slow_call_seconds'])
+    retries = 0
+    while True:
+        if not breaker.allow():
+            logger.warning(f"Circuit for {model_name} is open, not sending {stage}")
+            current_span().set_attribute('circuit_open', True)
+            return None, True
+        with LLM_RATE_LIMIT_WAIT.time(model=model_name):
+            await limiter.acquire_async(estimated)
+        started = time.perf_counter()
+        try:
+            content, usage = await _asend_llm_request(request)
+            break
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            breaker.record(e, seconds)
+            # A failed attempt used no completion tokens; give its reservation back before any retry takes another
+            limiter.record_usage(estimated, 0)
+            LLM_LATENCY.observe(seconds, model=model_name, stage=stage, outcome='timeout' if is_timeout_error(e) else 'error')
+            delay = _handle_llm_error(request, limiter, e, stage, policy, retries, breaker.state == CIRCUIT_OPEN)
+            if delay is None:
+                return None, is_transient_error(e)
+        await asyncio.sleep(delay)
+        retries += 1
+    seconds = time.perf_counter() - started
+    breaker.record(None, seconds)
+    _record_llm_metrics(request, stage, seconds, usage)
+    used_tokens = usage.get('total_tokens')
+    limiter.record_usage(estimated, used_tokens)
+    _record_llm_usage(used_tokens if used_tokens is not None else estimated)
+    if response_key:
+        get_response_cache().put(response_key, content, used_tokens, model_name)
+    return content, False
 
 def interactive_mode():
-    llms_config = load_llms_config()
-    if not llms_config:
+    model_list = get_model_registry().names()
+    if not model_list:
         print("No models configured in llms_config.json")
         return
 
-    model_list = list(llms_config.keys())
     if len(model_list) < 3:
         print("Need at least 3 models configured.")
         return
@@ -503,9 +875,10 @@ Database Schema for SAT Questions:
 
                 for cycle in range(max_cycles_per_question):
                     print(f"\n--- Cycle {cycle + 1} ---")
+                    _set_cache_sample(unit_key(category, subtopic, q_num), cycle)
 
                     # LLM1: Create question based on category
-                    result1 = query_llm(models[0], prompt1, context, max_tokens, temperature)
+                    result1 = query_llm(models[0], prompt1, context, max_tokens, temperature, stage='llm1')
                     if not result1:
                         print("No response from LLM 1.")
                         continue
@@ -542,7 +915,7 @@ Database Schema for SAT Questions:
                     if spec is None and ((category == "Math" and ("Geometry" in subtopic or subtopic in ["Graph Interpretation", "Trigonometry – Sine, Cosine, Tangent"])) or (category == "Reading" and subtopic == "Data Interpretation (Charts, Tables)")):
                         # LLM2: Create Vega spec
                         prompt2 = f"Create a valid Vega JSON spec ONLY for the diagram described as: {diagram_desc}. Do NOT include any explanations or extra text. The output must be a valid Vega JSON spec. Double check it twice to ensure it's 100% accurate."
-                        result2 = query_llm(models[1], prompt2, context, max_tokens, temperature)
+                        result2 = query_llm(models[1], prompt2, context, max_tokens, temperature, stage='llm2')
                         if not result2:
                             print("No response from LLM 2.")
                             continue
@@ -570,7 +943,7 @@ Database Schema for SAT Questions:
                             # Try to fix the spec
                             print(f"Vega spec error: {error_msg}")
                             prompt2_fix = f"The previous Vega spec was invalid: {error_msg}. Please fix it for the diagram described as: {diagram_desc}, and the question: {question}. Output only the corrected valid Vega JSON spec."
-                            result2_fix = query_llm(models[1], prompt2_fix, context, max_tokens, temperature)
+                            result2_fix = query_llm(models[1], prompt2_fix, context, max_tokens, temperature, stage='llm2_fix')
                             if result2_fix:
                                 print(f"LLM 2 fix attempt Response:\n{result2_fix}")
                                 json_match_fix = re.search(r'```json\s*(.*?)\s*```', result2_fix, re.DOTALL | re.IGNORECASE)
@@ -596,7 +969,7 @@ Database Schema for SAT Questions:
                     else:
                         check_prompt = f"Check the following work: Question: {question}, Explanation: {explanation}, Answers: {answers}. Verify if the question is accurate for SAT {category} {subtopic}. If something is wrong, describe what and suggest corrections. If all is correct, say 'All work is accurate.'"
 
-                    result3 = query_llm(models[2], check_prompt, context, max_tokens, temperature)
+                    result3 = query_llm(models[2], check_prompt, context, max_tokens, temperature, stage='llm3')
                     if not result3:
                         print("No response from LLM 3.")
                         continue
@@ -630,14 +1003,8 @@ Database Schema for SAT Questions:
                             'subtopic': subtopic,
                             'content': content
                         }
-                        print(f"🔄 Saving question to DuckSAT database...")
-                        question_id = store_question_in_ducksat(storage_data)
-                        if question_id:
-                            print(f"✅ Successfully stored in database with ID: {question_id}")
-                            question_data['question_id'] = question_id  # Store ID for reference
-                        else:
-                            print("❌ Failed to store in database, skipping question.")
-                            continue
+                        print(f"🔄 Queued question for DuckSAT database...")
+                        get_question_writer().submit(storage_data, question_data)
                     else:
                         print("⚠️  DuckSAT integration not available, skipping database storage.")
 
@@ -736,263 +1103,858 @@ const view{i} = new vega.View(vega.parse(spec{i})).renderer('canvas').initialize
         
         # Show database storage summary
         if DUCKSAT_INTEGRATION_AVAILABLE:
+            get_question_writer().flush()
             saved_count = sum(1 for q in questions_list if 'question_id' in q)
             print(f"\n📊 Database Storage Summary:")
             print(f"  ✅ Successfully saved: {saved_count}/{len(questions_list)} questions")
             if saved_count < len(questions_list):
                 print(f"  ❌ Failed to save: {len(questions_list) - saved_count} questions")
         
+        import webbrowser
         webbrowser.open(f'file://{os.path.abspath(filename)}')
     else:
         print("No questions were successfully generated.")
-def generate_questions(category, subtopic, num_questions=1, models=None, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, delay_minutes=0):
-    """
-    Generate SAT questions programmatically without user interaction.
-    Returns a dict with 'questions' list containing generated question data.
-    """
-    llms_config = load_llms_config()
-    if not llms_config:
-        return {'error': 'No models configured in llms_config.json'}
+def build_generation_prompts(category, subtopic):
+    """Return (context, prompt1) for LLM1 question generation"""
+    if category == "Reading":
+        context = f"You are an expert SAT reading question creator specializing in {subtopic.lower()}. Create authentic SAT-style reading questions that test students' comprehension and analytical skills. Always specify the correct answer as an index (0-3) and format options as a JSON array."
+        if subtopic == "Data Interpretation (Charts, Tables)":
+            prompt1 = f"Create a SAT reading question focused on {subtopic.lower()}. Include a data table or chart description, a passage that references the data, and a question with explanation. Format: Passage:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+        else:
+            prompt1 = f"Create a SAT reading question focused on {subtopic.lower()}. Include a passage (200-400 words) and a question that tests {subtopic.lower()}. Format: Passage:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+    elif category == "Writing":
+        context = f"You are an expert SAT writing question creator specializing in {subtopic.lower()}. Create questions that test grammar, style, and effective writing skills. Always specify the correct answer as an index (0-3) and format options as a JSON array."
+        prompt1 = f"Create a SAT writing question focused on {subtopic.lower()}. Include text that needs editing/improvement and a question about the best way to revise it. Format: Text to Edit:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+    else:  # Math
+        context = f"You are an expert SAT math question creator specializing in {subtopic.lower()}. Create challenging math questions with accurate solutions. Always specify the correct answer as an index (0-3) and format options as a JSON array."
+        if "Geometry" in subtopic or subtopic in ["Graph Interpretation", "Trigonometry – Sine, Cosine, Tangent"]:
+            prompt1 = f"Create a SAT math question focused on {subtopic.lower()}. Include a diagram description and question with explanation. Format: Diagram Description:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+        else:
+            prompt1 = f"Create a SAT math question focused on {subtopic.lower()} with explanation. Format: Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+    return context, prompt1
+
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+def build_json_generation_prompts(category, subtopic):
+    """Return (context, prompt1) asking LLM1 for a JSON object matching the Question schema"""
+    context, _ = build_generation_prompts(category, subtopic)
+    if category == "Reading":
+        passage_desc = "the reading passage (include the data table or chart description if the question uses data)"
+    elif category == "Writing":
+        passage_desc = "the text that needs editing/improvement"
+    elif needs_diagram(category, subtopic):
+        passage_desc = "a precise description of the diagram"
+    else:
+        passage_desc = "an empty string"
+    prompt1 = (
+        f"Create a SAT {category.lower()} question focused on {subtopic.lower()}. "
+        "Respond with a single JSON object and nothing else, with these keys: "
+        f'"passage" (string: {passage_desc}), "question" (string), '
+        '"options" (array of exactly 4 strings), "correctAnswer" (integer index 0-3 into options), '
+        '"explanation" (string), "wrongAnswerExplanations" (array of strings), '
+        '"difficulty" ("easy" | "medium" | "hard"), "category" (string), "subtopic" (string), '
+        '"timeEstimate" (integer seconds), "source" (string), "tags" (array of strings).'
+    )
+    return context, prompt1
+
+def build_llm1_prompts(category, subtopic, output_format='text'):
+    if output_format == 'json':
+        return build_json_generation_prompts(category, subtopic)
+    return build_generation_prompts(category, subtopic)
+
+def build_json_repair_prompt(errors, previous_response):
+    return (
+        f"Your previous JSON response did not match the required schema: {'; '.join(errors)}. "
+        f"Previous response: {previous_response}\n"
+        "Return only the corrected JSON object."
+    )
+
+def needs_diagram(category, subtopic):
+    """Only Math geometry/graph questions and Reading data interpretation get a Vega spec"""
+    return ((category == "Math" and ("Geometry" in subtopic or subtopic in ["Graph Interpretation", "Trigonometry – Sine, Cosine, Tangent"]))
+            or (category == "Reading" and subtopic == "Data Interpretation (Charts, Tables)"))
+
+def diagram_description(category, subtopic, content):
+    if category == "Math" or (category == "Reading" and subtopic == "Data Interpretation (Charts, Tables)"):
+        return content
+    return ""
+
+def build_diagram_prompt(diagram_desc):
+    return f"Create a valid Vega JSON spec ONLY for the diagram described as: {diagram_desc}. Do NOT include any explanations or extra text. The output must be a valid Vega JSON spec. Double check it twice to ensure it's 100% accurate."
+
+def build_diagram_fix_prompt(error_msg, diagram_desc, question):
+    return f"The previous Vega spec was invalid: {error_msg}. Please fix it for the diagram described as: {diagram_desc}, and the question: {question}. Output only the corrected valid Vega JSON spec."
+
+VEGA_REQUIRED_KEYS = ["$schema", "marks"]
+
+def extract_vega_spec(result):
+    """Pull a Vega spec out of an LLM2 response. Returns (spec, error_msg); spec is None if invalid."""
+    spec, error_msg = _parse_vega_spec(result)
+    if spec is None:
+        PARSE_FAILURES.inc(stage='vega_spec')
+    return spec, error_msg
+
+def _parse_vega_spec(result):
+    json_match = re.search(r'```json\s*(.*?)\s*```', result, re.DOTALL | re.IGNORECASE)
+    if json_match:
+        spec_str = json_match.group(1)
+    else:
+        spec_str = result
+    try:
+        spec = json.loads(spec_str)
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {str(e)}"
+    # Validate Vega spec keys
+    if not isinstance(spec, dict):
+        return None, "Spec is not a JSON object"
+    missing = [k for k in VEGA_REQUIRED_KEYS if k not in spec]
+    if missing:
+        return None, f"Missing required keys: {', '.join(missing)}"
+    return spec, ""
+
+def build_check_prompt(category, subtopic, spec, diagram_desc, question, explanation, answers):
+    if spec:
+        return f"Check the following work: Vega spec: {json.dumps(spec)}, Diagram description: {diagram_desc}, Question: {question}, Explanation: {explanation}, Answers: {answers}. Verify if LLM1 and LLM2 did their work accurately. If something is wrong, describe what and suggest corrections. If all is correct, say 'All work is accurate.'"
+    return f"Check the following work: Question: {question}, Explanation: {explanation}, Answers: {answers}. Verify if the question is accurate for SAT {category} {subtopic}. If something is wrong, describe what and suggest corrections. If all is correct, say 'All work is accurate.'"
+
+def checker_rejected(result3):
+    return "wrong" in result3.lower() or "incorrect" in result3.lower()
+
+def build_question_data(category, subtopic, parsed, spec):
+    """Assemble the accepted question and the payload for the DuckSAT question store"""
+    content = parsed["content"]
+    answers = json.dumps(parsed["options"])  # Store options as JSON string
+    question_data = {
+        "category": category,
+        "subtopic": subtopic,
+        "question": parsed["question"],
+        "explanation": parsed["explanation"],
+        "answers": answers,
+        "content": content,  # passage for reading, text_to_edit for writing, diagram_desc for math
+        "spec": spec
+    }
+    storage_data = {
+        'question': parsed["question"],
+        'explanation': parsed["explanation"],
+        'answers': answers,
+        'spec': spec,
+        'diagram_desc': diagram_description(category, subtopic, content),
+        'category': category,
+        'subtopic': subtopic,
+        'content': content
+    }
+    return question_data, storage_data
+
+def resolve_models(models):
+    """Validate the requested [LLM1, LLM2, LLM3] models. Returns (models, error)."""
+    model_list = get_model_registry().names()
+    if not model_list:
+        return None, 'No models configured in llms_config.json'
 
-    model_list = list(llms_config.keys())
     if len(model_list) < 3:
-        return {'error': 'Need at least 3 models configured.'}
+        return None, 'Need at least 3 models configured.'
 
     # Use provided models or defaults
     if not models or len(models) < 3:
         models = [model_list[0]] * 3  # Use first model for all if not specified
 
     # Validate models exist
+    models = list(models)
     for i, model in enumerate(models):
         if model not in model_list:
             models[i] = model_list[0]  # Fallback to first model
+    return models, None
 
-    questions_list = []
+def validate_subtopic(category, subtopic):
+    if category not in SAT_SUBTOPICS:
+        return f'Invalid category: {category}. Must be one of {list(SAT_SUBTOPICS.keys())}'
+    if subtopic not in SAT_SUBTOPICS[category]:
+        return f'Invalid subtopic: {subtopic}. Must be one of {SAT_SUBTOPICS[category]}'
+    return None
 
-    # SAT Subtopics
-    sat_subtopics = {
-        "Reading": [
-            "Comprehension",
-            "Vocabulary in Context",
-            "Inference",
-            "Main Idea & Supporting Details",
-            "Text Structure & Purpose",
-            "Rhetorical Effect",
-            "Data Interpretation (Charts, Tables)"
-        ],
-        "Writing": [
-            "Sentence Structure",
-            "Grammar & Usage",
-            "Punctuation",
-            "Conciseness & Clarity",
-            "Logical Flow",
-            "Tone & Style",
-            "Transitions & Organization"
-        ],
-        "Math": [
-            "Linear Equations",
-            "Inequalities",
-            "Systems of Equations",
-            "Quadratic Equations",
-            "Polynomials",
-            "Rational Expressions",
-            "Exponents & Radicals",
-            "Ratios & Proportions",
-            "Percentages",
-            "Statistics & Probability",
-            "Graph Interpretation",
-            "Geometry – Angles",
-            "Geometry – Triangles",
-            "Geometry – Circles",
-            "Geometry – Coordinate Geometry",
-            "Trigonometry – Sine, Cosine, Tangent"
-        ]
-    }
+def generate_questions(category, subtopic, num_questions=1, models=None, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, delay_minutes=0, output_format='text', wait_for_storage=False, checkpoint=None, speculative_candidates=1, on_question=None, on_event=None):
+    """
+    Generate SAT questions programmatically without user interaction.
+    output_format='json' asks LLM1 for a schema-validated JSON object instead of the labelled text format.
+    Accepted questions are stored by the background question writer; pass
+    wait_for_storage=True to return only after they are written (and have a question_id).
+    With a BatchCheckpoint, completed questions are skipped and partial ones resume
+    from the last finished LLM stage.
+    speculative_candidates=k > 1 runs k candidates per question in parallel and keeps the
+    first accepted one (see generate_question_speculative); the result then also has a
+    'speculation' list with per-question latency/cost reports. It can't be combined with
+    checkpoint, on_event or delay_minutes (ValueError).
+    on_question(question_data) is called as soon as each question is accepted.
+    on_event(name, data) reports progress per question: 'llm1_done', 'spec_done',
+    'check_done' (with accepted), 'question_stored' once the writer has stored it, or
+    'question_failed' when it ran out of cycles.
+    Returns a dict with 'questions' list containing generated question data.
+    """
+    if speculative_candidates > 1:
+        # The speculative engine has no per-stage events, partial resume or pacing
+        unsupported = [name for name, value in (('checkpoint', checkpoint), ('on_event', on_event), ('delay_minutes', delay_minutes)) if value]
+        if unsupported:
+            raise ValueError(f"speculative_candidates > 1 does not support {', '.join(unsupported)}")
+
+        async def _run_speculative():
+            try:
+                return await generate_questions_speculative(
+                    category, subtopic, num_questions, models, speculative_candidates, temperature,
+                    max_tokens, max_cycles_per_question, output_format=output_format,
+                    wait_for_storage=wait_for_storage, on_question=on_question
+                )
+            finally:
+                await aclose_loop_clients()
+        return asyncio.run(_run_speculative())
+
+    models, error = resolve_models(models)
+    if error:
+        return {'error': error}
 
     # Validate category and subtopic
-    if category not in sat_subtopics:
-        return {'error': f'Invalid category: {category}. Must be one of {list(sat_subtopics.keys())}'}
+    error = validate_subtopic(category, subtopic)
+    if error:
+        return {'error': error}
 
-    if subtopic not in sat_subtopics[category]:
-        return {'error': f'Invalid subtopic: {subtopic}. Must be one of {sat_subtopics[category]}'}
+    context, prompt1 = build_llm1_prompts(category, subtopic, output_format)
+    response_format = JSON_RESPONSE_FORMAT if output_format == 'json' else None
+    questions_list = []
+    pending_writes = []
 
-    # Set context and prompts based on category and subtopic
-    if category == "Reading":
-        context = f"You are an expert SAT reading question creator specializing in {subtopic.lower()}. Create authentic SAT-style reading questions that test students' comprehension and analytical skills. Always specify the correct answer as an index (0-3) and format options as a JSON array."
-        if subtopic == "Data Interpretation (Charts, Tables)":
-            prompt1 = f"Create a SAT reading question focused on {subtopic.lower()}. Include a data table or chart description, a passage that references the data, and a question with explanation. Format: Passage:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
-        else:
-            prompt1 = f"Create a SAT reading question focused on {subtopic.lower()}. Include a passage (200-400 words) and a question that tests {subtopic.lower()}. Format: Passage:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
-    elif category == "Writing":
-        context = f"You are an expert SAT writing question creator specializing in {subtopic.lower()}. Create questions that test grammar, style, and effective writing skills. Always specify the correct answer as an index (0-3) and format options as a JSON array."
-        prompt1 = f"Create a SAT writing question focused on {subtopic.lower()}. Include text that needs editing/improvement and a question about the best way to revise it. Format: Text to Edit:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
-    else:  # Math
-        context = f"You are an expert SAT math question creator specializing in {subtopic.lower()}. Create challenging math questions with accurate solutions. Always specify the correct answer as an index (0-3) and format options as a JSON array."
-        if "Geometry" in subtopic or subtopic in ["Graph Interpretation", "Trigonometry – Sine, Cosine, Tangent"]:
-            prompt1 = f"Create a SAT math question focused on {subtopic.lower()}. Include a diagram description and question with explanation. Format: Diagram Description:, Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
-        else:
-            prompt1 = f"Create a SAT math question focused on {subtopic.lower()} with explanation. Format: Question:, Explanation:, Correct Answer Index:, Options: [JSON array of 4 options]"
+    def emit(name, q_num, cycle, **data):
+        if on_event:
+            on_event(name, {'question_number': q_num + 1, 'cycle': cycle + 1, **data})
 
     for q_num in range(num_questions):
-        question_data = None
-
-        for cycle in range(max_cycles_per_question):
-            # LLM1: Create question based on category
-            result1 = query_llm(models[0], prompt1, context, max_tokens, temperature)
-            if not result1:
+        with span('question', category=category, subtopic=subtopic, question_number=q_num + 1) as question_span:
+            question_data = None
+            unit = unit_key(category, subtopic, q_num)
+            if checkpoint and checkpoint.is_complete(unit):
+                print(f"⏭️  Question {q_num + 1} for {subtopic} already completed, skipping.")
+                questions_list.append(checkpoint.completed_question(unit))
                 continue
-            print(f"LLM 1 ({models[0]}) Response:\n{result1}")
-
-            parsed = parse_llm1(result1, category)
-            content = parsed["content"]
-            question = parsed["question"]
-            explanation = parsed["explanation"]
-            options = parsed["options"]
-            correct_answer = parsed["correct_answer"]
-            answers = json.dumps(options)  # Store options as JSON string
-
-            # Handle different content types
-            if category == "Reading":
-                if subtopic == "Data Interpretation (Charts, Tables)":
-                    # For data interpretation, we need to create a chart/table spec
-                    diagram_desc = content  # This contains chart/table description
-                    spec = None
-                    prompt2 = f"Create a valid Vega JSON spec ONLY for the chart/table described as: {diagram_desc}. Do NOT include any explanations or extra text. The output must be a valid Vega JSON spec."
+            resume = checkpoint.partial(unit) if checkpoint else None
+
+            for cycle in range(max_cycles_per_question):
+                question_span.inherit(cycle=cycle + 1)
+                _set_cache_sample(unit, cycle)
+                if cycle:
+                    GENERATION_RETRIES.inc(category=category)
+                saved, resume = resume, None
+                if saved and saved.get('parsed'):
+                    # LLM1 already passed before the restart
+                    parsed = saved['parsed']
+                    print("♻️  Resuming from checkpoint with the saved LLM1 question.")
                 else:
-                    # Regular reading passage - no diagram needed
-                    diagram_desc = ""
-                    spec = None
-            elif category == "Writing":
-                # Writing questions don't need diagrams
-                diagram_desc = ""
-                spec = None
-            else:  # Math
-                diagram_desc = content
+                    # LLM1: Create question based on category
+                    result1 = query_llm(models[0], prompt1, context, max_tokens, temperature, response_format=response_format, stage='llm1')
+                    if not result1:
+                        continue
+                    print(f"LLM 1 ({models[0]}) Response:\n{result1}")
+
+                    if output_format == 'json':
+                        parsed, errors = parse_llm1_json(result1, category)
+                        if errors:
+                            # Ask LLM1 to repair its JSON instead of burning a whole cycle
+                            print(f"LLM1 JSON failed validation: {'; '.join(errors)}")
+                            result1 = query_llm(models[0], build_json_repair_prompt(errors, result1), context, max_tokens, temperature, response_format=response_format, stage='llm1_repair')
+                            if not result1:
+                                continue
+                            parsed, errors = parse_llm1_json(result1, category)
+                            if errors:
+                                print("Still invalid JSON after repair, restarting cycle.")
+                                continue
+                    else:
+                        parsed = parse_llm1(result1, category)
+                    if checkpoint:
+                        checkpoint.save_partial(unit, parsed)
+                emit('llm1_done', q_num, cycle)
+                question = parsed["question"]
+                explanation = parsed["explanation"]
+                answers = json.dumps(parsed["options"])
+                diagram_desc = diagram_description(category, subtopic, parsed["content"])
                 spec = None
 
-            # Only create Vega spec for Math geometry questions or Reading data interpretation
-            if spec is None and ((category == "Math" and ("Geometry" in subtopic or subtopic in ["Graph Interpretation", "Trigonometry – Sine, Cosine, Tangent"])) or (category == "Reading" and subtopic == "Data Interpretation (Charts, Tables)")):
-                # LLM2: Create Vega spec
-                prompt2 = f"Create a valid Vega JSON spec ONLY for the diagram described as: {diagram_desc}. Do NOT include any explanations or extra text. The output must be a valid Vega JSON spec. Double check it twice to ensure it's 100% accurate."
-                result2 = query_llm(models[1], prompt2, context, max_tokens, temperature)
-                if not result2:
+                # Only create Vega spec for Math geometry questions or Reading data interpretation
+                if needs_diagram(category, subtopic):
+                    if saved and saved.get('spec') is not None:
+                        spec = saved['spec']
+                    else:
+                        # LLM2: Create Vega spec
+                        result2 = query_llm(models[1], build_diagram_prompt(diagram_desc), context, max_tokens, temperature, stage='llm2')
+                        if not result2:
+                            continue
+                        print(f"LLM 2 ({models[1]}) Response:\n{result2}")
+
+                        spec, error_msg = extract_vega_spec(result2)
+                        if spec is None:
+                            # Try to fix the spec
+                            print(f"Vega spec error: {error_msg}")
+                            result2_fix = query_llm(models[1], build_diagram_fix_prompt(error_msg, diagram_desc, question), context, max_tokens, temperature, stage='llm2_fix')
+                            if not result2_fix:
+                                print("No fix response, restarting cycle.")
+                                continue
+                            print(f"LLM 2 fix attempt Response:\n{result2_fix}")
+                            spec, error_msg = extract_vega_spec(result2_fix)
+                            if spec is None:
+                                print(f"Still invalid after fix ({error_msg}), restarting cycle.")
+                                continue
+                        if checkpoint:
+                            checkpoint.save_partial(unit, parsed, spec)
+                    emit('spec_done', q_num, cycle)
+
+                # LLM3: Check work
+                check_prompt = build_check_prompt(category, subtopic, spec, diagram_desc, question, explanation, answers)
+                result3 = query_llm(models[2], check_prompt, context, max_tokens, temperature, stage='llm3')
+                if not result3:
+                    continue
+                print(f"LLM 3 ({models[2]}) Response:\n{result3}")
+
+                accepted = not checker_rejected(result3)
+                emit('check_done', q_num, cycle, accepted=accepted)
+                if not accepted:
+                    CHECKER_REJECTIONS.inc(model=models[2])
+                    print("LLM3 found issues, repeating cycle.")
+                    if checkpoint:
+                        checkpoint.clear_partial(unit)
                     continue
-                print(f"LLM 2 ({models[1]}) Response:\n{result2}")
 
-                # Extract and validate Vega spec
-                json_match = re.search(r'```json\s*(.*?)\s*```', result2, re.DOTALL | re.IGNORECASE)
-                if json_match:
-                    spec_str = json_match.group(1)
+                # Process complete
+                print("Process complete for this question.")
+                question_data, storage_data = build_question_data(category, subtopic, parsed, spec)
+
+                # Hand off to the background writer; question_id is filled in once it's stored
+                if DUCKSAT_INTEGRATION_AVAILABLE:
+                    print(f"🔄 Queued question for DuckSAT database...")
+                    pending = get_question_writer().submit(storage_data, question_data)
+                    pending_writes.append(pending)
+                    if on_event:
+                        pending.add_done_callback(lambda p, q_num=q_num, cycle=cycle: emit(
+                            'question_stored', q_num, cycle, stored=bool(p.question_id), question=p.question_data
+                        ))
                 else:
-                    spec_str = result2
-                spec = None
-                error_msg = ""
-                try:
-                    spec = json.loads(spec_str)
-                    # Validate Vega spec keys
-                    required_keys = ["$schema", "marks"]
-                    if not all(key in spec for key in required_keys):
-                        error_msg = f"Missing required keys: {', '.join([k for k in required_keys if k not in spec])}"
-                        spec = None
-                except json.JSONDecodeError as e:
-                    error_msg = f"Invalid JSON: {str(e)}"
+                    print("⚠️  DuckSAT integration not available, skipping database storage.")
+                    emit('question_stored', q_num, cycle, stored=False, question=question_data)
+                if checkpoint:
+                    checkpoint.complete(unit, question_data)
 
-                if spec is None:
-                    # Try to fix the spec
-                    print(f"Vega spec error: {error_msg}")
-                    prompt2_fix = f"The previous Vega spec was invalid: {error_msg}. Please fix it for the diagram described as: {diagram_desc}, and the question: {question}. Output only the corrected valid Vega JSON spec."
-                    result2_fix = query_llm(models[1], prompt2_fix, context, max_tokens, temperature)
-                    if result2_fix:
-                        print(f"LLM 2 fix attempt Response:\n{result2_fix}")
-                        json_match_fix = re.search(r'```json\s*(.*?)\s*```', result2_fix, re.DOTALL | re.IGNORECASE)
-                        if json_match_fix:
-                            spec_str = json_match_fix.group(1)
-                        else:
-                            spec_str = result2_fix
-                        try:
-                            spec = json.loads(spec_str)
-                            if not all(key in spec for key in required_keys):
-                                print("Still invalid after fix, restarting cycle.")
-                                continue
-                        except json.JSONDecodeError:
-                            print("Still invalid JSON after fix, restarting cycle.")
-                            continue
-                    else:
-                        print("No fix response, restarting cycle.")
-                        continue
+                break
 
-            # LLM3: Check work
-            if spec:
-                check_prompt = f"Check the following work: Vega spec: {json.dumps(spec)}, Diagram description: {diagram_desc}, Question: {question}, Explanation: {explanation}, Answers: {answers}. Verify if LLM1 and LLM2 did their work accurately. If something is wrong, describe what and suggest corrections. If all is correct, say 'All work is accurate.'"
+            question_span.set_attributes(cycles=cycle + 1, accepted=bool(question_data))
+            if question_data:
+                questions_list.append(question_data)
+                if on_question:
+                    on_question(question_data)
             else:
-                check_prompt = f"Check the following work: Question: {question}, Explanation: {explanation}, Answers: {answers}. Verify if the question is accurate for SAT {category} {subtopic}. If something is wrong, describe what and suggest corrections. If all is correct, say 'All work is accurate.'"
+                emit('question_failed', q_num, max_cycles_per_question - 1)
 
-            result3 = query_llm(models[2], check_prompt, context, max_tokens, temperature)
-            if not result3:
-                continue
-            print(f"LLM 3 ({models[2]}) Response:\n{result3}")
+        # Add delay between questions if specified
+        if question_data and delay_minutes > 0 and q_num < num_questions - 1:
+            print(f"Waiting {delay_minutes} minutes before next question...")
+            time.sleep(delay_minutes * 60)
+    _cache_sample.set(None)
 
-            if "wrong" in result3.lower() or "incorrect" in result3.lower():
-                print("LLM3 found issues, repeating cycle.")
+    if wait_for_storage:
+        for pending in pending_writes:
+            pending.wait()
+    return {'questions': questions_list}
+
+class ConcurrencyLimits:
+    """
+    Bounds in-flight LLM calls for the async engine: one global limit across all
+    models plus a per-model limit (an int for every model, or a {model: n} dict).
+    """
+    def __init__(self, max_concurrency=16, per_model_concurrency=4):
+        self.max_concurrency = max_concurrency
+        self.per_model_concurrency = per_model_concurrency
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_model = {}
+
+    def _model_semaphore(self, model_name):
+        semaphore = self._per_model.get(model_name)
+        if semaphore is None:
+            if isinstance(self.per_model_concurrency, dict):
+                limit = self.per_model_concurrency.get(model_name, self.max_concurrency)
+            else:
+                limit = self.per_model_concurrency
+            semaphore = asyncio.Semaphore(limit)
+            self._per_model[model_name] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self, model_name):
+        """Hold one of model_name's slots and one global slot"""
+        async with self._model_semaphore(model_name):
+            async with self._global:
+                yield
+
+    async def query(self, model_name, prompt, context, max_tokens, temperature, image_b64=None, response_format=None, stage='query'):
+        return await aquery_llm(model_name, prompt, context, max_tokens, temperature, image_b64, response_format, stage, limits=self)
+
+async def _llm1_stage(limits, models, category, context, prompt1, max_tokens, temperature, output_format='text', label=""):
+    """LLM1: draft a question; returns the parsed question or None. Invalid JSON replies get one repair attempt."""
+    response_format = JSON_RESPONSE_FORMAT if output_format == 'json' else None
+    result1 = await limits.query(models[0], prompt1, context, max_tokens, temperature, response_format=response_format, stage='llm1')
+    if not result1:
+        return None
+    print(f"{label}LLM 1 ({models[0]}) Response:\n{result1}")
+
+    if output_format != 'json':
+        return parse_llm1(result1, category)
+    parsed, errors = parse_llm1_json(result1, category)
+    if errors:
+        print(f"{label}LLM1 JSON failed validation: {'; '.join(errors)}")
+        result1 = await limits.query(models[0], build_json_repair_prompt(errors, result1), context, max_tokens, temperature, response_format=response_format, stage='llm1_repair')
+        if not result1:
+            return None
+        parsed, errors = parse_llm1_json(result1, category)
+        if errors:
+            print(f"{label}Still invalid JSON after repair, restarting cycle.")
+            return None
+    return parsed
+
+async def _llm2_stage(limits, models, category, subtopic, parsed, context, max_tokens, temperature, label=""):
+    """LLM2: Vega spec for the question's diagram, with one fix attempt; returns the spec or None"""
+    diagram_desc = diagram_description(category, subtopic, parsed["content"])
+    result2 = await limits.query(models[1], build_diagram_prompt(diagram_desc), context, max_tokens, temperature, stage='llm2')
+    if not result2:
+        return None
+    print(f"{label}LLM 2 ({models[1]}) Response:\n{result2}")
+
+    spec, error_msg = extract_vega_spec(result2)
+    if spec is None:
+        print(f"{label}Vega spec error: {error_msg}")
+        result2_fix = await limits.query(models[1], build_diagram_fix_prompt(error_msg, diagram_desc, parsed["question"]), context, max_tokens, temperature, stage='llm2_fix')
+        if not result2_fix:
+            print(f"{label}No fix response, restarting cycle.")
+            return None
+        spec, error_msg = extract_vega_spec(result2_fix)
+        if spec is None:
+            print(f"{label}Still invalid after fix ({error_msg}), restarting cycle.")
+            return None
+    return spec
+
+async def _llm3_stage(limits, models, category, subtopic, parsed, spec, context, max_tokens, temperature, label=""):
+    """LLM3: check the question; returns True (accepted), False (rejected) or None (no response)"""
+    diagram_desc = diagram_description(category, subtopic, parsed["content"])
+    check_prompt = build_check_prompt(category, subtopic, spec, diagram_desc, parsed["question"], parsed["explanation"], json.dumps(parsed["options"]))
+    result3 = await limits.query(models[2], check_prompt, context, max_tokens, temperature, stage='llm3')
+    if not result3:
+        return None
+    print(f"{label}LLM 3 ({models[2]}) Response:\n{result3}")
+
+    if checker_rejected(result3):
+        CHECKER_REJECTIONS.inc(model=models[2])
+        print(f"{label}LLM3 found issues, repeating cycle.")
+        return False
+    return True
+
+async def _accept_question_async(category, subtopic, parsed, spec, wait_for_storage=False, checkpoint=None, unit=None, label=""):
+    """Hand an accepted question to the question writer and mark its unit complete; returns question_data"""
+    print(f"{label}Process complete for this question.")
+    question_data, storage_data = build_question_data(category, subtopic, parsed, spec)
+
+    if DUCKSAT_INTEGRATION_AVAILABLE:
+        # psycopg2 and selenium are blocking; the background writer keeps them off the event loop
+        pending = await get_question_writer().asubmit(storage_data, question_data)
+        if wait_for_storage:
+            await asyncio.to_thread(pending.wait)
+    else:
+        print("⚠️  DuckSAT integration not available, skipping database storage.")
+    if checkpoint:
+        await checkpoint.acomplete(unit, question_data)
+    return question_data
+
+@traced('question')
+async def _generate_one_question_async(category, subtopic, models, context, prompt1, temperature, max_tokens, max_cycles_per_question, limits, label="", output_format='text', wait_for_storage=False, checkpoint=None, unit=None):
+    """Async version of one question's LLM1 -> LLM2 -> LLM3 cycle loop; returns question_data or None"""
+    question_span = current_span()
+    question_span.set_attributes(category=category, subtopic=subtopic, unit=unit)
+    if checkpoint and checkpoint.is_complete(unit):
+        print(f"{label}⏭️  Already completed, skipping.")
+        return checkpoint.completed_question(unit)
+    resume = checkpoint.partial(unit) if checkpoint else None
+    for cycle in range(max_cycles_per_question):
+        question_span.inherit(cycle=cycle + 1)
+        _set_cache_sample(unit, cycle)
+        if cycle:
+            GENERATION_RETRIES.inc(category=category)
+        saved, resume = resume, None
+        if saved and saved.get('parsed'):
+            # LLM1 already passed before the restart
+            parsed = saved['parsed']
+            print(f"{label}♻️  Resuming from checkpoint with the saved LLM1 question.")
+        else:
+            parsed = await _llm1_stage(limits, models, category, context, prompt1, max_tokens, temperature, output_format, label)
+            if parsed is None:
                 continue
+            if checkpoint:
+                await checkpoint.asave_partial(unit, parsed)
 
-            # Process complete
-            print("Process complete for this question.")
-            question_data = {
-                "category": category,
-                "subtopic": subtopic,
-                "question": question,
-                "explanation": explanation,
-                "answers": answers,
-                "content": content,  # passage for reading, text_to_edit for writing, diagram_desc for math
-                "spec": spec
-            }
-
-            # Store in DuckSAT database BEFORE generating HTML
-            if DUCKSAT_INTEGRATION_AVAILABLE:
-                storage_data = {
-                    'question': question,
-                    'explanation': explanation,
-                    'answers': answers,
-                    'spec': spec,
-                    'diagram_desc': content if category == 'Math' or (category == 'Reading' and subtopic == "Data Interpretation (Charts, Tables)") else '',
-                    'category': category,
-                    'subtopic': subtopic,
-                    'content': content
-                }
-                print(f"🔄 Saving question to DuckSAT database...")
-                question_id = store_question_in_ducksat(storage_data)
-                if question_id:
-                    print(f"✅ Successfully stored in database with ID: {question_id}")
-                    question_data['question_id'] = question_id  # Store ID for reference
-                else:
-                    print("❌ Failed to store in database, skipping question.")
+        spec = None
+        if needs_diagram(category, subtopic):
+            if saved and saved.get('spec') is not None:
+                spec = saved['spec']
+            else:
+                spec = await _llm2_stage(limits, models, category, subtopic, parsed, context, max_tokens, temperature, label)
+                if spec is None:
                     continue
+                if checkpoint:
+                    await checkpoint.asave_partial(unit, parsed, spec)
+
+        accepted = await _llm3_stage(limits, models, category, subtopic, parsed, spec, context, max_tokens, temperature, label)
+        if accepted is None:
+            continue
+        if not accepted:
+            if checkpoint:
+                await checkpoint.aclear_partial(unit)
+            continue
+
+        question_span.set_attributes(cycles=cycle + 1, accepted=True)
+        return await _accept_question_async(category, subtopic, parsed, spec, wait_for_storage, checkpoint, unit, label)
+    question_span.set_attributes(cycles=max_cycles_per_question, accepted=False)
+    return None
+
+async def generate_questions_async(category, subtopic, num_questions=1, models=None, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, max_concurrency=16, per_model_concurrency=4, limits=None, output_format='text', wait_for_storage=False, checkpoint=None):
+    """
+    Async engine for generate_questions: all questions for the subtopic run
+    concurrently over the async LLM clients. In-flight LLM calls are bounded by
+    `limits` (a ConcurrencyLimits shared across calls) or, if not given, by
+    max_concurrency / per_model_concurrency. Takes the same optional checkpoint.
+    Returns the same {'questions': [...]} / {'error': ...} dict as generate_questions.
+    """
+    models, error = resolve_models(models)
+    if error:
+        return {'error': error}
+
+    error = validate_subtopic(category, subtopic)
+    if error:
+        return {'error': error}
+
+    if limits is None:
+        limits = ConcurrencyLimits(max_concurrency, per_model_concurrency)
+
+    context, prompt1 = build_llm1_prompts(category, subtopic, output_format)
+    tasks = [
+        _generate_one_question_async(
+            category, subtopic, models, context, prompt1, temperature, max_tokens,
+            max_cycles_per_question, limits, label=f"[{subtopic} #{q_num + 1}] ",
+            output_format=output_format, wait_for_storage=wait_for_storage,
+            checkpoint=checkpoint, unit=unit_key(category, subtopic, q_num)
+        )
+        for q_num in range(num_questions)
+    ]
+    results = await asyncio.gather(*tasks)
+    return {'questions': [q for q in results if q]}
+
+DEFAULT_STAGE_WORKERS = (4, 2, 4)  # LLM1, LLM2, LLM3
+
+def parse_stage_workers(value):
+    """'4,2,4' -> (4, 2, 4): worker counts for the LLM1, LLM2 and LLM3 pipeline stages"""
+    counts = tuple(int(n) for n in str(value).split(','))
+    if len(counts) != 3 or min(counts) < 1:
+        raise ValueError(f"Expected three positive worker counts for LLM1,LLM2,LLM3, got '{value}'")
+    return counts
+
+class _PipelineItem:
+    """One question slot moving through the pipeline; parsed/spec are filled in stage by stage"""
+    def __init__(self, category, subtopic, index, context, prompt1, future):
+        self.category = category
+        self.subtopic = subtopic
+        self.unit = unit_key(category, subtopic, index)
+        self.label = f"[{subtopic} #{index + 1}] "
+        self.context = context
+        self.prompt1 = prompt1
+        self.future = future
+        self.cycle = 0
+        self.parsed = None
+        self.spec = None
+        # Workers switch between items, so each item carries its own question span
+        self.trace = start_span('question', category=category, subtopic=subtopic, question_number=index + 1, unit=self.unit)
+        self.trace.inherit(cycle=1)
+
+    def finish(self, question_data, cycles):
+        self.trace.set_attributes(cycles=cycles, accepted=bool(question_data))
+        self.trace.end()
+        self.future.set_result(question_data)
+
+async def run_question_pipeline(units, models, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, stage_workers=DEFAULT_STAGE_WORKERS, limits=None, output_format='text', wait_for_storage=False, checkpoint=None):
+    """
+    Staged engine: LLM1, LLM2 and LLM3 each get their own pool of workers with a
+    queue in between, so LLM1 drafts question N+1 while LLM2 builds the diagram
+    for N and LLM3 checks N-1. Steady-state throughput approaches that of the
+    slowest stage. A rejected or failed question goes back to the LLM1 queue
+    for its next cycle. The forward queues are bounded so LLM1 can't run far
+    ahead of the checker; the LLM1 queue is not, so retries never block.
+
+    units is a list of (category, subtopic, num_questions); returns
+    {(category, subtopic): [question_data, ...]} with failed questions dropped.
+    """
+    if limits is None:
+        limits = ConcurrencyLimits(max_concurrency=sum(stage_workers), per_model_concurrency=sum(stage_workers))
+    n1, n2, n3 = stage_workers
+    draft_queue = asyncio.Queue()
+    diagram_queue = asyncio.Queue(maxsize=n2 * 2)
+    check_queue = asyncio.Queue(maxsize=n3 * 2)
+    stage_stats = {name: {'items': 0, 'busy': 0.0} for name in ('LLM1', 'LLM2', 'LLM3')}
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+
+    items = []
+    resumed = []
+    for category, subtopic, num_questions in units:
+        context, prompt1 = build_llm1_prompts(category, subtopic, output_format)
+        for index in range(num_questions):
+            item = _PipelineItem(category, subtopic, index, context, prompt1, loop.create_future())
+            items.append(item)
+            if checkpoint and checkpoint.is_complete(item.unit):
+                print(f"{item.label}⏭️  Already completed, skipping.")
+                item.finish(checkpoint.completed_question(item.unit), 0)
+                continue
+            saved = checkpoint.partial(item.unit) if checkpoint else None
+            if saved and saved.get('parsed'):
+                print(f"{item.label}♻️  Resuming from checkpoint with the saved LLM1 question.")
+                item.parsed = saved['parsed']
+                item.spec = saved.get('spec')
+                # Enqueued once the workers run: the forward queues are bounded
+                queue = diagram_queue if needs_diagram(category, subtopic) and item.spec is None else check_queue
+                resumed.append((queue, item))
             else:
-                print("⚠️  DuckSAT integration not available, skipping database storage.")
-
-            break
+                draft_queue.put_nowait(item)
 
+    def restart(item):
+        item.cycle += 1
+        item.parsed = item.spec = None
+        if item.cycle >= max_cycles_per_question:
+            item.finish(None, item.cycle)
+        else:
+            GENERATION_RETRIES.inc(category=item.category)
+            item.trace.inherit(cycle=item.cycle + 1)
+            draft_queue.put_nowait(item)
+
+    async def llm1_step(item):
+        parsed = await _llm1_stage(limits, models, item.category, item.context, item.prompt1, max_tokens, temperature, output_format, item.label)
+        if parsed is None:
+            restart(item)
+            return
+        item.parsed = parsed
+        if checkpoint:
+            await checkpoint.asave_partial(item.unit, parsed)
+        if needs_diagram(item.category, item.subtopic):
+            await diagram_queue.put(item)
+        else:
+            await check_queue.put(item)
+
+    async def llm2_step(item):
+        spec = await _llm2_stage(limits, models, item.category, item.subtopic, item.parsed, item.context, max_tokens, temperature, item.label)
+        if spec is None:
+            restart(item)
+            return
+        item.spec = spec
+        if checkpoint:
+            await checkpoint.asave_partial(item.unit, item.parsed, spec)
+        await check_queue.put(item)
+
+    async def llm3_step(item):
+        accepted = await _llm3_stage(limits, models, item.category, item.subtopic, item.parsed, item.spec, item.context, max_tokens, temperature, item.label)
+        if not accepted:
+            if accepted is False and checkpoint:
+                await checkpoint.aclear_partial(item.unit)
+            restart(item)
+            return
+        question_data = await _accept_question_async(item.category, item.subtopic, item.parsed, item.spec, wait_for_storage, checkpoint, item.unit, item.label)
+        item.finish(question_data, item.cycle + 1)
+
+    async def worker(name, source, step):
+        while True:
+            item = await source.get()
+            stage_started = time.monotonic()
+            try:
+                _set_cache_sample(item.unit, item.cycle)
+                with use_span(item.trace):
+                    await step(item)
+            except Exception as e:
+                if not item.future.done():
+                    item.trace.record_exception(e)
+                    item.trace.end()
+                    item.future.set_exception(e)
+            finally:
+                stage_stats[name]['items'] += 1
+                stage_stats[name]['busy'] += time.monotonic() - stage_started
+                source.task_done()
+
+    workers = (
+        [asyncio.create_task(worker('LLM1', draft_queue, llm1_step)) for _ in range(n1)] +
+        [asyncio.create_task(worker('LLM2', diagram_queue, llm2_step)) for _ in range(n2)] +
+        [asyncio.create_task(worker('LLM3', check_queue, llm3_step)) for _ in range(n3)]
+    )
+    try:
+        for queue, item in resumed:
+            await queue.put(item)
+        results = await asyncio.gather(*[item.future for item in items])
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    elapsed = time.monotonic() - started
+    print(f"Pipeline finished in {elapsed:.1f}s with {n1}/{n2}/{n3} workers:")
+    for (name, stats), count in zip(stage_stats.items(), stage_workers):
+        utilization = stats['busy'] / (elapsed * count) if elapsed > 0 else 0
+        print(f"  {name}: {stats['items']} runs, {utilization:.0%} busy")
+
+    questions = {}
+    for item, question_data in zip(items, results):
+        bucket = questions.setdefault((item.category, item.subtopic), [])
         if question_data:
-            questions_list.append(question_data)
+            bucket.append(question_data)
+    return questions
+
+async def generate_questions_pipelined(category, subtopic, num_questions=1, models=None, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, stage_workers=DEFAULT_STAGE_WORKERS, limits=None, output_format='text', wait_for_storage=False, checkpoint=None):
+    """generate_questions on the staged pipeline engine; returns the same {'questions': [...]} / {'error': ...} dict"""
+    models, error = resolve_models(models)
+    if error:
+        return {'error': error}
+
+    error = validate_subtopic(category, subtopic)
+    if error:
+        return {'error': error}
+
+    questions = await run_question_pipeline(
+        [(category, subtopic, num_questions)], models, temperature, max_tokens,
+        max_cycles_per_question, stage_workers, limits, output_format, wait_for_storage, checkpoint
+    )
+    return {'questions': questions.get((category, subtopic), [])}
+
+async def _speculative_candidate(number, category, subtopic, models, context, prompt1, temperature, max_tokens, limits, output_format, label, unit=None):
+    """One LLM1 -> LLM2 -> LLM3 attempt; returns (number, parsed, spec, usage), with parsed None if it wasn't accepted"""
+    usage = track_llm_usage()
+    _set_cache_sample(unit, number)
+    parsed = await _llm1_stage(limits, models, category, context, prompt1, max_tokens, temperature, output_format, label)
+    if parsed is None:
+        return number, None, None, usage
+    spec = None
+    if needs_diagram(category, subtopic):
+        spec = await _llm2_stage(limits, models, category, subtopic, parsed, context, max_tokens, temperature, label)
+        if spec is None:
+            return number, None, None, usage
+    accepted = await _llm3_stage(limits, models, category, subtopic, parsed, spec, context, max_tokens, temperature, label)
+    return number, (parsed if accepted else None), spec, usage
+
+async def generate_question_speculative(category, subtopic, models, context, prompt1, k=3, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, limits=None, output_format='text', wait_for_storage=False, label="", on_question=None, unit=None):
+    """
+    Speculative retries: instead of running cycles one after another, launch k
+    candidates at once and check them as they finish. The first accepted one is
+    kept and the others are cancelled. Rounds of k continue until
+    max_cycles_per_question candidates have been tried, so the worst-case call
+    budget matches the sequential path while the typical latency is one cycle.
+    Returns (question_data or None, report) where report describes the
+    latency/cost trade-off: candidates launched and cancelled, calls and tokens
+    spent, and how many tokens went to discarded candidates.
+    """
+    if limits is None:
+        limits = ConcurrencyLimits(max_concurrency=k, per_model_concurrency=k)
+    started = time.monotonic()
+    report = {'k': k, 'launched': 0, 'cancelled': 0, 'rounds': 0, 'accepted_candidate': None,
+              'latency_s': None, 'calls': 0, 'tokens': 0, 'wasted_tokens': 0}
+    winner = None
+    usages = []
+
+    while winner is None and report['launched'] < max_cycles_per_question:
+        report['rounds'] += 1
+        batch = min(k, max_cycles_per_question - report['launched'])
+        tasks = [
+            asyncio.create_task(_speculative_candidate(
+                number, category, subtopic, models, context, prompt1, temperature, max_tokens, limits,
+                output_format, f"{label}[candidate {number}] ", unit
+            ))
+            for number in range(report['launched'] + 1, report['launched'] + batch + 1)
+        ]
+        report['launched'] += batch
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                number, parsed, spec, usage = await next_done
+                usages.append(usage)
+                if parsed is not None:
+                    winner = (number, parsed, spec, usage)
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    report['cancelled'] += 1
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    report['latency_s'] = round(time.monotonic() - started, 2)
+    # Cancelled candidates only count calls that completed before the cancel
+    report['calls'] = sum(usage.calls for usage in usages)
+    report['tokens'] = sum(usage.tokens for usage in usages)
+    if winner is None:
+        report['wasted_tokens'] = report['tokens']
+        print(f"{label}⚡ No candidate accepted after {report['launched']} tries ({report['latency_s']}s, {report['tokens']} tokens)")
+        return None, report
+
+    number, parsed, spec, usage = winner
+    report['accepted_candidate'] = number
+    report['wasted_tokens'] = report['tokens'] - usage.tokens
+    print(f"{label}⚡ Accepted candidate {number} of {report['launched']} in {report['latency_s']}s: "
+          f"{report['calls']} calls, {report['tokens']} tokens ({report['wasted_tokens']} on discarded candidates), "
+          f"{report['cancelled']} cancelled")
+    question_data = await _accept_question_async(category, subtopic, parsed, spec, wait_for_storage, label=label)
+    if on_question:
+        on_question(question_data)
+    return question_data, report
+
+async def generate_questions_speculative(category, subtopic, num_questions=1, models=None, k=3, temperature=0.7, max_tokens=16384, max_cycles_per_question=3, limits=None, output_format='text', wait_for_storage=False, on_question=None):
+    """
+    generate_questions with speculative candidates (see generate_question_speculative).
+    Returns {'questions': [...], 'speculation': [report, ...]} or {'error': ...}.
+    """
+    models, error = resolve_models(models)
+    if error:
+        return {'error': error}
+
+    error = validate_subtopic(category, subtopic)
+    if error:
+        return {'error': error}
+
+    if limits is None:
+        limits = ConcurrencyLimits(max_concurrency=k * num_questions, per_model_concurrency=k * num_questions)
+    context, prompt1 = build_llm1_prompts(category, subtopic, output_format)
+    results = await asyncio.gather(*[
+        generate_question_speculative(
+            category, subtopic, models, context, prompt1, k, temperature, max_tokens,
+            max_cycles_per_question, limits, output_format, wait_for_storage,
+            label=f"[{subtopic} #{q_num + 1}] ", on_question=on_question, unit=unit_key(category, subtopic, q_num)
+        )
+        for q_num in range(num_questions)
+    ])
+    return {
+        'questions': [question_data for question_data, _ in results if question_data],
+        'speculation': [report for _, report in results],
+    }
 
-            # Add delay between questions if specified
-            if delay_minutes > 0 and q_num < num_questions - 1:
-                print(f"Waiting {delay_minutes} minutes before next question...")
-                time.sleep(delay_minutes * 60)
+def _batch_settings(models, temperature, max_tokens):
+    return {'models': models, 'temperature': temperature, 'max_tokens': max_tokens}
 
-    return {'questions': questions_list}
+def _report_storage():
+    """Wait for the background writer to drain and print how many questions were stored"""
+    if not DUCKSAT_INTEGRATION_AVAILABLE:
+        return
+    writer = get_question_writer()
+    writer.flush()
+    print(f"📊 Database: {writer.stored} stored, {writer.failed} failed")
 
-def batch_generation():
+def batch_generation(resume=False, checkpoint_path=CHECKPOINT_PATH):
     """
     Generate 90 questions (3 per subtopic) across all SAT categories using default settings.
+    Progress is checkpointed per question; resume=True skips work finished by a previous run.
     """
-    llms_config = load_llms_config()
-    if not llms_config:
+    model_list = get_model_registry().names()
+    if not model_list:
         print("No models configured in llms_config.json")
         return
 
-    model_list = list(llms_config.keys())
     if len(model_list) < 3:
         print("Need at least 3 models configured.")
         return
@@ -1002,54 +1964,17 @@ def batch_generation():
     temperature = 0.7
     max_tokens = 16384
     num_questions_per_subtopic = 3
-    delay_minutes = 1
-
-    # SAT Subtopics
-    sat_subtopics = {
-        "Reading": [
-            "Comprehension",
-            "Vocabulary in Context",
-            "Inference",
-            "Main Idea & Supporting Details",
-            "Text Structure & Purpose",
-            "Rhetorical Effect",
-            "Data Interpretation (Charts, Tables)"
-        ],
-        "Writing": [
-            "Sentence Structure",
-            "Grammar & Usage",
-            "Punctuation",
-            "Conciseness & Clarity",
-            "Logical Flow",
-            "Tone & Style",
-            "Transitions & Organization"
-        ],
-        "Math": [
-            "Linear Equations",
-            "Inequalities",
-            "Systems of Equations",
-            "Quadratic Equations",
-            "Polynomials",
-            "Rational Expressions",
-            "Exponents & Radicals",
-            "Ratios & Proportions",
-            "Percentages",
-            "Statistics & Probability",
-            "Graph Interpretation",
-            "Geometry – Angles",
-            "Geometry – Triangles",
-            "Geometry – Circles",
-            "Geometry – Coordinate Geometry",
-            "Trigonometry – Sine, Cosine, Tangent"
-        ]
-    }
+    delay_minutes = 0  # Pacing comes from the per-model rate_limits in llms_config.json, when set
 
     print("Starting batch generation of 90 questions (3 per subtopic)...")
     print(f"Using models: {models}")
     print(f"Temperature: {temperature}, Max tokens: {max_tokens}, Delay: {delay_minutes} minutes")
+    checkpoint = BatchCheckpoint(checkpoint_path, resume=resume, settings=_batch_settings(models, temperature, max_tokens))
+    if resume:
+        print(f"♻️  Resuming from {checkpoint_path}: {checkpoint.completed_count} questions already completed")
 
     total_questions = 0
-    for category, subtopics in sat_subtopics.items():
+    for category, subtopics in SAT_SUBTOPICS.items():
         for subtopic in subtopics:
             print(f"\nGenerating 3 questions for {category} - {subtopic}...")
             result = generate_questions(
@@ -1059,7 +1984,8 @@ def batch_generation():
                 models=models,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                delay_minutes=delay_minutes
+                delay_minutes=delay_minutes,
+                checkpoint=checkpoint
             )
             if 'questions' in result:
                 total_questions += len(result['questions'])
@@ -1068,12 +1994,119 @@ def batch_generation():
                 print(f"Error generating questions for {subtopic}: {result.get('error', 'Unknown error')}")
 
     print(f"\nBatch generation complete! Total questions generated: {total_questions}")
+    _report_storage()
 
-if __name__ == '__main__':
-    if args.batch:
-        batch_generation()
+async def batch_generation_async(max_concurrency=16, per_model_concurrency=4, resume=False, checkpoint_path=CHECKPOINT_PATH, stage_workers=None):
+    """
+    Async batch mode: all 30 subtopics x 3 questions run at once, bounded by a
+    single shared ConcurrencyLimits instead of fixed delays between questions.
+    With stage_workers=(n1, n2, n3) the questions go through the staged
+    LLM1 -> LLM2 -> LLM3 pipeline instead.
+    """
+    model_list = get_model_registry().names()
+    if not model_list:
+        print("No models configured in llms_config.json")
+        return
+
+    if len(model_list) < 3:
+        print("Need at least 3 models configured.")
+        return
+
+    models = model_list[:3]
+    temperature = 0.7
+    max_tokens = 16384
+    num_questions_per_subtopic = 3
+
+    print("Starting async batch generation of 90 questions (3 per subtopic)...")
+    print(f"Using models: {models}")
+    print(f"Concurrency: {max_concurrency} global, {per_model_concurrency} per model")
+    checkpoint = BatchCheckpoint(checkpoint_path, resume=resume, settings=_batch_settings(models, temperature, max_tokens))
+    if resume:
+        print(f"♻️  Resuming from {checkpoint_path}: {checkpoint.completed_count} questions already completed")
+
+    limits = ConcurrencyLimits(max_concurrency, per_model_concurrency)
+    units = [(category, subtopic) for category, subtopics in SAT_SUBTOPICS.items() for subtopic in subtopics]
+    try:
+        if stage_workers:
+            print(f"Pipeline stage workers (LLM1/LLM2/LLM3): {stage_workers}")
+            questions = await run_question_pipeline(
+                [(category, subtopic, num_questions_per_subtopic) for category, subtopic in units],
+                models, temperature, max_tokens, stage_workers=stage_workers, limits=limits, checkpoint=checkpoint
+            )
+            results = [{'questions': questions.get(unit, [])} for unit in units]
+        else:
+            results = await asyncio.gather(*[
+                generate_questions_async(
+                    category=category,
+                    subtopic=subtopic,
+                    num_questions=num_questions_per_subtopic,
+                    models=models,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    limits=limits,
+                    checkpoint=checkpoint
+                )
+                for category, subtopic in units
+            ])
+    finally:
+        await aclose_loop_clients()
+
+    total_questions = 0
+    for (category, subtopic), result in zip(units, results):
+        if 'questions' in result:
+            total_questions += len(result['questions'])
+            print(f"Generated {len(result['questions'])} questions for {subtopic}")
+        else:
+            print(f"Error generating questions for {subtopic}: {result.get('error', 'Unknown error')}")
+
+    print(f"\nAsync batch generation complete! Total questions generated: {total_questions}")
+    await asyncio.to_thread(_report_storage)
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.cache_mode or args.cache_dir:
+        configure_response_cache(mode=args.cache_mode, directory=args.cache_dir)
+    if args.batch and args.use_async:
+        asyncio.run(batch_generation_async(
+            max_concurrency=args.max_concurrency,
+            per_model_concurrency=args.per_model_concurrency,
+            resume=args.resume,
+            checkpoint_path=args.checkpoint,
+            stage_workers=parse_stage_workers(args.stage_workers) if args.pipeline else None
+        ))
+    elif args.batch:
+        batch_generation(resume=args.resume, checkpoint_path=args.checkpoint)
     elif args.interactive:
         interactive_mode()
+    elif args.use_async:
+        async def _run_async():
+            try:
+                if args.pipeline:
+                    return await generate_questions_pipelined(
+                        category=args.category,
+                        subtopic=args.subtopic,
+                        num_questions=args.num_questions,
+                        models=[args.model1, args.model2, args.model3] if args.model1 and args.model2 and args.model3 else None,
+                        temperature=args.temperature,
+                        max_tokens=args.max_tokens,
+                        stage_workers=parse_stage_workers(args.stage_workers),
+                        limits=ConcurrencyLimits(args.max_concurrency, args.per_model_concurrency),
+                        output_format=args.output_format
+                    )
+                return await generate_questions_async(
+                    category=args.category,
+                    subtopic=args.subtopic,
+                    num_questions=args.num_questions,
+                    models=[args.model1, args.model2, args.model3] if args.model1 and args.model2 and args.model3 else None,
+                    temperature=args.temperature,
+                    max_tokens=args.max_tokens,
+                    max_concurrency=args.max_concurrency,
+                    per_model_concurrency=args.per_model_concurrency,
+                    output_format=args.output_format
+                )
+            finally:
+                await aclose_loop_clients()
+        print(asyncio.run(_run_async()))
     else:
         result = generate_questions(
             category=args.category,
@@ -1082,6 +2115,11 @@ if __name__ == '__main__':
             models=[args.model1, args.model2, args.model3] if args.model1 and args.model2 and args.model3 else None,
             temperature=args.temperature,
             max_tokens=args.max_tokens,
-            delay_minutes=args.delay_minutes
+            delay_minutes=args.delay_minutes,
+            output_format=args.output_format,
+            speculative_candidates=args.speculative
         )
         print(result)
+
+if __name__ == '__main__':
+    main()
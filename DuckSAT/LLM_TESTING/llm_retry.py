@@ -0,0 +1,86 @@
+import os
+import random
+import asyncio
+
+from rate_limiter import status_code, retry_after_seconds
+
+# Retrying failed LLM calls inside query_llm / aquery_llm
+#
+# A failed call used to return None straight away, and the generation loop
+# then started a whole new cycle: one 429 on the checker threw away a good
+# question and its diagram. Now the failed call itself is retried, with full
+# jitter exponential backoff, as long as the error is transient:
+#
+#   transient   429, 408, 5xx, timeouts and dropped connections
+#   permanent   any other 4xx (bad key, bad request, missing deployment) and
+#               anything that isn't an HTTP/network error, e.g. a reply that
+#               doesn't have the expected shape
+#
+# Permanent errors fail at once; retrying them only burns quota. A 429 also
+# pauses the model in its rate limiter (see rate_limiter.py), and the wait
+# before the retry is never shorter than the provider's Retry-After.
+#
+#   LLM_MAX_RETRIES          retries after the first attempt (default 3)
+#   LLM_RETRY_BASE_DELAY     backoff base in seconds (default 1)
+#   LLM_RETRY_MAX_DELAY      backoff cap in seconds (default 30)
+#
+# A model can override the retry count with "max_retries" in llms_config.json.
+
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '1.0'))
+MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '30.0'))
+
+TRANSIENT_STATUS = {408, 425, 429}
+
+# Timeout/connection errors of openai, httpx and requests, matched by name so
+# none of those libraries has to be imported here
+TRANSIENT_ERROR_NAMES = {
+    'APITimeoutError', 'APIConnectionError',        # openai
+    'TimeoutException', 'TransportError',           # httpx
+    'Timeout', 'ConnectionError', 'ChunkedEncodingError',  # requests
+}
+TIMEOUT_ERROR_NAMES = {'APITimeoutError', 'TimeoutException', 'Timeout'}
+
+
+def is_transient_error(exc):
+    """True if a failed LLM call is worth retrying: 429/408/5xx, timeouts and connection errors"""
+    status = status_code(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS or status >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def is_timeout_error(exc):
+    """True if a failed LLM call timed out (as opposed to being refused or failing fast)"""
+    if status_code(exc) == 408 or isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in TIMEOUT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, exc, retries_done):
+        return retries_done < self.max_retries and is_transient_error(exc)
+
+    def delay(self, retries_done, exc=None):
+        """Seconds to wait before retry number retries_done + 1: full jitter, at least Retry-After"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retries_done))
+        retry_after = retry_after_seconds(exc) if exc is not None else None
+        return max(backoff, retry_after or 0.0)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def retry_policy_for(request):
+    """The default policy, or one with the model's own max_retries from llms_config.json"""
+    max_retries = request.get('max_retries')
+    if max_retries is None or max_retries == DEFAULT_RETRY_POLICY.max_retries:
+        return DEFAULT_RETRY_POLICY
+    return RetryPolicy(max_retries, DEFAULT_RETRY_POLICY.base_delay, DEFAULT_RETRY_POLICY.max_delay)
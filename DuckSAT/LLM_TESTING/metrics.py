@@ -0,0 +1,175 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Process-wide metrics in the Prometheus text exposition format
+#
+# A minimal counter/histogram registry, so the generator has no extra
+# dependency; the Flask service serves REGISTRY.render() on /metrics and any
+# Prometheus-compatible scraper can read it. Values are per process: with
+# several API workers, scrape each one (or sum them in the query).
+#
+# What is measured:
+#
+#   ducksat_llm_request_seconds{model,stage,outcome}
+#                                                  LLM call latency of every attempt, outcome ok,
+#                                                  error or timeout (excl. rate limit wait)
+#   ducksat_llm_rate_limit_wait_seconds{model}     time spent waiting for quota
+#   ducksat_llm_tokens_total{model,direction}      tokens in (prompt) / out (completion)
+#   ducksat_llm_errors_total{model,stage}          failed LLM calls (every attempt)
+#   ducksat_llm_retries_total{model,stage}         failed calls retried after a transient error
+#   ducksat_llm_failovers_total{stage,model}       calls handed to a fallback model after model failed
+#   ducksat_circuit_opens_total{model}             circuit breaker trips (see circuit_breaker.py)
+#   ducksat_llm_cache_hits_total{model}            replies served by llm_cache
+#   ducksat_generation_retries_total{category}     question cycles restarted
+#   ducksat_checker_rejections_total{model}        questions rejected by LLM3
+#   ducksat_parse_failures_total{stage}            LLM1 JSON / Vega spec replies that didn't parse
+#   ducksat_render_seconds                         Vega -> PNG renders (cache misses only)
+#   ducksat_db_insert_seconds{operation}           question inserts, single or batch
+#
+# Stages are llm1, llm1_repair, llm2, llm2_fix and llm3 (plus 'query' for
+# direct query_llm calls that don't name one).
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample['buckets'][i] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            sample = self._values.get(self._key(labels))
+            return sample['count'] if sample else 0
+
+    def _render_sample(self, key, sample):
+        lines = []
+        for bound, count in zip(self.buckets, sample['buckets']):
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {count}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {sample['count']}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(sample['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {sample['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_LATENCY = REGISTRY.histogram('ducksat_llm_request_seconds', 'LLM call latency in seconds, per attempt', ('model', 'stage', 'outcome'))
+LLM_RATE_LIMIT_WAIT = REGISTRY.histogram('ducksat_llm_rate_limit_wait_seconds', 'Time spent waiting for the rate limiter', ('model',))
+LLM_TOKENS = REGISTRY.counter('ducksat_llm_tokens_total', 'Tokens used by LLM calls', ('model', 'direction'))
+LLM_ERRORS = REGISTRY.counter('ducksat_llm_errors_total', 'LLM calls that failed', ('model', 'stage'))
+LLM_RETRIES = REGISTRY.counter('ducksat_llm_retries_total', 'LLM calls retried after a transient error', ('model', 'stage'))
+LLM_FAILOVERS = REGISTRY.counter('ducksat_llm_failovers_total', 'LLM calls handed to a fallback model', ('stage', 'model'))
+CIRCUIT_OPENS = REGISTRY.counter('ducksat_circuit_opens_total', 'Times a model endpoint circuit breaker opened', ('model',))
+LLM_CACHE_HITS = REGISTRY.counter('ducksat_llm_cache_hits_total', 'LLM replies served from the response cache', ('model',))
+GENERATION_RETRIES = REGISTRY.counter('ducksat_generation_retries_total', 'Question cycles restarted after a failed or rejected stage', ('category',))
+CHECKER_REJECTIONS = REGISTRY.counter('ducksat_checker_rejections_total', 'Questions rejected by the LLM3 checker', ('model',))
+PARSE_FAILURES = REGISTRY.counter('ducksat_parse_failures_total', 'LLM replies that could not be parsed', ('stage',))
+RENDER_SECONDS = REGISTRY.histogram('ducksat_render_seconds', 'Vega spec to PNG render time in seconds')
+DB_INSERT_SECONDS = REGISTRY.histogram('ducksat_db_insert_seconds', 'Question insert time in seconds', ('operation',))
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import logging
+import threading
+
+# Model registry for llms_config.json
+#
+# query_llm used to re-read and re-parse llms_config.json on every call. The
+# registry loads it once, validates each entry into a ModelSpec and only
+# reloads when the file's mtime changes (checked at most every
+# LLMS_CONFIG_CHECK_INTERVAL seconds), so the hot path is a dict lookup.
+# Edits to the file are picked up by running processes without a restart.
+#
+# Per-model keys besides endpoint/model/api_version:
+#
+#   "rate_limits": {...}           the deployment's quota, see rate_limiter.py
+#   "supports_json_mode": true     LLM1 JSON mode may send response_format
+#   "forced_temperature": 1.0      the deployment only accepts this temperature
+#   "timeout": 120                 seconds per request (default 120)
+#   "slow_call_seconds": 96        calls this slow count against the circuit breaker (default 80% of timeout)
+#   "max_retries": 3               retries of transient errors (default LLM_MAX_RETRIES)
+#
+# Top-level keys starting with '_' are not models; they hold shared settings
+# (see ModelRegistry.section). An invalid entry is logged and left out rather
+# than taking the other models down with it.
+#
+# "_roles" lists fallback models per pipeline role, tried in order when the
+# chosen model fails or its circuit breaker is open (see circuit_breaker.py):
+#
+#   "_roles": {"generator": ["gpt-5", "gork-3"], "diagrammer": [...], "checker": [...]}
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llms_config.json')
+CONFIG_PATH = os.getenv('LLMS_CONFIG_PATH', DEFAULT_CONFIG_PATH)
+CHECK_INTERVAL = float(os.getenv('LLMS_CONFIG_CHECK_INTERVAL', '1.0'))
+DEFAULT_TIMEOUT = 120
+SLOW_CALL_FRACTION = 0.8
+DEFAULT_API_VERSION = '2024-12-01-preview'
+
+
+class ModelConfigError(ValueError):
+    pass
+
+
+def _positive_number(name, key, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ModelConfigError(f"{name}: '{key}' must be a positive number, got {value!r}")
+    return value
+
+
+class ModelSpec:
+    """One validated llms_config.json entry"""
+    def __init__(self, name, entry):
+        if not isinstance(entry, dict):
+            raise ModelConfigError(f"{name}: entry must be an object")
+        for key in ('endpoint', 'model'):
+            if not isinstance(entry.get(key), str) or not entry[key]:
+                raise ModelConfigError(f"{name}: '{key}' is required")
+        if not entry['endpoint'].startswith(('https://', 'http://')):
+            raise ModelConfigError(f"{name}: endpoint must be an http(s) URL")
+
+        rate_limits = entry.get('rate_limits') or {}
+        if not isinstance(rate_limits, dict):
+            raise ModelConfigError(f"{name}: 'rate_limits' must be an object")
+        for key, value in rate_limits.items():
+            _positive_number(name, f"rate_limits.{key}", value)
+
+        forced_temperature = entry.get('forced_temperature')
+        if forced_temperature is not None and (isinstance(forced_temperature, bool) or not isinstance(forced_temperature, (int, float))
+                                               or not 0 <= forced_temperature <= 2):
+            raise ModelConfigError(f"{name}: 'forced_temperature' must be between 0 and 2")
+
+        self.name = name
+        self.endpoint = entry['endpoint']
+        self.deployment = entry['model']
+        self.api_version = entry.get('api_version', DEFAULT_API_VERSION)
+        self.format = entry.get('format')
+        self.rate_limits = rate_limits
+        self.supports_json_mode = bool(entry.get('supports_json_mode'))
+        self.forced_temperature = forced_temperature
+        self.timeout = _positive_number(name, 'timeout', entry.get('timeout', DEFAULT_TIMEOUT))
+        self.slow_call_seconds = _positive_number(name, 'slow_call_seconds', entry.get('slow_call_seconds', self.timeout * SLOW_CALL_FRACTION))
+        self.max_retries = entry.get('max_retries')
+        if self.max_retries is not None and (isinstance(self.max_retries, bool) or not isinstance(self.max_retries, int)
+                                             or self.max_retries < 0):
+            raise ModelConfigError(f"{name}: 'max_retries' must be a non-negative integer")
+        self.raw = entry
+
+    def temperature(self, requested):
+        """Temperature to send: the forced one for deployments that only accept a fixed value"""
+        return requested if self.forced_temperature is None else self.forced_temperature
+
+
+class ModelRegistry:
+    def __init__(self, path=CONFIG_PATH, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._models = {}
+        self._sections = {}
+        self._maybe_reload()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._load()
+                self._mtime = mtime
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            config = {}
+        except json.JSONDecodeError as e:
+            # Keep serving the last good config while the file is being edited
+            logger.error(f"Invalid JSON in {self.path}, keeping the previous models: {e}")
+            return
+
+        models = {}
+        sections = {}
+        for name, entry in config.items():
+            if name.startswith('_'):
+                sections[name] = entry
+                continue
+            try:
+                models[name] = ModelSpec(name, entry)
+            except ModelConfigError as e:
+                logger.error(f"Skipping model in {self.path}: {e}")
+        roles = sections.get('_roles')
+        if roles is not None:
+            if not isinstance(roles, dict) or not all(isinstance(chain, list) for chain in roles.values()):
+                logger.error(f"Ignoring _roles in {self.path}: must map each role to a list of model names")
+                sections.pop('_roles')
+            else:
+                for role, chain in roles.items():
+                    unknown = [name for name in chain if name not in models]
+                    if unknown:
+                        logger.warning(f"_roles.{role} in {self.path} names unknown models: {', '.join(map(str, unknown))}")
+        self._models = models
+        self._sections = sections
+        logger.info(f"Loaded {len(models)} models from {self.path}")
+
+    def get(self, name):
+        """ModelSpec for a configured model, or None"""
+        self._maybe_reload()
+        return self._models.get(name)
+
+    def names(self):
+        """Model names in file order"""
+        self._maybe_reload()
+        return list(self._models)
+
+    def fallback_chain(self, role, model_name):
+        """model_name followed by the role's configured fallbacks, skipping duplicates and unknown models"""
+        self._maybe_reload()
+        chain = [model_name]
+        for name in (self._sections.get('_roles') or {}).get(role, []):
+            if name not in chain and name in self._models:
+                chain.append(name)
+        return chain
+
+    def section(self, name, default=None):
+        """A '_'-prefixed top-level setting, e.g. section('_roles')"""
+        self._maybe_reload()
+        return self._sections.get(name, default)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """Process-wide registry for LLMS_CONFIG_PATH (default LLM_TESTING/llms_config.json)"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -3,7 +3,7 @@ import json
 import re
 import base64
 from bs4 import BeautifulSoup
-from ducksat_integration import store_question_in_ducksat
+from ducksat_integration import store_questions_in_ducksat
 
 def parse_html_questions(html_file):
     """Parse the SAT questions HTML file and extract question data"""
@@ -115,15 +115,14 @@ def main():
     print(f"Found {len(questions)} questions.")
 
     print("Inserting questions into database...")
+    question_ids = store_questions_in_ducksat(questions)
     inserted_count = 0
-    for i, q_data in enumerate(questions, 1):
-        print(f"Inserting question {i}: {q_data['category']} - {q_data['subtopic']}")
-        question_id = store_question_in_ducksat(q_data)
+    for i, (q_data, question_id) in enumerate(zip(questions, question_ids), 1):
         if question_id:
             inserted_count += 1
-            print(f"✅ Inserted with ID: {question_id}")
+            print(f"✅ Question {i} ({q_data['category']} - {q_data['subtopic']}) inserted with ID: {question_id}")
         else:
-            print("❌ Failed to insert")
+            print(f"❌ Question {i} ({q_data['category']} - {q_data['subtopic']}) failed to insert")
 
     print(f"\nCompleted: {inserted_count}/{len(questions)} questions inserted successfully.")
 
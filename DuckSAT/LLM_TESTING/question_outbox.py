@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import uuid
+import atexit
+import logging
+import argparse
+import threading
+
+# Durable local outbox for accepted questions
+#
+# Every question that passes LLM3 is appended to a JSONL outbox before any
+# database work, so a missing DATABASE_URL or a Postgres outage never loses a
+# question we already paid three LLM calls for. Each record gets a stable 'id'
+# that becomes the question's primary key, which makes loading idempotent: the
+# insert is ON CONFLICT (id) DO NOTHING and only new rows bump the counters.
+#
+# Appends are group-committed: concurrent writers share one fsync instead of
+# paying one each. Successful stores are recorded in a sidecar ack file
+# (<outbox>.acked, one id per line); an entry is pending until its id is acked.
+# Acks are not fsynced, a lost ack just means the question is replayed (a no-op).
+#
+#   python question_outbox.py --status          # count pending questions
+#   python question_outbox.py --drain           # bulk-load pending questions
+#   python question_outbox.py --drain --compact # ...and drop acked entries
+#
+# Only compact while no generator is writing to the outbox.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.outbox', 'questions.jsonl')
+OUTBOX_PATH = os.getenv('QUESTION_OUTBOX_PATH', DEFAULT_OUTBOX_PATH)
+OUTBOX_ENABLED = os.getenv('QUESTION_OUTBOX', 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+class QuestionOutbox:
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self.ack_path = f"{path}.acked"
+        self._file = None
+        self._ack_file = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, storage_data):
+        """Durably record a question; assigns storage_data['id'] if it has none and returns it"""
+        storage_data.setdefault('id', str(uuid.uuid4()))
+        line = json.dumps(storage_data, ensure_ascii=False) + '\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            self._written += 1
+            seq = self._written
+        self._sync(seq)
+        return storage_data['id']
+
+    def _sync(self, seq):
+        # Group commit: whoever takes the sync lock first fsyncs everything
+        # written so far, later writers covered by that fsync return at once
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            with self._lock:
+                target = self._written
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self._synced = target
+
+    def ack(self, question_ids):
+        """Mark questions as stored in the database"""
+        question_ids = [question_id for question_id in question_ids if question_id]
+        if not question_ids:
+            return
+        with self._lock:
+            if self._ack_file is None:
+                os.makedirs(os.path.dirname(self.ack_path), exist_ok=True)
+                self._ack_file = open(self.ack_path, 'a', encoding='utf-8')
+            self._ack_file.write(''.join(f"{question_id}\n" for question_id in question_ids))
+            self._ack_file.flush()
+
+    def _acked_ids(self):
+        try:
+            with open(self.ack_path, 'r', encoding='utf-8') as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def pending(self):
+        """Questions in the outbox that have not been acked, oldest first (deduplicated by id)"""
+        acked = self._acked_ids()
+        seen = set()
+        pending = []
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return pending
+        with f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write; everything before it is intact
+                    logger.warning(f"Skipping unreadable outbox line {line_number}")
+                    continue
+                question_id = record.get('id')
+                if question_id in acked or question_id in seen:
+                    continue
+                seen.add(question_id)
+                pending.append(record)
+        return pending
+
+    def compact(self):
+        """Rewrite the outbox with only pending entries and reset the ack file"""
+        pending = self.pending()
+        with self._lock:
+            self.close()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in pending:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            try:
+                os.remove(self.ack_path)
+            except FileNotFoundError:
+                pass
+        return len(pending)
+
+    def close(self):
+        for f in (self._file, self._ack_file):
+            if f is not None:
+                f.close()
+        self._file = None
+        self._ack_file = None
+
+
+def drain_outbox(outbox, store_batch=None, batch_size=200):
+    """Bulk-load pending outbox questions into the database; returns (stored, remaining)"""
+    if store_batch is None:
+        from ducksat_integration import store_questions_in_ducksat
+        store_batch = store_questions_in_ducksat
+
+    pending = outbox.pending()
+    stored = 0
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        question_ids = store_batch(batch)
+        outbox.ack(question_ids)
+        stored += sum(1 for question_id in question_ids if question_id)
+    return stored, len(pending) - stored
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_question_outbox():
+    """Process-wide outbox, or None when disabled with QUESTION_OUTBOX=off"""
+    global _outbox
+    if not OUTBOX_ENABLED:
+        return None
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = QuestionOutbox()
+                atexit.register(_outbox.close)
+    return _outbox
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or drain the local question outbox')
+    parser.add_argument('--path', default=OUTBOX_PATH, help='Outbox JSONL file')
+    parser.add_argument('--status', action='store_true', help='Print the number of pending questions')
+    parser.add_argument('--drain', action='store_true', help='Load pending questions into the DuckSAT database')
+    parser.add_argument('--batch_size', type=int, default=200, help='Questions per database transaction')
+    parser.add_argument('--compact', action='store_true', help='Drop acked entries from the outbox (no generator may be running)')
+    args = parser.parse_args()
+
+    outbox = QuestionOutbox(args.path)
+    if args.drain:
+        stored, remaining = drain_outbox(outbox, batch_size=args.batch_size)
+        print(f"✅ Drained {stored} questions from {args.path}, {remaining} still pending")
+    if args.compact:
+        print(f"Compacted outbox, {outbox.compact()} pending entries kept")
+    if args.status or not (args.drain or args.compact):
+        print(f"{len(outbox.pending())} pending questions in {args.path}")
+    outbox.close()
+    if args.drain and remaining:
+        sys.exit(1)
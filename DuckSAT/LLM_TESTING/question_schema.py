@@ -0,0 +1,161 @@
+import re
+import json
+from functools import lru_cache
+
+# JSON output mode for LLM1
+#
+# Instead of the free-text "Passage:, Question:, ..." format, LLM1 can be asked
+# for a JSON object shaped like the Question model in schema.prisma. The reply
+# is checked against QUESTION_JSON_SCHEMA by a small validator that is compiled
+# once (plain closures, no per-call schema walking) and cached.
+
+QUESTION_JSON_SCHEMA = {
+    "type": "object",
+    "required": ["question", "options", "correctAnswer", "explanation"],
+    "properties": {
+        "passage": {"type": ["string", "null"]},
+        "question": {"type": "string", "minLength": 1},
+        "options": {"type": "array", "minItems": 4, "maxItems": 4, "items": {"type": "string"}},
+        "correctAnswer": {"type": "integer", "minimum": 0, "maximum": 3},
+        "explanation": {"type": "string", "minLength": 1},
+        "wrongAnswerExplanations": {"type": "array", "items": {"type": "string"}},
+        "difficulty": {"type": "string", "enum": ["easy", "medium", "hard"]},
+        "category": {"type": "string"},
+        "subtopic": {"type": "string"},
+        "timeEstimate": {"type": "integer", "minimum": 1},
+        "source": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def compile_validator(schema):
+    """
+    Compile the subset of JSON Schema used above (type, enum, required,
+    properties, items, minItems/maxItems, minLength, minimum/maximum) into a
+    function returning a list of error strings (empty when valid).
+    """
+    checks = []
+
+    types = schema.get("type")
+    if types:
+        types = [types] if isinstance(types, str) else list(types)
+        type_fns = [_TYPE_CHECKS[t] for t in types]
+
+        def check_type(value, path):
+            if not any(fn(value) for fn in type_fns):
+                return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+            return []
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, path):
+            return [] if value in allowed else [f"{path}: must be one of {allowed}"]
+        checks.append(check_enum)
+
+    if "minLength" in schema:
+        min_length = schema["minLength"]
+
+        def check_min_length(value, path):
+            if isinstance(value, str) and len(value.strip()) < min_length:
+                return [f"{path}: must not be empty"]
+            return []
+        checks.append(check_min_length)
+
+    if "minimum" in schema or "maximum" in schema:
+        minimum = schema.get("minimum")
+        maximum = schema.get("maximum")
+
+        def check_range(value, path):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                return []
+            if minimum is not None and value < minimum:
+                return [f"{path}: must be >= {minimum}"]
+            if maximum is not None and value > maximum:
+                return [f"{path}: must be <= {maximum}"]
+            return []
+        checks.append(check_range)
+
+    if "minItems" in schema or "maxItems" in schema or "items" in schema:
+        min_items = schema.get("minItems")
+        max_items = schema.get("maxItems")
+        item_validator = compile_validator(schema["items"]) if "items" in schema else None
+
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            if min_items is not None and len(value) < min_items:
+                errors.append(f"{path}: expected at least {min_items} items, got {len(value)}")
+            if max_items is not None and len(value) > max_items:
+                errors.append(f"{path}: expected at most {max_items} items, got {len(value)}")
+            if item_validator:
+                for i, item in enumerate(value):
+                    errors.extend(item_validator(item, f"{path}[{i}]"))
+            return errors
+        checks.append(check_items)
+
+    if "properties" in schema or "required" in schema:
+        required = schema.get("required", [])
+        properties = {name: compile_validator(sub) for name, sub in schema.get("properties", {}).items()}
+
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}.{name}: is required" for name in required if name not in value]
+            for name, validator in properties.items():
+                if name in value:
+                    errors.extend(validator(value[name], f"{path}.{name}"))
+            return errors
+        checks.append(check_object)
+
+    def validate(value, path="$"):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+    return validate
+
+
+@lru_cache(maxsize=None)
+def get_question_validator():
+    return compile_validator(QUESTION_JSON_SCHEMA)
+
+
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)\s*```', re.DOTALL | re.IGNORECASE)
+
+
+def extract_json_object(text):
+    """Decode the first JSON object in an LLM reply (optionally inside a ```json fence). Returns (obj, error)."""
+    fence = _JSON_FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1)
+    start = text.find('{')
+    if start == -1:
+        return None, "No JSON object found"
+    try:
+        obj, _ = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError as e:
+        return None, f"Invalid JSON: {e}"
+    return obj, None
+
+
+def validate_question_json(text):
+    """Decode and validate an LLM1 JSON reply. Returns (question_dict, errors)."""
+    obj, error = extract_json_object(text)
+    if error:
+        return None, [error]
+    errors = get_question_validator()(obj)
+    return (obj if not errors else None), errors
@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import atexit
+import asyncio
+import logging
+import threading
+
+from ducksat_integration import store_questions_in_ducksat
+from question_outbox import get_question_outbox
+from tracing import span, current_span
+
+# Write-behind persistence for generated questions
+#
+# Generation loops hand accepted questions to a QuestionWriter instead of
+# storing them inline. A background thread drains a bounded queue and writes
+# batches through store_questions_in_ducksat (which is also where Vega images
+# are rendered), so LLM workers never wait on Postgres or the browser pool.
+#
+# Backpressure: when the queue is full, submit() blocks until the writer
+# catches up rather than buffering without limit. A batch is flushed once it
+# reaches batch_size or flush_interval seconds after its first question.
+# Questions whose insert fails are retried with a short backoff before being
+# reported as failed; they are no longer regenerated.
+#
+# With an outbox (see question_outbox.py) every question is appended to the
+# local JSONL spool before it is queued and acked once stored, so a failed or
+# interrupted write can be replayed later with `question_outbox.py --drain`.
+
+logger = logging.getLogger(__name__)
+
+WRITER_QUEUE_SIZE = int(os.getenv('QUESTION_WRITER_QUEUE_SIZE', '100'))
+WRITER_BATCH_SIZE = int(os.getenv('QUESTION_WRITER_BATCH_SIZE', '25'))
+WRITER_FLUSH_INTERVAL = float(os.getenv('QUESTION_WRITER_FLUSH_INTERVAL', '2.0'))
+WRITER_MAX_RETRIES = int(os.getenv('QUESTION_WRITER_MAX_RETRIES', '2'))
+
+_STOP = object()
+
+
+class PendingWrite:
+    """Handle for a queued question; question_id is set once the writer has stored it"""
+    def __init__(self, storage_data, question_data=None):
+        self.storage_data = storage_data
+        self.question_data = question_data
+        self.question_id = None
+        self.attempts = 0
+        # Trace of the question that was submitted; the batch insert span links to it
+        self.trace_context = current_span().context()
+        self._done = threading.Event()
+        self._finished = False
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the write finished (or failed) and its callbacks ran; returns the question ID or None"""
+        self._done.wait(timeout)
+        return self.question_id
+
+    def add_done_callback(self, fn):
+        """Call fn(pending) once the write finished (on the writer thread), or right away if it already has"""
+        with self._callbacks_lock:
+            if not self._finished:
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, question_id):
+        self.question_id = question_id
+        if question_id and self.question_data is not None:
+            self.question_data['question_id'] = question_id
+        with self._callbacks_lock:
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                logger.error(f"Question writer callback failed: {e}")
+        # Only after the callbacks, so whoever wait()s sees everything they emitted
+        self._done.set()
+
+
+class QuestionWriter:
+    def __init__(self, store_batch=store_questions_in_ducksat, max_queue=WRITER_QUEUE_SIZE,
+                 batch_size=WRITER_BATCH_SIZE, flush_interval=WRITER_FLUSH_INTERVAL,
+                 max_retries=WRITER_MAX_RETRIES, outbox=None):
+        self.store_batch = store_batch
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.stored = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='question-writer', daemon=True)
+                    self._thread.start()
+
+    def submit(self, storage_data, question_data=None, block=True, timeout=None):
+        """
+        Queue a question for storage and return its PendingWrite. Blocks while the
+        queue is full (backpressure); raises queue.Full if block is False or
+        timeout expires first.
+        """
+        if self._closed:
+            raise RuntimeError("QuestionWriter is closed")
+        self._ensure_started()
+        if self.outbox is not None:
+            self.outbox.append(storage_data)
+        pending = PendingWrite(storage_data, question_data)
+        self._queue.put(pending, block=block, timeout=timeout)
+        return pending
+
+    async def asubmit(self, storage_data, question_data=None):
+        """submit() for the async engine; the outbox append (an fsync) and any wait for queue space run off the event loop"""
+        if self._closed:
+            raise RuntimeError("QuestionWriter is closed")
+        self._ensure_started()
+        if self.outbox is not None:
+            await asyncio.to_thread(self.outbox.append, storage_data)
+        pending = PendingWrite(storage_data, question_data)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            await asyncio.to_thread(self._queue.put, pending)
+        return pending
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        while batch:
+            links = [pending.trace_context for pending in batch if pending.trace_context]
+            try:
+                with span('store_batch', links=links, questions=len(batch), attempt=batch[0].attempts + 1):
+                    question_ids = self.store_batch([pending.storage_data for pending in batch])
+            except Exception as e:
+                logger.error(f"Question writer batch failed: {e}")
+                question_ids = [None] * len(batch)
+
+            if self.outbox is not None:
+                self.outbox.ack(question_ids)
+
+            retry = []
+            for pending, question_id in zip(batch, question_ids):
+                if question_id:
+                    self.stored += 1
+                    pending._finish(question_id)
+                    continue
+                pending.attempts += 1
+                if pending.attempts <= self.max_retries:
+                    retry.append(pending)
+                else:
+                    self.failed += 1
+                    print(f"❌ Failed to store question after {pending.attempts} attempts: {pending.storage_data.get('question', '')[:60]}")
+                    if self.outbox is not None:
+                        print(f"   Kept in {self.outbox.path}; load it later with `python question_outbox.py --drain`")
+                    pending._finish(None)
+
+            if retry:
+                delay = 2 ** (retry[0].attempts - 1)
+                logger.warning(f"Retrying {len(retry)} question(s) in {delay}s")
+                time.sleep(delay)
+            batch = retry
+
+    def flush(self):
+        """Block until every queued question has been written (or has failed)"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush outstanding questions and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_question_writer():
+    """Process-wide writer; pending questions are flushed at interpreter exit"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = QuestionWriter(outbox=get_question_outbox())
+                atexit.register(_writer.close)
+    return _writer
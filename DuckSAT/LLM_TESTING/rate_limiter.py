@@ -0,0 +1,156 @@
+import time
+import asyncio
+import threading
+
+# Per-model request/token rate limiting for query_llm
+#
+# Limits come from the optional "rate_limits" block of a model in
+# llms_config.json. Without one the model is not throttled client-side (429s
+# still pause it, see penalize). Set the values to the deployment's actual
+# quota from the Azure portal; these numbers are only an example:
+#
+#   "rate_limits": {"requests_per_minute": 60, "tokens_per_minute": 120000}
+#
+# Each model gets two token buckets (requests and tokens). A call reserves one
+# request and its estimated tokens up front; if a bucket goes into debt the
+# caller waits until it has refilled. The token reservation is reconciled with
+# the reported usage afterwards, and handed back in full when the call fails,
+# so a burst of errors doesn't eat the quota. When the provider answers 429 the
+# limiter pauses the model for the Retry-After period and drains its request
+# bucket so callers queued behind it don't all retry at once.
+
+
+class TokenBucket:
+    """Token bucket that can go into debt; reserve() returns how long the caller must wait"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        # A single request larger than the bucket can never fit; cap it so it waits at most one full refill
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def adjust(self, amount, now):
+        """Give back (negative amount) or take extra tokens once the real usage is known"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self, now):
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class ModelRateLimiter:
+    def __init__(self, model_name, requests_per_minute=None, tokens_per_minute=None):
+        self.model_name = model_name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, estimated_tokens):
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self.blocked_until - now)
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens:
+                wait = max(wait, self.tokens.reserve(estimated_tokens, now))
+        return wait
+
+    def acquire(self, estimated_tokens=0):
+        """Block until the model has capacity for one request of estimated_tokens"""
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, estimated_tokens=0):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Reconcile the token bucket with the usage reported by the provider"""
+        if not self.tokens or actual_tokens is None:
+            return
+        with self._lock:
+            self.tokens.adjust(actual_tokens - estimated_tokens, time.monotonic())
+
+    def penalize(self, retry_after=None):
+        """Provider returned 429: pause this model for Retry-After seconds (default 1s)"""
+        now = time.monotonic()
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after else 1.0))
+            if self.requests:
+                self.requests.drain(now)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name, rate_limits):
+    """Return the shared limiter for a model, rebuilt if its configured limits change"""
+    rate_limits = rate_limits or {}
+    key = (rate_limits.get('requests_per_minute'), rate_limits.get('tokens_per_minute'))
+    with _limiters_lock:
+        entry = _limiters.get(model_name)
+        if entry is None or entry[0] != key:
+            entry = (key, ModelRateLimiter(model_name, *key))
+            _limiters[model_name] = entry
+        return entry[1]
+
+
+def estimate_tokens(messages, max_tokens):
+    """Rough request size for TPM accounting: ~4 characters per prompt token plus the completion budget"""
+    chars = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'text':
+                    chars += len(part.get('text', ''))
+    return chars // 4 + (max_tokens or 0)
+
+
+def status_code(exc):
+    """HTTP status of an openai/httpx/requests error, or None for errors without one"""
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status
+
+
+def is_rate_limited(exc):
+    return status_code(exc) == 429
+
+
+def retry_after_seconds(exc):
+    """Read Retry-After (or Azure's retry-after-ms) from an openai/httpx/requests error, if present"""
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        return None
+    return None
@@ -0,0 +1,77 @@
+import sys
+import time
+
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+print("=== Testing circuit breaker ===")
+failures = 0
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+# Test 1: repeated endpoint failures open the breaker; 429/4xx don't count
+print("\n1. Testing opening...")
+breaker = CircuitBreaker('gpt-5', slow_call_seconds=10, failure_threshold=3, open_seconds=60)
+for error in (StatusError(503), TimeoutError(), StatusError(429), StatusError(400)):
+    breaker.record(error, 1.0)
+still_closed = breaker.state == CLOSED and breaker.allow()
+for error in (StatusError(503), StatusError(502), TimeoutError()):
+    breaker.record(error, 1.0)
+if still_closed and breaker.state == OPEN and not breaker.allow():
+    print("✅ opening passed")
+else:
+    print(f"❌ opening failed: {breaker.state}")
+    failures += 1
+
+# Test 2: 429s between endpoint failures neither reset nor add to the count
+print("\n2. Testing interleaved 429s...")
+mixed = CircuitBreaker('gpt-5', slow_call_seconds=10, failure_threshold=3, open_seconds=60)
+for error in (StatusError(503), StatusError(429), StatusError(503), StatusError(429)):
+    mixed.record(error, 1.0)
+held = mixed.state == CLOSED and mixed.failures == 2
+mixed.record(StatusError(503), 1.0)
+if held and mixed.state == OPEN:
+    print("✅ interleaved 429s passed")
+else:
+    print(f"❌ interleaved 429s failed: {mixed.state} after {mixed.failures} failures")
+    failures += 1
+
+# Test 3: slow calls count as failures
+print("\n3. Testing slow calls...")
+slow = CircuitBreaker('grok-3', slow_call_seconds=10, failure_threshold=2, open_seconds=60)
+slow.record(None, 30.0)
+slow.record(None, 1.0)
+reset = slow.state == CLOSED and slow.failures == 0
+slow.record(None, 30.0)
+slow.record(None, 30.0)
+if reset and slow.state == OPEN:
+    print("✅ slow calls passed")
+else:
+    print(f"❌ slow calls failed: {slow.state}")
+    failures += 1
+
+# Test 4: half-open lets one probe through, which closes or reopens the breaker
+print("\n4. Testing half-open probes...")
+probe = CircuitBreaker('Llama-Maverick', slow_call_seconds=10, failure_threshold=1, open_seconds=0.05)
+probe.record(StatusError(500), 1.0)
+time.sleep(0.06)
+first, second = probe.allow(), probe.allow()
+probe.record(StatusError(500), 1.0)
+reopened = probe.state == OPEN and not probe.allow()
+time.sleep(0.06)
+probe.allow()
+half_open = probe.state == HALF_OPEN
+probe.record(None, 1.0)
+if first and not second and reopened and half_open and probe.state == CLOSED and probe.allow():
+    print("✅ half-open probes passed")
+else:
+    print(f"❌ half-open probes failed: first={first} second={second} reopened={reopened} state={probe.state}")
+    failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
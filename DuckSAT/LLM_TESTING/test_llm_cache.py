@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+
+from llm_cache import ResponseCache, cache_key
+
+print("=== Testing LLM response cache ===")
+
+messages = [{"role": "system", "content": "ctx"}, {"role": "user", "content": "prompt"}]
+key = cache_key('gpt-5', 'gpt-5', messages, 1.0, 16384)
+failures = 0
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    # Test 1: record mode stores and serves responses
+    print("\n1. Testing record mode...")
+    cache = ResponseCache('record', cache_dir)
+    cache.put(key, 'cached answer', 123, 'gpt-5')
+    entry = cache.get(key)
+    if entry and entry['content'] == 'cached answer' and entry['total_tokens'] == 123:
+        print("✅ record mode round-trip passed")
+    else:
+        print(f"❌ record mode round-trip failed: {entry}")
+        failures += 1
+
+    # Test 2: key depends on every request field
+    print("\n2. Testing cache key...")
+    other = cache_key('gpt-5', 'gpt-5', messages, 0.7, 16384)
+    if other != key and cache_key('gpt-5', 'gpt-5', list(messages), 1.0, 16384) == key:
+        print("✅ cache key passed")
+    else:
+        print("❌ cache key failed")
+        failures += 1
+
+    # Test 3: replay mode is read-only
+    print("\n3. Testing replay mode...")
+    replay = ResponseCache('replay', cache_dir)
+    replay.put(other, 'should not be written')
+    if replay.get(key) and replay.get(other) is None:
+        print("✅ replay mode passed")
+    else:
+        print("❌ replay mode failed")
+        failures += 1
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    # Test 4: LRU eviction keeps the cache under max_bytes
+    print("\n4. Testing LRU eviction...")
+    cache = ResponseCache('record', cache_dir, max_bytes=2000)
+    keys = [cache_key('m', 'm', [{"role": "user", "content": str(i)}], 0, 1) for i in range(20)]
+    for i, k in enumerate(keys):
+        cache.put(k, 'x' * 200)
+        if i == 0:
+            # Touch the first entry with a future mtime so it is the most recently used
+            os.utime(cache._path(k), (2 ** 31, 2 ** 31))
+    total = sum(size for _, size, _ in cache._entries())
+    if total <= 2000 and cache.get(keys[0]) and cache.get(keys[1]) is None:
+        print(f"✅ LRU eviction passed ({total} bytes kept)")
+    else:
+        print(f"❌ LRU eviction failed ({total} bytes kept)")
+        failures += 1
+
+    # Test 5: overwriting an entry doesn't grow the size accounting
+    print("\n5. Testing size accounting on overwrite...")
+    cache = ResponseCache('record', cache_dir, max_bytes=10 ** 9)
+    for _ in range(5):
+        cache.put(keys[0], 'y' * 200)
+    if cache._size == sum(size for _, size, _ in cache._entries()):
+        print("✅ size accounting passed")
+    else:
+        print(f"❌ size accounting failed: {cache._size} bytes counted")
+        failures += 1
+
+# Test 6: each attempt at a question gets its own key
+print("\n6. Testing attempt samples in the key...")
+first = cache_key('gpt-5', 'gpt-5', messages, 1.0, 16384, 'Math|Circles|0#0')
+if len({key, first, cache_key('gpt-5', 'gpt-5', messages, 1.0, 16384, 'Math|Circles|0#1')}) == 3 and cache_key('gpt-5', 'gpt-5', messages, 1.0, 16384, None) == key:
+    print("✅ attempt samples passed")
+else:
+    print("❌ attempt samples failed")
+    failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
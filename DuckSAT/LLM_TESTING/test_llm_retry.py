@@ -0,0 +1,48 @@
+import sys
+
+from llm_retry import RetryPolicy, is_transient_error, is_timeout_error
+
+print("=== Testing LLM retry policy ===")
+failures = 0
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': headers or {}})()
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+# Test 1: transient vs permanent errors
+print("\n1. Testing error classification...")
+transient = [StatusError(429), StatusError(500), StatusError(503), StatusError(408), APITimeoutError(), TimeoutError(), ConnectionResetError()]
+permanent = [StatusError(400), StatusError(401), StatusError(403), StatusError(404), KeyError('choices'), ValueError()]
+wrong = [e for e in transient if not is_transient_error(e)] + [e for e in permanent if is_transient_error(e)]
+timeouts = transient[3:6]  # 408, APITimeoutError, TimeoutError
+wrong += [e for e in transient + permanent if is_timeout_error(e) != (e in timeouts)]
+if not wrong:
+    print("✅ error classification passed")
+else:
+    print(f"❌ error classification failed: {wrong!r}")
+    failures += 1
+
+# Test 2: retry budget and backoff bounds
+print("\n2. Testing backoff...")
+policy = RetryPolicy(max_retries=2, base_delay=1.0, max_delay=3.0)
+budget_ok = policy.should_retry(StatusError(429), 1) and not policy.should_retry(StatusError(429), 2) and not policy.should_retry(StatusError(401), 0)
+delays = [policy.delay(retries) for retries in range(5) for _ in range(50)]
+bounds_ok = all(0 <= d <= 3.0 for d in delays) and max(delays[:50]) <= 1.0
+retry_after_ok = policy.delay(0, StatusError(429, {'retry-after': '7'})) == 7.0
+if budget_ok and bounds_ok and retry_after_ok:
+    print("✅ backoff passed")
+else:
+    print(f"❌ backoff failed: budget={budget_ok} bounds={bounds_ok} retry_after={retry_after_ok}")
+    failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
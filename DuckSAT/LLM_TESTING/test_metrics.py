@@ -0,0 +1,64 @@
+import sys
+
+from metrics import MetricsRegistry
+
+print("=== Testing metrics registry ===")
+
+registry = MetricsRegistry()
+failures = 0
+
+# Test 1: counters per label set
+print("\n1. Testing counters...")
+tokens = registry.counter('test_tokens_total', 'Tokens', ('model', 'direction'))
+tokens.inc(10, model='gpt-5', direction='in')
+tokens.inc(5, model='gpt-5', direction='in')
+tokens.inc(7, model='grok-3', direction='out')
+if tokens.value(model='gpt-5', direction='in') == 15 and tokens.value(model='grok-3', direction='out') == 7:
+    print("✅ counters passed")
+else:
+    print("❌ counters failed")
+    failures += 1
+
+# Test 2: histogram buckets are cumulative
+print("\n2. Testing histograms...")
+latency = registry.histogram('test_latency_seconds', 'Latency', ('stage',), buckets=(1, 10))
+for value in (0.5, 2, 20):
+    latency.observe(value, stage='llm1')
+with latency.time(stage='llm3'):
+    pass
+output = registry.render()
+expected = [
+    'test_latency_seconds_bucket{stage="llm1",le="1"} 1',
+    'test_latency_seconds_bucket{stage="llm1",le="10"} 2',
+    'test_latency_seconds_bucket{stage="llm1",le="+Inf"} 3',
+    'test_latency_seconds_sum{stage="llm1"} 22.5',
+    'test_latency_seconds_count{stage="llm1"} 3',
+    'test_latency_seconds_count{stage="llm3"} 1',
+    '# TYPE test_latency_seconds histogram',
+    'test_tokens_total{model="gpt-5",direction="in"} 15',
+]
+missing = [line for line in expected if line not in output.splitlines()]
+if not missing:
+    print("✅ histograms passed")
+else:
+    print(f"❌ histograms failed, missing: {missing}")
+    failures += 1
+
+# Test 3: label values are escaped, wrong labels are rejected
+print("\n3. Testing labels...")
+errors = registry.counter('test_errors_total', 'Errors', ('model',))
+errors.inc(model='say "hi"\\')
+try:
+    errors.inc(stage='llm1')
+    rejected = False
+except ValueError:
+    rejected = True
+if rejected and 'test_errors_total{model="say \\"hi\\"\\\\"} 1' in registry.render():
+    print("✅ labels passed")
+else:
+    print("❌ labels failed")
+    failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
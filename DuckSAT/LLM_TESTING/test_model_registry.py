@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import tempfile
+
+from model_registry import ModelRegistry
+
+print("=== Testing model registry ===")
+failures = 0
+
+
+def write_config(path, config, mtime):
+    with open(path, 'w') as f:
+        json.dump(config, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'llms_config.json')
+    write_config(path, {
+        '_roles': {'checker': ['gpt-5']},
+        'gpt-5': {'endpoint': 'https://example.openai.azure.com/', 'model': 'gpt-5', 'forced_temperature': 1.0,
+                  'rate_limits': {'requests_per_minute': 60}, 'supports_json_mode': True},
+        'grok-3': {'endpoint': 'https://example.services.ai.azure.com/models/', 'model': 'grok-3', 'timeout': 30},
+        'broken': {'endpoint': 'not a url', 'model': 'x'},
+    }, 1_000_000_000)
+    registry = ModelRegistry(path, check_interval=0)
+
+    # Test 1: valid entries load, '_' keys and invalid entries are left out
+    print("\n1. Testing load and validation...")
+    if registry.names() == ['gpt-5', 'grok-3'] and registry.section('_roles') == {'checker': ['gpt-5']}:
+        print("✅ load and validation passed")
+    else:
+        print(f"❌ load and validation failed: {registry.names()}")
+        failures += 1
+
+    # Test 2: capabilities
+    print("\n2. Testing capabilities...")
+    gpt5, grok = registry.get('gpt-5'), registry.get('grok-3')
+    if (gpt5.temperature(0.7) == 1.0 and grok.temperature(0.7) == 0.7 and gpt5.supports_json_mode and not grok.supports_json_mode
+            and gpt5.timeout == 120 and grok.timeout == 30 and grok.slow_call_seconds == 24 and gpt5.slow_call_seconds == 96 and gpt5.rate_limits == {'requests_per_minute': 60}):
+        print("✅ capabilities passed")
+    else:
+        print("❌ capabilities failed")
+        failures += 1
+
+    # Test 3: reload only when the file changes; bad JSON keeps the last good config
+    print("\n3. Testing reload...")
+    first = registry.get('gpt-5')
+    same = registry.get('gpt-5') is first
+    write_config(path, {'gpt-5': {'endpoint': 'https://example.openai.azure.com/', 'model': 'gpt-5', 'timeout': 60}}, 2_000_000_000)
+    reloaded = registry.get('gpt-5')
+    with open(path, 'w') as f:
+        f.write('{"gpt-5": ')
+    os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+    if same and reloaded is not first and reloaded.timeout == 60 and registry.names() == ['gpt-5'] and registry.get('gpt-5') is reloaded:
+        print("✅ reload passed")
+    else:
+        print("❌ reload failed")
+        failures += 1
+
+    # Test 4: role fallback chains
+    print("\n4. Testing fallback chains...")
+    write_config(path, {
+        '_roles': {'checker': ['gpt-5', 'missing', 'grok-3']},
+        'gpt-5': {'endpoint': 'https://example.openai.azure.com/', 'model': 'gpt-5'},
+        'grok-3': {'endpoint': 'https://example.services.ai.azure.com/models/', 'model': 'grok-3'},
+    }, 4_000_000_000)
+    if (registry.fallback_chain('checker', 'grok-3') == ['grok-3', 'gpt-5'] and registry.fallback_chain('checker', 'gpt-5') == ['gpt-5', 'grok-3']
+            and registry.fallback_chain('generator', 'gpt-5') == ['gpt-5']):
+        print("✅ fallback chains passed")
+    else:
+        print(f"❌ fallback chains failed: {registry.fallback_chain('checker', 'grok-3')}")
+        failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
@@ -0,0 +1,50 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import llm_query
+from batch_checkpoint import BatchCheckpoint, unit_key
+from llm_query import run_question_pipeline
+
+print("=== Testing pipeline checkpoint resume ===")
+failures = 0
+
+
+class CheckerOnlyLimits:
+    """Stands in for ConcurrencyLimits: every call is an LLM3 check that accepts the question"""
+    def __init__(self):
+        self.stages = []
+
+    async def query(self, model_name, prompt, context, max_tokens, temperature, image_b64=None, response_format=None, stage='query'):
+        self.stages.append(stage)
+        await asyncio.sleep(0.01)
+        return "The question and answer are correct."
+
+
+llm_query.DUCKSAT_INTEGRATION_AVAILABLE = False
+parsed = {'content': 'Passage', 'question': 'Q?', 'options': {'A': '1', 'B': '2', 'C': '3', 'D': '4'},
+          'correct_answer': 'A', 'explanation': 'Because.', 'difficulty': 'Easy'}
+
+# Test 1: more resumed partials than the check queue holds (2 LLM3 workers -> maxsize 4)
+print("\n1. Testing resume of more partials than the queue size...")
+with tempfile.TemporaryDirectory() as tmp:
+    checkpoint = BatchCheckpoint(os.path.join(tmp, 'checkpoint.json'))
+    for index in range(10):
+        checkpoint.save_partial(unit_key('Writing', 'Punctuation', index), parsed)
+    limits = CheckerOnlyLimits()
+    try:
+        questions = asyncio.run(asyncio.wait_for(run_question_pipeline(
+            [('Writing', 'Punctuation', 10)], ['m1', 'm2', 'm3'], stage_workers=(1, 1, 2), limits=limits, checkpoint=checkpoint
+        ), timeout=10))
+    except asyncio.TimeoutError:
+        questions = None
+    if questions and len(questions[('Writing', 'Punctuation')]) == 10 and limits.stages == ['llm3'] * 10 and checkpoint.completed_count == 10:
+        print("✅ resume passed")
+    else:
+        print(f"❌ resume failed (hung or wrong result): {questions and len(questions[('Writing', 'Punctuation')])}")
+        failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
@@ -0,0 +1,47 @@
+import sys
+
+from question_schema import validate_question_json
+
+print("=== Testing LLM1 JSON question schema ===")
+failures = 0
+
+# Test 1: valid question inside a ```json fence
+print("\n1. Testing valid JSON question...")
+valid = """Here is the question:
+```json
+{"passage": "A circle has radius 5.", "question": "What is its area?",
+ "options": ["10", "25pi", "10pi", "5pi"], "correctAnswer": 1,
+ "explanation": "A = pi r^2", "difficulty": "easy", "tags": ["geometry"]}
+```"""
+data, errors = validate_question_json(valid)
+if data and not errors and data["correctAnswer"] == 1:
+    print("✅ valid question passed")
+else:
+    print(f"❌ valid question failed: {errors}")
+    failures += 1
+
+# Test 2: schema violations are reported
+print("\n2. Testing invalid JSON question...")
+invalid = '{"question": "", "options": ["a", "b"], "correctAnswer": 7, "difficulty": "impossible"}'
+data, errors = validate_question_json(invalid)
+expected = ['$.explanation: is required', '$.question: must not be empty',
+            '$.options: expected at least 4 items, got 2', '$.correctAnswer: must be <= 3',
+            "$.difficulty: must be one of ['easy', 'medium', 'hard']"]
+if data is None and all(e in errors for e in expected):
+    print("✅ invalid question passed")
+else:
+    print(f"❌ invalid question failed: {errors}")
+    failures += 1
+
+# Test 3: malformed JSON
+print("\n3. Testing malformed JSON...")
+data, errors = validate_question_json('{"question": "x", ')
+if data is None and errors and errors[0].startswith("Invalid JSON"):
+    print("✅ malformed JSON passed")
+else:
+    print(f"❌ malformed JSON failed: {errors}")
+    failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
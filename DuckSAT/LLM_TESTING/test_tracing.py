@@ -0,0 +1,108 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import tracing
+from tracing import configure_tracing, current_span, load_spans, span, start_span, traced, use_span
+
+print("=== Testing tracing spans ===")
+failures = 0
+
+
+@traced()
+def parse_step():
+    current_span().set_attribute('tokens', 42)
+
+
+@traced('query_llm')
+async def async_step():
+    current_span().set_attribute('model', 'gpt-5')
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'spans.jsonl')
+
+    # Test 1: disabled tracing hands out no-op spans and writes nothing
+    print("\n1. Testing disabled tracing...")
+    configure_tracing(None)
+    with span('question') as s:
+        parse_step()
+    if s is tracing.NOOP_SPAN and not os.path.exists(path):
+        print("✅ disabled tracing passed")
+    else:
+        print("❌ disabled tracing failed")
+        failures += 1
+
+    # Test 2: nesting, inherited attributes and async spans
+    print("\n2. Testing span export...")
+    configure_tracing(path)
+    with span('question', subtopic='Circles') as question:
+        question.inherit(cycle=2)
+        parse_step()
+        asyncio.run(async_step())
+    try:
+        with span('store'):
+            raise RuntimeError('db down')
+    except RuntimeError:
+        pass
+    configure_tracing(None)
+
+    spans = {s['name']: s for s in load_spans(path)}
+    root = spans.get('question', {})
+    child = spans.get('parse_step', {})
+    async_child = spans.get('query_llm', {})
+    if (len(spans) == 4 and child.get('parentSpanId') == root.get('spanId') and child.get('traceId') == root.get('traceId')
+            and child['attributes'] == {'cycle': 2, 'tokens': 42}
+            and async_child.get('parentSpanId') == root.get('spanId') and async_child['attributes'].get('model') == 'gpt-5'
+            and root['endTimeUnixNano'] >= child['endTimeUnixNano'] >= child['startTimeUnixNano'] >= root['startTimeUnixNano']):
+        print("✅ span export passed")
+    else:
+        print(f"❌ span export failed: {spans}")
+        failures += 1
+
+    if spans.get('store', {}).get('status', {}).get('code') == 'ERROR' and spans['store']['parentSpanId'] is None:
+        print("✅ error status passed")
+    else:
+        print(f"❌ error status failed: {spans.get('store')}")
+        failures += 1
+
+    # Test 3: spans started without being current, as the pipeline does
+    print("\n3. Testing start_span/use_span...")
+    path = os.path.join(tmp, 'pipeline.jsonl')
+    configure_tracing(path)
+    item_span = start_span('question', question_number=1)
+    with use_span(item_span):
+        parse_step()
+    if current_span() is tracing.NOOP_SPAN:
+        item_span.end()
+    configure_tracing(None)
+    spans = load_spans(path)
+    if [s['name'] for s in spans] == ['parse_step', 'question'] and spans[0]['parentSpanId'] == spans[1]['spanId']:
+        print("✅ start_span/use_span passed")
+    else:
+        print(f"❌ start_span/use_span failed: {spans}")
+        failures += 1
+
+    # Test 4: reconfiguring registers the atexit close only once
+    print("\n4. Testing repeated configure_tracing...")
+    registered = []
+    register = tracing.atexit.register
+    tracing.atexit.register = registered.append
+    tracing._atexit_registered = False
+    try:
+        for _ in range(3):
+            configure_tracing(path)
+    finally:
+        tracing.atexit.register = register
+    tracing._close_exporter()
+    configure_tracing(None)
+    if registered == [tracing._close_exporter]:
+        print("✅ repeated configure_tracing passed")
+    else:
+        print(f"❌ repeated configure_tracing failed: {len(registered)} atexit handlers")
+        failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
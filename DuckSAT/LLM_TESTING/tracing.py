@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import argparse
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Per-question tracing spans, exported to a local JSONL file
+#
+# Every generated question gets a 'question' span; the work done for it nests
+# underneath: query_llm calls (with model, stage, cycle and token counts),
+# parse_llm1 / parse_llm1_json, Vega renders and the database insert. Each
+# line of the export is one finished span with OTLP field names (traceId,
+# spanId, parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes,
+# status, links), so it can be replayed into any OTLP collector later.
+#
+# Tracing is off unless TRACE_EXPORT_PATH is set; spans are then no-ops.
+# Attributes set with span.inherit() (e.g. the cycle number) are copied onto
+# every child span. Questions are stored in batches on the writer thread, so
+# the insert span is not a child of the question but links to it.
+#
+#   TRACE_EXPORT_PATH=.traces/spans.jsonl python llm_query.py --batch
+#   python tracing.py .traces/spans.jsonl            # slowest questions
+#   python tracing.py .traces/spans.jsonl --trace ID # one question's timeline
+
+TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH')
+
+_current_span = contextvars.ContextVar('trace_span', default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None, links=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.inherited = dict(parent.inherited) if parent else {}
+        self.attributes = {**self.inherited, **(attributes or {})}
+        self.links = links or []
+        self.status = {'code': 'OK'}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def inherit(self, **attributes):
+        """Set attributes on this span and on every span started under it from now on"""
+        self.inherited.update(attributes)
+        self.attributes.update(attributes)
+
+    def record_exception(self, e):
+        self.status = {'code': 'ERROR', 'message': f"{type(e).__name__}: {e}"}
+
+    def context(self):
+        return {'traceId': self.trace_id, 'spanId': self.span_id}
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if _exporter is not None:
+                _exporter.export(self)
+
+    def to_dict(self):
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': self.attributes,
+            'status': self.status,
+            'links': self.links,
+        }
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def inherit(self, **attributes):
+        pass
+
+    def record_exception(self, e):
+        pass
+
+    def context(self):
+        return None
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlSpanExporter:
+    """Appends finished spans to a JSONL file, one per line"""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+_atexit_registered = False
+
+
+def configure_tracing(path):
+    """Export spans to path from now on (None turns tracing off)"""
+    global _exporter, _atexit_registered
+    with _exporter_lock:
+        if _exporter is not None:
+            _exporter.close()
+        _exporter = JsonlSpanExporter(path) if path else None
+        if _exporter is not None and not _atexit_registered:
+            atexit.register(_close_exporter)
+            _atexit_registered = True
+
+
+def _close_exporter():
+    """atexit hook; closes whichever exporter is configured at exit"""
+    exporter = _exporter
+    if exporter is not None:
+        exporter.close()
+
+
+def tracing_enabled():
+    return _exporter is not None
+
+
+def current_span():
+    """The active span, or a no-op span when there is none"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name, links=None, **attributes):
+    """Start a span under the current one without making it current; call end() on it"""
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, _current_span.get(), attributes, links)
+
+
+@contextmanager
+def use_span(span):
+    """Make an already started span current for the with-block (it is not ended)"""
+    if span is NOOP_SPAN:
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name, links=None, **attributes):
+    """Run the with-block in a new child span of the current one"""
+    if _exporter is None:
+        yield NOOP_SPAN
+        return
+    current = Span(name, _current_span.get(), attributes, links)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name=None):
+    """Decorator: run each call of the function (sync or async) in its own span"""
+    def decorate(fn):
+        span_name = name or fn.__name__
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return await fn(*args, **kwargs)
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+configure_tracing(TRACE_EXPORT_PATH)
+
+
+def load_spans(path):
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def print_timeline(spans):
+    """Indented timeline of one trace, offsets relative to its first span"""
+    start = min(s['startTimeUnixNano'] for s in spans)
+    children = {}
+    for s in spans:
+        children.setdefault(s['parentSpanId'], []).append(s)
+    span_ids = {s['spanId'] for s in spans}
+
+    def show(s, depth):
+        offset = (s['startTimeUnixNano'] - start) / 1e9
+        duration = (s['endTimeUnixNano'] - s['startTimeUnixNano']) / 1e9
+        attributes = ' '.join(f"{k}={v}" for k, v in s['attributes'].items() if k not in ('category', 'subtopic'))
+        status = ' ❌' if s['status'].get('code') == 'ERROR' else ''
+        print(f"{offset:8.2f}s {'  ' * depth}{s['name']} {duration:.2f}s {attributes}{status}")
+        for child in sorted(children.get(s['spanId'], []), key=lambda c: c['startTimeUnixNano']):
+            show(child, depth + 1)
+
+    roots = [s for s in spans if s['parentSpanId'] not in span_ids]
+    for root in sorted(roots, key=lambda s: s['startTimeUnixNano']):
+        show(root, 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a span export written with TRACE_EXPORT_PATH')
+    parser.add_argument('path', help='Span JSONL file')
+    parser.add_argument('--trace', help='Print the timeline of one trace ID')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest questions to list')
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    by_trace = {}
+    for s in spans:
+        by_trace.setdefault(s['traceId'], []).append(s)
+
+    if args.trace:
+        if args.trace not in by_trace:
+            print(f"Trace {args.trace} not found in {args.path}")
+            sys.exit(1)
+        # Batch inserts run in their own traces and link to the questions they stored
+        linked_traces = {s['traceId'] for s in spans if any(link.get('traceId') == args.trace for link in s.get('links', []))}
+        print_timeline(by_trace[args.trace] + [s for trace_id in linked_traces for s in by_trace[trace_id]])
+    else:
+        questions = [s for s in spans if s['name'] == 'question']
+        questions.sort(key=lambda s: s['endTimeUnixNano'] - s['startTimeUnixNano'], reverse=True)
+        print(f"{len(questions)} questions, {len(spans)} spans in {args.path}")
+        for s in questions[:args.top]:
+            duration = (s['endTimeUnixNano'] - s['startTimeUnixNano']) / 1e9
+            stages = {}
+            for child in by_trace[s['traceId']]:
+                if child['name'] == 'query_llm':
+                    stage = child['attributes'].get('stage', 'query')
+                    stages[stage] = stages.get(stage, 0) + (child['endTimeUnixNano'] - child['startTimeUnixNano']) / 1e9
+            breakdown = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in sorted(stages.items()))
+            print(f"{duration:8.1f}s {s['traceId']} {s['attributes'].get('subtopic', '')} #{s['attributes'].get('question_number', '')} "
+                  f"cycles={s['attributes'].get('cycles', 1)} ({breakdown})")
@@ -0,0 +1,284 @@
+import os
+import sys
+import atexit
+import queue
+import json
+import base64
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from functools import lru_cache
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from metrics import RENDER_SECONDS
+from tracing import traced, current_span
+
+# Vega -> PNG rendering on a pool of warm headless Chrome sessions
+#
+# Each session loads a blank page with the Vega runtime once. A render then
+# just runs a script on that page: it builds a headless vega.View, waits for
+# the runAsync() promise and returns view.toImageURL('png'). There is no new
+# browser per diagram and no fixed sleep; a render finishes as soon as Vega
+# does. Sessions that error out are discarded and replaced on the next render.
+#
+# Nothing is fetched over the network per render. The Vega runtime is served
+# from a local bundle (vendor/vega-<VEGA_VERSION>.min.js, or VEGA_BUNDLE_PATH),
+# downloaded once on first use or ahead of time with
+# `python vega_renderer.py --fetch-vega` for air-gapped workers. The version is
+# pinned so every node renders with the same runtime; bumping it fetches a new
+# file. vendor/ is git-ignored. The chromedriver path is resolved once per process from
+# CHROMEDRIVER_PATH, then PATH, then webdriver_manager as a last resort.
+#
+# Renders are cached by a hash of the canonicalized spec and output size: in
+# memory (small LRU of PNG bytes) and on disk, where render_vega_to_file names
+# images chart-<hash>.png so a repeat render is a file-exists check.
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('VEGA_RENDER_POOL_SIZE', '2'))
+RENDER_TIMEOUT = int(os.getenv('VEGA_RENDER_TIMEOUT', '30'))
+MEMORY_CACHE_SIZE = int(os.getenv('VEGA_RENDER_CACHE_SIZE', '128'))
+VEGA_VERSION = '5.30.0'
+VEGA_BUNDLE_URL = f"https://cdn.jsdelivr.net/npm/vega@{VEGA_VERSION}/build/vega.min.js"
+VEGA_BUNDLE_PATH = os.getenv('VEGA_BUNDLE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vendor', f'vega-{VEGA_VERSION}.min.js'))
+
+RENDER_SCRIPT = """
+const spec = arguments[0], width = arguments[1], height = arguments[2], scale = arguments[3];
+const done = arguments[arguments.length - 1];
+let view;
+try {
+  view = new vega.View(vega.parse(spec), {renderer: 'none'});
+  if (width) { view.width(width); }
+  if (height) { view.height(height); }
+} catch (e) {
+  done({error: String(e)});
+  return;
+}
+view.runAsync()
+  .then(v => v.toImageURL('png', scale))
+  .then(url => { view.finalize(); done({url: url}); })
+  .catch(e => { view.finalize(); done({error: String(e)}); });
+"""
+
+
+class VegaRenderError(Exception):
+    pass
+
+
+def _canonical(value):
+    """Normalize a spec so equivalent JSON hashes the same (1.0 == 1, key order ignored)"""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def spec_hash(spec, width=None, height=None, scale=1):
+    payload = json.dumps(
+        {'spec': _canonical(spec), 'width': width, 'height': height, 'scale': scale},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def fetch_vega_bundle(path=VEGA_BUNDLE_PATH, url=VEGA_BUNDLE_URL):
+    """Download the Vega runtime to the local bundle path"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with urllib.request.urlopen(url, timeout=60) as response, open(tmp_path, 'wb') as f:
+        shutil.copyfileobj(response, f)
+    os.replace(tmp_path, path)
+    logger.info(f"Vega bundle saved to {path}")
+    return path
+
+
+def ensure_vega_bundle(path=VEGA_BUNDLE_PATH):
+    """Path to the local Vega bundle, downloading it once if it isn't cached yet"""
+    if os.path.exists(path):
+        return path
+    if os.getenv('VEGA_OFFLINE'):
+        raise VegaRenderError(f"Vega bundle not found at {path}. Run `python vega_renderer.py --fetch-vega` on a connected machine and copy it over.")
+    return fetch_vega_bundle(path)
+
+
+@lru_cache(maxsize=None)
+def resolve_chromedriver_path():
+    """Locate chromedriver once per process"""
+    path = os.getenv('CHROMEDRIVER_PATH') or shutil.which('chromedriver')
+    if path:
+        return path
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+class VegaRenderer:
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = pool_size
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._memory_cache = OrderedDict()
+        self._driver_path = resolve_chromedriver_path()
+        self._bundle_path = ensure_vega_bundle()
+        self._page_dir = tempfile.mkdtemp(prefix='vega-render-')
+        self._page_path = os.path.join(self._page_dir, 'render.html')
+        with open(self._page_path, 'w') as f:
+            f.write(self._page_html())
+
+    def _page_html(self):
+        return f"""<!DOCTYPE html>
+<html>
+<head>
+<script src="file://{self._bundle_path}"></script>
+</head>
+<body></body>
+</html>"""
+
+    def _new_driver(self):
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        driver = webdriver.Chrome(service=Service(self._driver_path), options=options)
+        driver.set_script_timeout(RENDER_TIMEOUT)
+        driver.get(f'file://{self._page_path}')
+        if not driver.execute_script("return typeof vega !== 'undefined'"):
+            driver.quit()
+            raise VegaRenderError("Vega runtime failed to load in the render page")
+        return driver
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_driver()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=RENDER_TIMEOUT * 2)
+
+    def _release(self, driver, healthy=True):
+        if healthy and not self._closed:
+            self._idle.put(driver)
+            return
+        with self._lock:
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @traced('render')
+    def render_png(self, spec, width=None, height=None, scale=1, key=None):
+        """Render a Vega spec to PNG bytes; width/height override the spec's own size when given"""
+        if self._closed:
+            raise VegaRenderError("Renderer is closed")
+        key = key or spec_hash(spec, width, height, scale)
+        with self._lock:
+            png = self._memory_cache.get(key)
+            if png is not None:
+                self._memory_cache.move_to_end(key)
+                current_span().set_attribute('cache_hit', True)
+                return png
+
+        with RENDER_SECONDS.time():
+            png = self._render(spec, width, height, scale)
+        with self._lock:
+            self._memory_cache[key] = png
+            while len(self._memory_cache) > MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+        return png
+
+    def _render(self, spec, width, height, scale):
+        driver = self._acquire()
+        healthy = True
+        try:
+            result = driver.execute_async_script(RENDER_SCRIPT, spec, width, height, scale)
+        except WebDriverException as e:
+            healthy = False
+            raise VegaRenderError(f"Browser session failed: {e}")
+        finally:
+            self._release(driver, healthy)
+
+        if not result or 'error' in result:
+            raise VegaRenderError((result or {}).get('error', 'Empty render result'))
+        _, _, data = result['url'].partition(',')
+        return base64.b64decode(data)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        try:
+            os.remove(self._page_path)
+            os.rmdir(self._page_dir)
+        except OSError:
+            pass
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_vega_renderer():
+    """Process-wide renderer; browsers start lazily on the first render"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = VegaRenderer()
+                atexit.register(_renderer.close)
+    return _renderer
+
+
+def render_vega_to_file(spec, directory, width=None, height=None, scale=1):
+    """
+    Render into a content-addressed image store: returns the file name
+    chart-<hash>.png inside directory, rendering only if it isn't there yet.
+    """
+    key = spec_hash(spec, width, height, scale)
+    filename = f"chart-{key[:32]}.png"
+    path = os.path.join(directory, filename)
+    if os.path.exists(path):
+        return filename
+
+    png = get_vega_renderer().render_png(spec, width, height, scale, key=key)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+    return filename
+
+
+if __name__ == '__main__':
+    if '--fetch-vega' in sys.argv[1:]:
+        print(f"Vega bundle saved to {fetch_vega_bundle()}")
+    else:
+        print("Usage: python vega_renderer.py --fetch-vega")
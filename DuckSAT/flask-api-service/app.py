@@ -1,12 +1,19 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, url_for
 from logger import setup_logger
+from jobs import JobRunner, make_job_store
+from inventory import INVENTORY_REFILL, InventoryRefiller, RequestCoalescer, make_inventory_store
 import sys
 import os
+import json
+import queue
+import threading
 
 # Add LLM_TESTING to path to import functions
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'LLM_TESTING'))
+from metrics import REGISTRY as METRICS
 try:
-    from llm_query import generate_questions
+    from llm_query import generate_questions, validate_subtopic
+    from ducksat_integration import category_topic, get_subtopic_targets, normalize_subtopic
     LLM_QUERY_AVAILABLE = True
     print("Successfully imported generate_questions")
 except ImportError as e:
@@ -26,11 +33,65 @@ def welcome():
     logger.info(f"Request received: {request.method} {request.path}")
     return jsonify({'message': 'Welcome to the Flask API Service!'})
 
+def generation_params(data):
+    """Generation settings from a JSON payload or query string, with the endpoint defaults; ValueError if malformed"""
+    models = data.get('models', ['gpt-5', 'gpt-5', 'gpt-5'])  # Default models
+    if isinstance(models, str):
+        models = models.split(',')
+    num_questions = int(data.get('num_questions', 1))
+    if num_questions < 1:
+        raise ValueError('num_questions must be at least 1')
+    return {
+        'category': data.get('category', 'Math'),
+        'subtopic': data.get('subtopic', 'Linear Equations'),
+        'num_questions': num_questions,
+        'models': models,
+        'temperature': float(data.get('temperature', 0.7)),
+        'max_tokens': int(data.get('max_tokens', 16384)),
+        'max_cycles_per_question': int(data.get('max_cycles_per_question', 3)),
+        # k > 1 checks k candidates in parallel per question for a predictable tail latency
+        'speculative_candidates': int(data.get('speculative_candidates', 1)),
+    }
+
+def run_generation(params, on_question=None, on_event=None):
+    """Call the generation function; questions are returned once stored in the database"""
+    return generate_questions(**params, wait_for_storage=True, on_question=on_question, on_event=on_event)
+
+# Generation jobs run on an in-process worker pool (JOB_WORKERS) and are
+# tracked in the store selected by JOB_STORE_URL, see jobs.py
+job_runner = JobRunner(make_job_store(), run_generation)
+
+# Validated questions are served from a per-subtopic inventory (INVENTORY_STORE_URL)
+# and identical in-flight generations are shared, see inventory.py
+inventory = make_inventory_store()
+coalescer = RequestCoalescer()
+
+def generate_coalesced(params):
+    """run_generation, shared with any identical request already in flight (its callers get the same questions)"""
+    return coalescer.run(json.dumps(params, sort_keys=True), lambda: run_generation(params))
+
+def refill_generation(category, subtopic, count):
+    result = run_generation(generation_params({'category': category, 'subtopic': subtopic, 'num_questions': count}))
+    return result.get('questions', [])
+
+def inventory_targets():
+    targets = get_subtopic_targets()
+    return lambda category, subtopic: targets.get((category_topic(category)[1], normalize_subtopic(subtopic)))
+
+if LLM_QUERY_AVAILABLE and INVENTORY_REFILL:
+    inventory_refiller = InventoryRefiller(inventory, refill_generation, inventory_targets)
+    inventory_refiller.start()
+
 @app.route('/generate-questions', methods=['POST'])
 def generate_questions_endpoint():
     """
     Generate SAT questions and store in database
     Expects JSON payload with: category, subtopic, num_questions, etc.
+    Questions come from the pre-generated inventory when it has them ('fresh':
+    true skips it, e.g. to use specific models); only the shortfall is
+    generated, synchronously. Identical requests arriving while that shortfall
+    is being generated share the generation, so those callers get the same
+    generated questions. Prefer POST /jobs for more than a few questions.
     """
     if not LLM_QUERY_AVAILABLE:
         return jsonify({'error': 'Question generation service not available'}), 503
@@ -40,39 +101,173 @@ def generate_questions_endpoint():
         if not data:
             return jsonify({'error': 'No JSON payload provided'}), 400
 
-        category = data.get('category', 'Math')
-        subtopic = data.get('subtopic', 'Linear Equations')
-        num_questions = data.get('num_questions', 1)
-        models = data.get('models', ['gpt-5', 'gpt-5', 'gpt-5'])  # Default models
-        temperature = data.get('temperature', 0.7)
-        max_tokens = data.get('max_tokens', 16384)
-        max_cycles_per_question = data.get('max_cycles_per_question', 3)
+        try:
+            params = generation_params(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid parameters: {e}'}), 400
+        category, subtopic = params['category'], params['subtopic']
+        error = validate_subtopic(category, subtopic)
+        if error:
+            return jsonify({'error': error}), 400
+        # Only valid subtopics are tracked; the refiller generates for every tracked one
+        inventory.track(category, subtopic)
+
+        questions = []
+        if not data.get('fresh'):
+            questions = inventory.take(category, subtopic, params['num_questions'])
+        if len(questions) == params['num_questions']:
+            logger.info(f"Served {len(questions)} questions for {category} - {subtopic} from inventory")
+            return jsonify({
+                'success': True,
+                'message': f'Served {len(questions)} questions from inventory',
+                'questions': questions,
+                'source': 'inventory'
+            })
 
-        logger.info(f"Generating {num_questions} questions for {category} - {subtopic}")
+        remaining = dict(params, num_questions=params['num_questions'] - len(questions))
+        logger.info(f"Generating {remaining['num_questions']} questions for {category} - {subtopic} ({len(questions)} from inventory)")
 
         # Call the generation function
-        result = generate_questions(
-            category=category,
-            subtopic=subtopic,
-            num_questions=num_questions,
-            models=models,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            max_cycles_per_question=max_cycles_per_question
-        )
+        try:
+            result = generate_coalesced(remaining)
+        except Exception:
+            # Give the inventory questions back instead of dropping them
+            inventory.put(category, subtopic, questions)
+            raise
 
         if result and 'questions' in result:
-            return jsonify({
+            response = {
                 'success': True,
                 'message': f'Generated {len(result["questions"])} questions',
-                'questions': result['questions']
-            })
+                'questions': questions + result['questions'],
+                'source': 'mixed' if questions else 'generated'
+            }
+            if 'speculation' in result:
+                response['speculation'] = result['speculation']
+            return jsonify(response)
         else:
+            inventory.put(category, subtopic, questions)
             return jsonify({'error': 'Failed to generate questions'}), 500
 
     except Exception as e:
         logger.error(f"Error generating questions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+SSE_HEARTBEAT_SECONDS = 15
+
+def sse_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/generate-questions/stream', methods=['GET', 'POST'])
+def stream_questions_endpoint():
+    """
+    Server-Sent Events version of /generate-questions: parameters come as JSON
+    (POST) or query string (GET, for EventSource). Emits 'started', then per
+    question 'llm1_done', 'spec_done', 'check_done' and 'question_stored' (with
+    the stored question) or 'question_failed', and finally 'done' or 'error'.
+    Generation runs on its own thread; if the client disconnects it still
+    finishes and stores its questions.
+    """
+    if not LLM_QUERY_AVAILABLE:
+        return jsonify({'error': 'Question generation service not available'}), 503
+
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args.to_dict()
+    if not data:
+        return jsonify({'error': 'No parameters provided'}), 400
+    try:
+        params = generation_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameters: {e}'}), 400
+    # Stage events come from the sequential engine
+    params['speculative_candidates'] = 1
+    logger.info(f"Streaming {params['num_questions']} questions for {params['category']} - {params['subtopic']}")
+
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = run_generation(params, on_event=lambda name, event: events.put((name, event)))
+            if 'error' in result:
+                events.put(('error', {'error': result['error']}))
+            else:
+                events.put(('done', {'generated': len(result['questions'])}))
+        except Exception as e:
+            logger.error(f"Error streaming questions: {str(e)}")
+            events.put(('error', {'error': str(e)}))
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, name='question-stream', daemon=True).start()
+
+    def stream():
+        yield sse_event('started', params)
+        while True:
+            try:
+                item = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is None:
+                break
+            yield sse_event(*item)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue a generation job and return its id right away (202).
+    Takes the same JSON payload as /generate-questions; poll GET /jobs/<id>.
+    """
+    if not LLM_QUERY_AVAILABLE:
+        return jsonify({'error': 'Question generation service not available'}), 503
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No JSON payload provided'}), 400
+
+    try:
+        params = generation_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid parameters: {e}'}), 400
+    # Reject a bad category/subtopic now rather than as a failed job later
+    error = validate_subtopic(params['category'], params['subtopic'])
+    if error:
+        return jsonify({'error': error}), 400
+
+    job = job_runner.submit(params)
+    logger.info(f"Queued job {job['id']}: {params['num_questions']} questions for {params['category']} - {params['subtopic']}")
+    status_url = url_for('get_job', job_id=job['id'])
+    return jsonify({'job_id': job['id'], 'status': job['status'], 'status_url': status_url}), 202, {'Location': status_url}
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: LLM latency per model/stage, tokens, retries, render and DB time (see LLM_TESTING/metrics.py)"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/inventory', methods=['GET'])
+def inventory_status():
+    """Questions in stock per tracked subtopic"""
+    return jsonify({
+        'refill': INVENTORY_REFILL,
+        'coalesced_requests': coalescer.coalesced,
+        'subtopics': [
+            {'category': category, 'subtopic': subtopic, 'available': inventory.count(category, subtopic)}
+            for category, subtopic in inventory.subtopics()
+        ]
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status plus the questions accepted so far"""
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
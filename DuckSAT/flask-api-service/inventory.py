@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# Pre-generated question inventory for the API
+#
+# Most /generate-questions calls ask for the same handful of subtopics, and
+# each one used to pay for a full LLM1 -> LLM2 -> LLM3 run. The inventory keeps
+# a queue of already validated and stored questions per (category, subtopic);
+# requests are served from it first and only the shortfall is generated.
+# Served questions leave the inventory, so no two callers get the same one
+# from it (generated questions are another matter, see RequestCoalescer below).
+#
+# An InventoryRefiller thread (INVENTORY_REFILL=on) tops every requested
+# subtopic back up towards its "targetQuestions" in the subtopics table, capped
+# at INVENTORY_MAX_PER_SUBTOPIC, generating at most INVENTORY_REFILL_BATCH
+# questions per subtopic per pass. The store is picked by INVENTORY_STORE_URL
+# (memory://, sqlite:///path or redis://..., like JOB_STORE_URL in jobs.py).
+#
+# Identical generation requests that arrive while one is running are
+# coalesced by RequestCoalescer: they wait for and share its result, so those
+# callers receive the same freshly generated questions (same question IDs).
+# That is the price of generating them once instead of once per caller.
+
+logger = logging.getLogger('flask-api-service')
+
+INVENTORY_REFILL = os.getenv('INVENTORY_REFILL', 'off').lower() in ('1', 'on', 'true', 'yes')
+INVENTORY_REFILL_INTERVAL = float(os.getenv('INVENTORY_REFILL_INTERVAL', '300'))
+INVENTORY_REFILL_BATCH = int(os.getenv('INVENTORY_REFILL_BATCH', '5'))
+INVENTORY_MAX_PER_SUBTOPIC = int(os.getenv('INVENTORY_MAX_PER_SUBTOPIC', '20'))
+
+
+def inventory_key(category, subtopic):
+    return f"{category}|{subtopic}"
+
+
+class MemoryInventory:
+    def __init__(self):
+        self._questions = {}
+        self._subtopics = {}
+        self._lock = threading.Lock()
+
+    def track(self, category, subtopic):
+        """Remember a subtopic so the refiller keeps it stocked"""
+        with self._lock:
+            self._subtopics.setdefault(inventory_key(category, subtopic), (category, subtopic))
+
+    def subtopics(self):
+        with self._lock:
+            return list(self._subtopics.values())
+
+    def put(self, category, subtopic, questions):
+        with self._lock:
+            self._subtopics.setdefault(inventory_key(category, subtopic), (category, subtopic))
+            self._questions.setdefault(inventory_key(category, subtopic), []).extend(json.loads(json.dumps(questions)))
+
+    def take(self, category, subtopic, count):
+        """Remove and return up to count questions, oldest first"""
+        with self._lock:
+            questions = self._questions.get(inventory_key(category, subtopic), [])
+            taken, questions[:] = questions[:count], questions[count:]
+            return taken
+
+    def count(self, category, subtopic):
+        with self._lock:
+            return len(self._questions.get(inventory_key(category, subtopic), []))
+
+
+class SQLiteInventory:
+    """Inventory in a local SQLite file, shared by the API processes on one host"""
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS inventory (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, data TEXT NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS inventory_key ON inventory (key, seq)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS inventory_subtopics (key TEXT PRIMARY KEY, category TEXT NOT NULL, subtopic TEXT NOT NULL)')
+        self._lock = threading.Lock()
+
+    def track(self, category, subtopic):
+        with self._lock:
+            self._conn.execute('INSERT OR IGNORE INTO inventory_subtopics (key, category, subtopic) VALUES (?, ?, ?)',
+                               (inventory_key(category, subtopic), category, subtopic))
+
+    def subtopics(self):
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute('SELECT category, subtopic FROM inventory_subtopics ORDER BY key')]
+
+    def put(self, category, subtopic, questions):
+        key = inventory_key(category, subtopic)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('INSERT OR IGNORE INTO inventory_subtopics (key, category, subtopic) VALUES (?, ?, ?)', (key, category, subtopic))
+                self._conn.executemany('INSERT INTO inventory (key, data) VALUES (?, ?)', [(key, json.dumps(question)) for question in questions])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def take(self, category, subtopic, count):
+        key = inventory_key(category, subtopic)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute('SELECT seq, data FROM inventory WHERE key = ? ORDER BY seq LIMIT ?', (key, count)).fetchall()
+                self._conn.executemany('DELETE FROM inventory WHERE seq = ?', [(seq,) for seq, _ in rows])
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [json.loads(data) for _, data in rows]
+
+    def count(self, category, subtopic):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM inventory WHERE key = ?', (inventory_key(category, subtopic),)).fetchone()[0]
+
+
+class RedisInventory:
+    """Inventory in Redis: a list per subtopic plus a hash of tracked subtopics, shared by every API node"""
+    def __init__(self, url, prefix='ducksat:inventory:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def track(self, category, subtopic):
+        self._redis.hsetnx(f"{self._prefix}subtopics", inventory_key(category, subtopic), json.dumps([category, subtopic]))
+
+    def subtopics(self):
+        return [tuple(json.loads(value)) for value in self._redis.hgetall(f"{self._prefix}subtopics").values()]
+
+    def put(self, category, subtopic, questions):
+        self.track(category, subtopic)
+        if questions:
+            self._redis.rpush(self._prefix + inventory_key(category, subtopic), *[json.dumps(question) for question in questions])
+
+    def take(self, category, subtopic, count):
+        # LRANGE + LTRIM in one MULTI so concurrent takers never get the same question
+        key = self._prefix + inventory_key(category, subtopic)
+        pipe = self._redis.pipeline()
+        pipe.lrange(key, 0, count - 1)
+        pipe.ltrim(key, count, -1)
+        taken, _ = pipe.execute()
+        return [json.loads(question) for question in taken]
+
+    def count(self, category, subtopic):
+        return self._redis.llen(self._prefix + inventory_key(category, subtopic))
+
+
+def make_inventory_store(url=None):
+    """Inventory for INVENTORY_STORE_URL (memory://, sqlite:///path or redis://...)"""
+    url = url or os.getenv('INVENTORY_STORE_URL', 'memory://')
+    if url.startswith('memory://'):
+        return MemoryInventory()
+    if url.startswith('sqlite:///'):
+        return SQLiteInventory(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisInventory(url)
+    raise ValueError(f"Unsupported INVENTORY_STORE_URL: {url}")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """Single-flight: concurrent run() calls with the same key share one execution of fn (and get the same result)"""
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            if call.waiters:
+                logger.info(f"Shared one generation between {call.waiters + 1} identical requests")
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class InventoryRefiller:
+    """
+    Background thread that keeps tracked subtopics stocked. generate(category,
+    subtopic, n) must return stored questions; load_targets() returns a function
+    (category, subtopic) -> targetQuestions or None.
+    """
+    def __init__(self, store, generate, load_targets, interval=INVENTORY_REFILL_INTERVAL,
+                 batch_size=INVENTORY_REFILL_BATCH, max_per_subtopic=INVENTORY_MAX_PER_SUBTOPIC):
+        self.store = store
+        self.generate = generate
+        self.load_targets = load_targets
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_per_subtopic = max_per_subtopic
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refill_once(self):
+        """One pass over the tracked subtopics; returns the number of questions added"""
+        target_for = self.load_targets()
+        added = 0
+        for category, subtopic in self.store.subtopics():
+            if self._stop.is_set():
+                break
+            target = min(target_for(category, subtopic) or self.max_per_subtopic, self.max_per_subtopic)
+            missing = target - self.store.count(category, subtopic)
+            if missing <= 0:
+                continue
+            started = time.time()
+            try:
+                questions = self.generate(category, subtopic, min(missing, self.batch_size))
+            except Exception as e:
+                logger.error(f"Inventory refill for {category} - {subtopic} failed: {e}")
+                continue
+            questions = [question for question in questions if question.get('question_id')]
+            self.store.put(category, subtopic, questions)
+            added += len(questions)
+            logger.info(f"Inventory refill: +{len(questions)} {category} - {subtopic} in {time.time() - started:.0f}s")
+        return added
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill_once()
+            except Exception as e:
+                logger.error(f"Inventory refill pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='inventory-refill', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
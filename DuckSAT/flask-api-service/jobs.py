@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background generation jobs for the API
+#
+# POST /jobs hands the request to a JobRunner, which runs generate_questions on
+# an in-process thread pool and records progress in a job store; GET /jobs/<id>
+# reads it back. A job is a JSON document:
+#
+#   {id, status: queued|running|succeeded|failed, params, questions: [...],
+#    error, created_at, started_at, finished_at}
+#
+# Questions are appended as they are accepted, so polling shows partial
+# results. The store is picked by JOB_STORE_URL:
+#
+#   memory://                   default, per process
+#   sqlite:///path/to/jobs.db   survives restarts, shared by processes on one host
+#   redis://host:6379/0         shared by every API node (needs the redis package)
+#
+# Every store forgets a job JOB_TTL_SECONDS after its last update.
+
+logger = logging.getLogger('flask-api-service')
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+def new_job(params):
+    return {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'params': params,
+        'questions': [],
+        'error': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+    }
+
+
+class MemoryJobStore:
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        # Least recently updated first, so expired jobs are evicted from the front
+        self._jobs = OrderedDict()
+        self._updated = {}
+        self._ttl = ttl
+        self._lock = threading.Lock()
+
+    def _evict_expired(self):
+        cutoff = time.time() - self._ttl
+        while self._jobs:
+            job_id = next(iter(self._jobs))
+            if self._updated[job_id] >= cutoff:
+                break
+            del self._jobs[job_id]
+            del self._updated[job_id]
+
+    def _touch(self, job_id):
+        self._jobs.move_to_end(job_id)
+        self._updated[job_id] = time.time()
+
+    def create(self, job):
+        with self._lock:
+            self._evict_expired()
+            self._jobs[job['id']] = json.loads(json.dumps(job))
+            self._touch(job['id'])
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(json.loads(json.dumps(fields)))
+            self._touch(job_id)
+
+    def append_question(self, job_id, question):
+        with self._lock:
+            self._jobs[job_id]['questions'].append(json.loads(json.dumps(question)))
+            self._touch(job_id)
+
+
+class SQLiteJobStore:
+    """Jobs as JSON documents in a local SQLite table"""
+    def __init__(self, path, ttl=JOB_TTL_SECONDS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)')
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE updated_at < ?', (now - self._ttl,))
+            self._conn.execute('INSERT INTO jobs (id, data, updated_at) VALUES (?, ?, ?)', (job['id'], json.dumps(job), now))
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM jobs WHERE id = ? AND updated_at >= ?', (job_id, time.time() - self._ttl)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, job_id, change):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT data FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                job = json.loads(row[0])
+                change(job)
+                self._conn.execute('UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?', (json.dumps(job), time.time(), job_id))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def update(self, job_id, **fields):
+        self._modify(job_id, lambda job: job.update(fields))
+
+    def append_question(self, job_id, question):
+        self._modify(job_id, lambda job: job['questions'].append(question))
+
+
+class RedisJobStore:
+    """
+    Jobs in Redis (or anything speaking its protocol): the job document is a
+    hash field and questions are a list, so appends are a single RPUSH.
+    """
+    def __init__(self, url, prefix='ducksat:job:', ttl=JOB_TTL_SECONDS):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._ttl = ttl
+
+    def _keys(self, job_id):
+        return f"{self._prefix}{job_id}", f"{self._prefix}{job_id}:questions"
+
+    def create(self, job):
+        key, questions_key = self._keys(job['id'])
+        fields = {name: json.dumps(value) for name, value in job.items() if name != 'questions'}
+        pipe = self._redis.pipeline()
+        pipe.hset(key, mapping=fields)
+        pipe.delete(questions_key)
+        pipe.expire(key, self._ttl)
+        pipe.execute()
+
+    def get(self, job_id):
+        key, questions_key = self._keys(job_id)
+        pipe = self._redis.pipeline()
+        pipe.hgetall(key)
+        pipe.lrange(questions_key, 0, -1)
+        fields, questions = pipe.execute()
+        if not fields:
+            return None
+        job = {name.decode(): json.loads(value) for name, value in fields.items()}
+        job['questions'] = [json.loads(question) for question in questions]
+        return job
+
+    def update(self, job_id, **fields):
+        key, _ = self._keys(job_id)
+        if 'questions' in fields:
+            self._replace_questions(job_id, fields.pop('questions'))
+        if fields:
+            pipe = self._redis.pipeline()
+            pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+            pipe.expire(key, self._ttl)
+            pipe.execute()
+
+    def _replace_questions(self, job_id, questions):
+        _, questions_key = self._keys(job_id)
+        pipe = self._redis.pipeline()
+        pipe.delete(questions_key)
+        if questions:
+            pipe.rpush(questions_key, *[json.dumps(question) for question in questions])
+        pipe.expire(questions_key, self._ttl)
+        pipe.execute()
+
+    def append_question(self, job_id, question):
+        _, questions_key = self._keys(job_id)
+        pipe = self._redis.pipeline()
+        pipe.rpush(questions_key, json.dumps(question))
+        pipe.expire(questions_key, self._ttl)
+        pipe.execute()
+
+
+def make_job_store(url=None):
+    """Job store for JOB_STORE_URL (memory://, sqlite:///path or redis://...)"""
+    url = url or os.getenv('JOB_STORE_URL', 'memory://')
+    if url.startswith('memory://'):
+        return MemoryJobStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteJobStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisJobStore(url)
+    raise ValueError(f"Unsupported JOB_STORE_URL: {url}")
+
+
+class JobRunner:
+    """Runs jobs on a thread pool: run_job(params, on_question) must return generate_questions' result dict"""
+    def __init__(self, store, run_job, max_workers=JOB_WORKERS):
+        self.store = store
+        self.run_job = run_job
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation-job')
+
+    def submit(self, params):
+        job = new_job(params)
+        self.store.create(job)
+        self._executor.submit(self._run, job['id'], params)
+        return job
+
+    def _run(self, job_id, params):
+        self.store.update(job_id, status='running', started_at=time.time())
+        try:
+            result = self.run_job(params, lambda question: self.store.append_question(job_id, question))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, status='failed', error=str(e), finished_at=time.time())
+            return
+
+        if 'error' in result:
+            self.store.update(job_id, status='failed', error=result['error'], finished_at=time.time())
+            return
+        # Final questions replace the partial ones: by now they carry their database IDs
+        fields = {'status': 'succeeded', 'questions': result.get('questions', []), 'finished_at': time.time()}
+        if 'speculation' in result:
+            fields['speculation'] = result['speculation']
+        self.store.update(job_id, **fields)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+
+from inventory import InventoryRefiller, MemoryInventory, RequestCoalescer, SQLiteInventory
+
+print("=== Testing question inventory and request coalescing ===")
+failures = 0
+
+with tempfile.TemporaryDirectory() as tmp:
+    for name, store in [('memory', MemoryInventory()), ('sqlite', SQLiteInventory(os.path.join(tmp, 'inventory.db')))]:
+        print(f"\nTesting {name} inventory...")
+        store.put('Math', 'Circles', [{'question': f'Q{i}', 'question_id': f'id{i}'} for i in range(3)])
+        first = store.take('Math', 'Circles', 2)
+        rest = store.take('Math', 'Circles', 2)
+        if [q['question_id'] for q in first] == ['id0', 'id1'] and [q['question_id'] for q in rest] == ['id2'] and store.count('Math', 'Circles') == 0:
+            print(f"✅ {name}: take in order passed")
+        else:
+            print(f"❌ {name}: take in order failed: {first} {rest}")
+            failures += 1
+
+        store.track('Reading', 'Inference')
+        if sorted(store.subtopics()) == [('Math', 'Circles'), ('Reading', 'Inference')]:
+            print(f"✅ {name}: tracked subtopics passed")
+        else:
+            print(f"❌ {name}: tracked subtopics failed: {store.subtopics()}")
+            failures += 1
+
+        generated = []
+
+        def fake_generate(category, subtopic, count):
+            generated.append((category, subtopic, count))
+            return [{'question': f'{subtopic} {i}', 'question_id': f'{subtopic}{i}'} for i in range(count)]
+
+        targets = {('Math', 'Circles'): 4}
+        refiller = InventoryRefiller(store, fake_generate, lambda: lambda category, subtopic: targets.get((category, subtopic)),
+                                     batch_size=3, max_per_subtopic=5)
+        refiller.refill_once()
+        refiller.refill_once()
+        if store.count('Math', 'Circles') == 4 and store.count('Reading', 'Inference') == 5 and \
+                generated == [('Math', 'Circles', 3), ('Reading', 'Inference', 3), ('Math', 'Circles', 1), ('Reading', 'Inference', 2)]:
+            print(f"✅ {name}: refill towards target passed")
+        else:
+            print(f"❌ {name}: refill towards target failed: {generated}")
+            failures += 1
+
+print("\nTesting request coalescing...")
+coalescer = RequestCoalescer()
+calls = []
+release = threading.Event()
+
+
+def slow_generation():
+    calls.append(1)
+    release.wait(5)
+    return {'questions': ['Q']}
+
+
+results = []
+threads = [threading.Thread(target=lambda: results.append(coalescer.run('same', slow_generation))) for _ in range(5)]
+for thread in threads:
+    thread.start()
+deadline = time.time() + 5
+while coalescer.coalesced < 4 and time.time() < deadline:
+    time.sleep(0.01)
+release.set()
+for thread in threads:
+    thread.join()
+if len(calls) == 1 and len(results) == 5 and all(result == {'questions': ['Q']} for result in results):
+    print("✅ Identical requests share one generation passed")
+else:
+    print(f"❌ Identical requests share one generation failed: {len(calls)} calls, {results}")
+    failures += 1
+
+try:
+    coalescer.run('boom', lambda: 1 / 0)
+    print("❌ Errors reach the caller failed")
+    failures += 1
+except ZeroDivisionError:
+    print("✅ Errors reach the caller passed")
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)
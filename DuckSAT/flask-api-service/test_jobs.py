@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import tempfile
+
+from jobs import JobRunner, MemoryJobStore, SQLiteJobStore
+
+print("=== Testing generation job stores and runner ===")
+failures = 0
+
+
+def fake_generation(params, on_question):
+    if params.get('fail'):
+        raise RuntimeError('boom')
+    for i in range(params['num_questions']):
+        on_question({'question': f'Q{i}'})
+    return {'questions': [{'question': f'Q{i}', 'question_id': f'id{i}'} for i in range(params['num_questions'])]}
+
+
+def wait_for(store, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.01)
+    return store.get(job_id)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    for name, store in [('memory', MemoryJobStore()), ('sqlite', SQLiteJobStore(os.path.join(tmp, 'jobs.db')))]:
+        print(f"\nTesting {name} store...")
+        runner = JobRunner(store, fake_generation, max_workers=2)
+
+        job = runner.submit({'num_questions': 3})
+        done = wait_for(store, job['id'])
+        if done['status'] == 'succeeded' and [q.get('question_id') for q in done['questions']] == ['id0', 'id1', 'id2']:
+            print(f"✅ {name}: successful job passed")
+        else:
+            print(f"❌ {name}: successful job failed: {done}")
+            failures += 1
+
+        job = runner.submit({'num_questions': 1, 'fail': True})
+        done = wait_for(store, job['id'])
+        if done['status'] == 'failed' and done['error'] == 'boom':
+            print(f"✅ {name}: failed job passed")
+        else:
+            print(f"❌ {name}: failed job failed: {done}")
+            failures += 1
+
+        if store.get('missing') is None:
+            print(f"✅ {name}: unknown job passed")
+        else:
+            print(f"❌ {name}: unknown job failed")
+            failures += 1
+        runner.shutdown()
+
+    # Finished jobs are forgotten JOB_TTL_SECONDS after their last update
+    for name, store in [('memory', MemoryJobStore(ttl=0.2)), ('sqlite', SQLiteJobStore(os.path.join(tmp, 'ttl.db'), ttl=0.2))]:
+        print(f"\nTesting {name} store TTL...")
+        store.create({'id': 'old', 'questions': []})
+        time.sleep(0.3)
+        store.create({'id': 'new', 'questions': []})
+        kept = store.get('new') is not None and store.get('old') is None
+        if name == 'sqlite':
+            kept = kept and store._conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 1
+        else:
+            kept = kept and list(store._jobs) == ['new']
+        if kept:
+            print(f"✅ {name}: TTL eviction passed")
+        else:
+            print(f"❌ {name}: TTL eviction failed")
+            failures += 1
+
+print("\n=== All tests completed ===")
+if failures:
+    sys.exit(1)